@@ -0,0 +1,80 @@
+"""Polls a large fleet with FleetPoller against a local stand-in server.
+
+The stand-in runs in its own process, so the poller has one core for
+itself. Run from the repository root:
+    python -m benchmarks.bench_fleet [devices] [concurrency]
+"""
+import asyncio
+import multiprocessing
+import socket
+import sys
+import time
+
+from oekoboilerapi.aylaservice import AylaService, ConnectionSettings
+from oekoboilerapi.fleet import FleetPoller
+from tests import utils
+from tests.mock_server import serve
+
+POLL_INTERVAL = 60
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_server(port: int):
+    for _ in range(100):
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.05)
+    raise RuntimeError("stand-in server did not start")
+
+
+async def main(devices: int, concurrency: int):
+    port = free_port()
+    server = multiprocessing.Process(target=serve, args=(port,), daemon=True)
+    server.start()
+    try:
+        await wait_for_server(port)
+        host = f"http://127.0.0.1:{port}"
+        async with AylaService(
+            utils.mocked_credentials(),
+            connection=ConnectionSettings(limit_per_host=concurrency),
+            host=host,
+            ads_host=f"{host}/apiv1",
+        ) as service:
+            poller = FleetPoller(
+                service,
+                [f"DSN{i:05}" for i in range(devices)],
+                concurrency=concurrency,
+            )
+            start = time.perf_counter()
+            cpu_start = time.process_time()
+            failed = 0
+            async for result in poller.poll():
+                failed += not result.ok
+            duration = time.perf_counter() - start
+            cpu = time.process_time() - cpu_start
+    finally:
+        server.terminate()
+        server.join()
+
+    print(
+        f"{devices} devices, concurrency {concurrency}: {duration:.2f}s "
+        f"wall, {cpu:.2f}s client CPU, {devices / duration:.0f} devices/s, "
+        f"{failed} failed (poll interval {POLL_INTERVAL}s)"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(
+        main(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 5000,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 64,
+        )
+    )
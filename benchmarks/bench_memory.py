@@ -0,0 +1,81 @@
+"""Memory per device of parsed properties for a large fleet.
+
+Compares the former plain dataclass (raw values, per-instance __dict__)
+with the slotted AylaProperty. Run from the repository root:
+    python -m benchmarks.bench_memory [devices]
+"""
+import gc
+import json
+import sys
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from oekoboilerapi.aylaservice import AylaService
+from tests import utils
+
+
+@dataclass
+class LegacyAylaProperty:
+    """AylaProperty as it was before slots and decoding"""
+
+    name: str
+    value: str
+    key: str
+    data_updated_at: datetime
+
+
+def legacy_process_properties(data: list) -> list:
+    """process_properties as it was before slots and decoding"""
+    props = []
+    for prop in data:
+        date: datetime = None
+        try:
+            date = datetime.strptime(
+                f"{prop['property']['data_updated_at']}",
+                "%Y-%m-%dT%H:%M:%SZ",
+            ).replace(tzinfo=timezone.utc)
+        except ValueError:
+            pass
+        props.append(
+            LegacyAylaProperty(
+                name=prop["property"]["name"],
+                key=prop["property"]["key"],
+                data_updated_at=date,
+                value=prop["property"]["value"],
+            )
+        )
+    return props
+
+
+def measure(process, devices: int) -> int:
+    """bytes retained by the parsed properties of all devices"""
+    body = json.dumps(utils.mocked_water_heater_properties(22, 60, 4, 1))
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    fleet = []
+    for _ in range(devices):
+        # every device answer is decoded separately, like in a real poll
+        fleet.append(process(json.loads(body)))
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return retained
+
+
+def main(devices: int):
+    service = AylaService(utils.mocked_credentials())
+    for name, process in (
+        ("before", legacy_process_properties),
+        ("after", service.process_properties),
+    ):
+        retained = measure(process, devices)
+        print(
+            f"{name:>6}: {retained / 2**20:8.1f} MiB for {devices} devices, "
+            f"{retained / devices:8.0f} bytes per device"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
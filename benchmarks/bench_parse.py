@@ -0,0 +1,36 @@
+"""CPU time of process_properties for a fleet sized batch of answers.
+
+Compares the former strptime based parsing with the current one on the
+mocked_water_heater_properties payload. Run from the repository root:
+    python -m benchmarks.bench_parse [devices]
+"""
+import json
+import sys
+import time
+
+from benchmarks.bench_memory import legacy_process_properties
+from oekoboilerapi.aylaservice import AylaService
+from tests import utils
+
+
+def main(devices: int):
+    body = json.dumps(utils.mocked_water_heater_properties(22, 60, 4, 1))
+    answers = [json.loads(body) for _ in range(devices)]
+    service = AylaService(utils.mocked_credentials())
+
+    for name, process in (
+        ("strptime", legacy_process_properties),
+        ("current", service.process_properties),
+    ):
+        start = time.process_time()
+        for answer in answers:
+            process(answer)
+        duration = time.process_time() - start
+        print(
+            f"{name:>8}: {duration:.3f}s CPU for {devices} devices, "
+            f"{duration / devices * 1e6:.1f}us per device"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -0,0 +1,86 @@
+"""Requests of fixed versus adaptive polling for a simulated fleet.
+
+A share of the devices changes every minute (heating), the others every
+two hours (idle). Both strategies are simulated over the same changes on a
+virtual clock, staleness is the time from a change until a poll sees it.
+Run from the repository root:
+    python -m benchmarks.bench_polling [devices] [hours]
+"""
+import heapq
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+
+from oekoboilerapi.scheduler import AdaptiveInterval
+
+FIXED_INTERVAL = 5.0
+ACTIVE_SHARE = 0.1
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def change_times(period: float, duration: float) -> list[float]:
+    """jittered times a device changes at"""
+    times, now = [], random.uniform(0, period)
+    while now < duration:
+        times.append(now)
+        now += random.uniform(0.5, 1.5) * period
+    return times
+
+
+def simulate(changes: list[list[float]], duration: float, adaptive: bool):
+    """returns the number of polls and the worst staleness"""
+
+    polls = 0
+    staleness = 0.0
+    queue = [(0.0, dsn) for dsn in range(len(changes))]
+    intervals = [AdaptiveInterval() for _ in changes]
+    seen = [0] * len(changes)
+
+    while queue:
+        now, dsn = heapq.heappop(queue)
+        if now >= duration:
+            continue
+        polls += 1
+
+        times = changes[dsn]
+        latest = seen[dsn]
+        while latest < len(times) and times[latest] <= now:
+            latest += 1
+        if latest > seen[dsn]:
+            staleness = max(staleness, now - times[seen[dsn]])
+            seen[dsn] = latest
+
+        if adaptive:
+            changed_at = (
+                START + timedelta(seconds=times[latest - 1])
+                if latest
+                else None
+            )
+            interval = intervals[dsn].observe(changed_at, now)
+        else:
+            interval = FIXED_INTERVAL
+        heapq.heappush(queue, (now + interval, dsn))
+    return polls, staleness
+
+
+def main(devices: int, hours: float):
+    random.seed(1)
+    duration = hours * 3600
+    changes = [
+        change_times(60 if dsn < devices * ACTIVE_SHARE else 7200, duration)
+        for dsn in range(devices)
+    ]
+
+    for name, adaptive in (("fixed", False), ("adaptive", True)):
+        polls, staleness = simulate(changes, duration, adaptive)
+        print(
+            f"{name:>8}: {polls} requests for {devices} devices in "
+            f"{hours:g}h, worst staleness {staleness:.0f}s"
+        )
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 6,
+    )
@@ -0,0 +1,83 @@
+"""Requests and parse CPU of fixed full polls versus poll priorities.
+
+Simulates one day of polls on a virtual clock. Fixed polling fetches and
+parses all properties every 5 seconds (Oekoboiler.update_delay_min) and,
+for the same freshness as the tiers, every 30 seconds. With the default
+intervals of PollPriorities the temperatures are hot (every 30s), the
+status blob and set points warm (every 5 minutes) and everything else
+cold (a full fetch every hour). Against the 30s baseline the request
+count is the same, the tiers save bytes and parse CPU.
+Run from the repository root:
+    python -m benchmarks.bench_priorities [devices]
+"""
+import json
+import sys
+import time
+
+from oekoboilerapi.aylaservice import AylaService
+from oekoboilerapi.priorities import (
+    DEFAULT_INTERVALS,
+    HOT,
+    WARM,
+    PollPriorities,
+)
+from tests import utils
+
+TICK = 5
+DAY = 24 * 3600
+PRIORITIES = {
+    "F103": HOT,
+    "F104": HOT,
+    "F100": WARM,
+    "F11": WARM,
+    "F12": WARM,
+}
+
+
+def plan(priorities: PollPriorities = None, tick: int = TICK) -> list[tuple]:
+    """names fetched per tick of one day (None is a full fetch)"""
+    fetches = []
+    for now in range(0, DAY, tick):
+        names = None if priorities is None else priorities.due(now)
+        if names == []:
+            continue
+        fetches.append(None if names is None else tuple(names))
+        if priorities is not None:
+            priorities.polled(names, now)
+    return fetches
+
+
+def main(devices: int):
+    props = utils.mocked_water_heater_properties(22, 60, 4, 1)
+    bodies = {None: json.dumps(props)}
+    service = AylaService(utils.mocked_credentials())
+
+    hot = int(DEFAULT_INTERVALS[HOT].total_seconds())
+    for name, fetches in (
+        (f"fixed {TICK}s", plan()),
+        (f"fixed {hot}s", plan(tick=hot)),
+        ("tiered", plan(PollPriorities(PRIORITIES))),
+    ):
+        for names in set(fetches):
+            if names not in bodies:
+                bodies[names] = json.dumps(
+                    [p for p in props if p["property"]["name"] in names]
+                )
+
+        received = 0
+        start = time.process_time()
+        for _ in range(devices):
+            for names in fetches:
+                body = bodies[names]
+                received += len(body)
+                service.process_properties(json.loads(body))
+        duration = time.process_time() - start
+        print(
+            f"{name:>9}: {len(fetches) * devices} requests, "
+            f"{received / 1e6:.1f}MB, {duration:.2f}s CPU to parse "
+            f"a day of {devices} devices"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1)
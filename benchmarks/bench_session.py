@@ -0,0 +1,54 @@
+"""Compares a fresh session per request with the shared AylaService session.
+
+Run from the repository root:
+    python -m benchmarks.bench_session
+"""
+import asyncio
+import time
+
+from aiohttp import ClientSession
+
+from oekoboilerapi.aylaservice import AylaService
+from tests import utils
+from tests.mock_server import MockAylaServer
+
+REQUESTS = 500
+
+
+async def fresh_sessions(server: MockAylaServer) -> float:
+    """one session per request like AylaService did before pooling"""
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        async with ClientSession() as session:
+            async with session.get(f"{server.ads_host}/dsns/dsn/properties") as resp:
+                await resp.json()
+    return time.perf_counter() - start
+
+
+async def shared_session(server: MockAylaServer) -> float:
+    """all requests through one AylaService"""
+    async with AylaService(
+        utils.mocked_credentials(),
+        host=server.user_host,
+        ads_host=server.ads_host,
+    ) as service:
+        await service.get_token()
+        start = time.perf_counter()
+        for _ in range(REQUESTS):
+            await service.request(f"{server.ads_host}/dsns/dsn/properties")
+        return time.perf_counter() - start
+
+
+async def main():
+    for name, bench in (("fresh", fresh_sessions), ("shared", shared_session)):
+        async with MockAylaServer() as server:
+            duration = await bench(server)
+            print(
+                f"{name:>6}: {REQUESTS} requests in {duration:.3f}s "
+                f"({REQUESTS / duration:.0f} req/s), "
+                f"{len(server.connections)} connection(s)"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+"""Allocations per poll with and without reuse of unchanged properties.
+
+Polls a simulated fleet whose boilers change one property (F103) per
+poll, once building all properties anew (as before) and once reusing the
+unchanged ones of the previous poll. Reports the AylaProperty objects
+created and the garbage collections run per poll, and the CPU time.
+Run from the repository root:
+    python -m benchmarks.bench_snapshot [devices] [polls]
+"""
+import gc
+import json
+import sys
+import time
+
+from oekoboilerapi.aylaservice import AylaService
+from tests import utils
+
+
+def answers() -> list[str]:
+    """two answers of a boiler differing in F103 only"""
+    bodies = []
+    for temp, updated_at in ((22, "2024-01-01T00:00:00Z"), (23, None)):
+        props = utils.mocked_water_heater_properties(temp, 60, 4, 1)
+        for prop in props:
+            if prop["property"]["name"] == "F103" and updated_at:
+                prop["property"]["data_updated_at"] = updated_at
+        bodies.append(json.dumps(props))
+    return bodies
+
+
+def poll(devices: int, polls: int, reuse: bool) -> tuple[int, int, float]:
+    """returns created properties, collections and CPU seconds"""
+
+    service = AylaService(utils.mocked_credentials())
+    bodies = answers()
+    snapshots = [
+        service.process_properties(json.loads(bodies[1]))
+        for _ in range(devices)
+    ]
+    created = 0
+
+    gc.collect()
+    collections = sum(stat["collections"] for stat in gc.get_stats())
+    start = time.process_time()
+    for i in range(polls):
+        body = bodies[i % 2]
+        for device in range(devices):
+            previous = snapshots[device]
+            props = service.process_properties(
+                json.loads(body), previous if reuse else None
+            )
+            created += sum(
+                new is not old for new, old in zip(props, previous)
+            )
+            snapshots[device] = props
+    duration = time.process_time() - start
+    collections = (
+        sum(stat["collections"] for stat in gc.get_stats()) - collections
+    )
+    return created, collections, duration
+
+
+def main(devices: int, polls: int):
+    for name, reuse in (("rebuild", False), ("reuse", True)):
+        created, collections, duration = poll(devices, polls, reuse)
+        count = devices * polls
+        print(
+            f"{name:>8}: {created / count:.1f} properties created and "
+            f"{collections / count:.3f} gc runs per poll, "
+            f"{duration / count * 1e6:.0f}us CPU per poll"
+        )
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 500,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 20,
+    )
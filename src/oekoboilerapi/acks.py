@@ -0,0 +1,186 @@
+"""Tracking of device acknowledgments for written datapoints"""
+import asyncio
+import time
+from dataclasses import replace
+from datetime import datetime
+from typing import Any
+
+from oekoboilerapi.aylaservice import (
+    AylaService,
+    DatapointAck,
+    WriteResult,
+    decode_value,
+    parse_timestamp,
+)
+
+
+class _PendingAck:
+    __slots__ = ("written_at", "value", "deadline", "future")
+
+    def __init__(
+        self, written_at: datetime, value: Any, deadline: float
+    ) -> None:
+        self.written_at = written_at
+        self.value = value
+        self.deadline = deadline
+        self.future: asyncio.Future = (
+            asyncio.get_running_loop().create_future()
+        )
+
+    def acked_by(self, ack: DatapointAck) -> bool:
+        """if ack belongs to this datapoint
+
+        Ayla timestamps have whole seconds and the property only tells the
+        ack of its latest datapoint. An ack after the server created the
+        datapoint is ours. An ack of the same second (or of a datapoint
+        without created_at, local clocks are not compared with server
+        time) only counts if the property has the written value.
+        """
+        if ack.acked_at is None:
+            return False
+        if self.written_at is not None and ack.acked_at > self.written_at:
+            return True
+        if self.written_at is not None and ack.acked_at < self.written_at:
+            return False
+        return (
+            self.value is not None
+            and decode_value(ack.base_type, self.value) == ack.value
+        )
+
+
+class AckTracker:
+    """Waits for the acknowledgments of written datapoints.
+
+    Ayla reports the ack of the latest datapoint with each property of an
+    ack_enabled property. Instead of polling every datapoint, one loop
+    checks all pending acks every `interval` seconds with one filtered
+    property request per device, however many writes are pending for it.
+    Acks not received within `timeout` seconds resolve as timed out, a
+    device answering with an error status resolves as rejected (see
+    DatapointAck.rejected).
+    """
+
+    def __init__(
+        self,
+        service: AylaService,
+        interval: float = 1.0,
+        timeout: float = 30.0,
+        concurrency: int = 16,
+    ) -> None:
+        self.service = service
+        self.interval = interval
+        self.timeout = timeout
+        self.concurrency = concurrency
+
+        self._pending: dict[str, dict[str, list[_PendingAck]]] = {}
+        self._task: asyncio.Task = None
+
+    @property
+    def pending(self) -> int:
+        """number of writes waiting for their ack"""
+        return sum(
+            len(waiting)
+            for names in self._pending.values()
+            for waiting in names.values()
+        )
+
+    def wait(
+        self, dsn: str, name: str, datapoint: dict = None, value: Any = None
+    ) -> asyncio.Future:
+        """future resolving to the DatapointAck of a written datapoint
+
+        datapoint is the one returned by Ayla (its created_at and value),
+        value the written value if Ayla returned no datapoint.
+        """
+
+        datapoint = datapoint or {}
+        pending = _PendingAck(
+            parse_timestamp(datapoint.get("created_at")),
+            datapoint.get("value", value),
+            time.monotonic() + self.timeout,
+        )
+        self._pending.setdefault(dsn, {}).setdefault(name, []).append(pending)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return pending.future
+
+    async def wait_for(self, result: WriteResult) -> WriteResult:
+        """WriteResult with the ack of its datapoint (if it was accepted)"""
+        if not result.ok:
+            return result
+        ack = await self.wait(
+            result.dsn, result.name, result.datapoint, result.value
+        )
+        return replace(result, ack=ack)
+
+    async def close(self):
+        """stop tracking, pending waits are cancelled"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        for names in self._pending.values():
+            for waiting in names.values():
+                for pending in waiting:
+                    pending.future.cancel()
+        self._pending.clear()
+
+    async def _run(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def check(dsn: str):
+            async with semaphore:
+                await self._check(dsn)
+
+        while self._pending:
+            await asyncio.sleep(self.interval)
+            await asyncio.gather(*(check(dsn) for dsn in list(self._pending)))
+            self._expire()
+
+    async def _check(self, dsn: str):
+        names = self._pending.get(dsn)
+        if not names:
+            return
+        try:
+            acks = await self.service.get_property_acks(dsn, list(names))
+        except Exception:  # retried with the next interval
+            return
+
+        for name, ack in acks.items():
+            waiting = names.get(name)
+            if not waiting:
+                continue
+            if not ack.ack_enabled:
+                # the device never acks these, report the state as is
+                done = list(waiting)
+                waiting.clear()
+            else:
+                done = [w for w in waiting if w.acked_by(ack)]
+                if not done:
+                    continue
+                waiting[:] = [w for w in waiting if w not in done]
+            for pending in done:
+                if not pending.future.done():
+                    pending.future.set_result(ack)
+        self._cleanup(dsn)
+
+    def _expire(self):
+        now = time.monotonic()
+        for dsn, names in list(self._pending.items()):
+            for name, waiting in names.items():
+                for pending in [w for w in waiting if w.deadline < now]:
+                    waiting.remove(pending)
+                    if not pending.future.done():
+                        pending.future.set_result(
+                            DatapointAck(dsn, name, True, timed_out=True)
+                        )
+            self._cleanup(dsn)
+
+    def _cleanup(self, dsn: str):
+        names = self._pending.get(dsn, {})
+        for name in [name for name, waiting in names.items() if not waiting]:
+            del names[name]
+        if not names:
+            self._pending.pop(dsn, None)
@@ -1,7 +1,39 @@
-from dataclasses import dataclass
+import asyncio
+import logging
+import random
+import sys
+import time
+from collections import deque
+from collections.abc import Iterable, Mapping, Sequence
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any
 
-from aiohttp import ClientConnectorError, ClientSession
+from aiohttp import (
+    ClientConnectorError,
+    ClientError,
+    ClientSession,
+    ClientTimeout,
+    TCPConnector,
+)
+
+from oekoboilerapi.catalog import PropertyCatalog, PropertyMeta
+from oekoboilerapi.circuit import (
+    CircuitBreakers,
+    CircuitOpenError,
+    DeviceOfflineError,
+)
+from oekoboilerapi.ratelimit import RateLimiter
+from oekoboilerapi.retry import RetryPolicy, parse_retry_after
+
+_LOGGER = logging.getLogger(__name__)
+
+USER_HOST = "https://user-field-eu.aylanetworks.com"
+ADS_HOST = "https://ads-eu.aylanetworks.com/apiv1"
+
+# tokens are renewed this long before they really expire
+TOKEN_EXPIRY_MARGIN = timedelta(hours=1)
 
 
 @dataclass
@@ -27,6 +59,31 @@ class Credentials:
         }
 
 
+@dataclass
+class ConnectionSettings:
+    """tuning of the pooled connections to Ayla cloud"""
+
+    limit: int = 100
+    limit_per_host: int = 32
+    keepalive_timeout: float = 60
+    ttl_dns_cache: int = 300
+    timeout: float = 30
+
+    def create_session(self) -> ClientSession:
+        """creates a session with a keep-alive connection pool"""
+        connector = TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.ttl_dns_cache,
+            use_dns_cache=True,
+        )
+        return ClientSession(
+            connector=connector,
+            timeout=ClientTimeout(total=self.timeout),
+        )
+
+
 @dataclass
 class AccessToken:
     """holds access token and expire timedate"""
@@ -38,36 +95,380 @@ class AccessToken:
     role_tags: str
 
     expire_date: datetime
+    expire_monotonic: float = field(default=None, compare=False)
 
     def activate(self):
         """set date expire date"""
         self.expire_date = datetime.now() + timedelta(seconds=self.expires_in)
+        self.expire_monotonic = time.monotonic() + self.expires_in
+
+    def is_expired(self, now: datetime = None) -> bool:
+        """if token is expired
 
-    def is_expired(self, now: datetime) -> bool:
-        """if token is expired"""
+        Without a date the monotonic clock is used, so wall clock jumps
+        (NTP, DST) can not extend or shorten the lifetime of a token.
+        """
 
-        real_date = self.expire_date - timedelta(hours=1)
-        return real_date < now
+        if now is None and self.expire_monotonic is not None:
+            margin = TOKEN_EXPIRY_MARGIN.total_seconds()
+            return self.expire_monotonic - margin < time.monotonic()
+
+        real_date = self.expire_date - TOKEN_EXPIRY_MARGIN
+        return real_date < (now or datetime.now())
+
+    def to_dict(self) -> dict:
+        """exports the token (including expire date) for persisting"""
+        return {
+            "access_token": self.access_token,
+            "refresh_token": self.refresh_token,
+            "expires_in": self.expires_in,
+            "role": self.role,
+            "role_tags": self.role_tags,
+            "expire_date": self.expire_date.isoformat(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "AccessToken":
+        """restores a token exported with to_dict"""
+        token = cls(**{**data, "expire_date": None})
+        token.expire_date = datetime.fromisoformat(data["expire_date"])
+        remaining = (token.expire_date - datetime.now()).total_seconds()
+        token.expire_monotonic = time.monotonic() + remaining
+        return token
 
 
 @dataclass
+class TokenRenewal:
+    """timing of a single login/refresh"""
+
+    started_at: datetime
+    duration: float
+    method: str
+    success: bool
+
+
+def parse_timestamp(value: str) -> datetime:
+    """parses an Ayla timestamp like 2023-06-01T18:45:53Z ("null" -> None)"""
+
+    if value is None or value == "null":
+        return None
+    return _parse_timestamp(value)
+
+
+@lru_cache(maxsize=4096)
+def _parse_timestamp(value: str) -> datetime:
+    # timestamps repeat a lot (within a fleet and between polls), the cache
+    # also lets all properties share the same datetime objects
+    try:
+        date = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return date
+
+
+def decode_value(base_type: str, value: Any) -> Any:
+    """converts a raw property value according to its Ayla base_type"""
+
+    if value is None:
+        return None
+    try:
+        if base_type == "integer":
+            return int(value)
+        if base_type == "boolean":
+            if isinstance(value, str):
+                return value.lower() in ("1", "true")
+            return bool(value)
+        if base_type == "decimal":
+            return float(value)
+        if base_type == "string":
+            return str(value)
+    except (TypeError, ValueError):
+        pass
+    return value
+
+
+@dataclass(frozen=True, slots=True)
 class AylaProperty:
-    """Wraps the most important values of an Ayla property"""
+    """Wraps the most important values of an Ayla property
+
+    Values are decoded once (see decode_value) when the property is
+    created from an Ayla answer. Instances are immutable and have no
+    __dict__, which keeps large fleets small in memory. pending marks a
+    value written locally but not confirmed by the device yet. meta points
+    to the other static metadata of the property in a shared
+    PropertyCatalog (None without a catalog), name and base_type are the
+    interned strings of that entry.
+    """
 
     name: str
-    value: str
-    key: str
+    value: Any
+    key: int
     data_updated_at: datetime
+    base_type: str = None
+    pending: bool = False
+    meta: PropertyMeta = field(default=None, compare=False, repr=False)
+
+
+@dataclass
+class DatapointAck:
+    """acknowledgment state of the latest datapoint of a property"""
+
+    dsn: str
+    name: str
+    ack_enabled: bool
+    ack_status: Any = None
+    ack_message: Any = None
+    acked_at: datetime = None
+    timed_out: bool = False
+    value: Any = None
+    base_type: str = None
+
+    @property
+    def acked(self) -> bool:
+        """if the device acknowledged the datapoint as applied"""
+        return (
+            self.acked_at is not None
+            and not self.timed_out
+            and not self.rejected
+        )
+
+    @property
+    def rejected(self) -> bool:
+        """if the device answered with an error status (NACK)"""
+        return self.acked_at is not None and self.ack_status not in (
+            None,
+            0,
+            "0",
+        )
+
+
+@dataclass
+class WriteResult:
+    """outcome of writing a datapoint of one property
+
+    status is 0 if the outcome is unknown (Ayla answered no status for it).
+    """
+
+    dsn: str
+    name: str
+    value: Any
+    status: int
+    datapoint: dict = None
+    ack: DatapointAck = None
+
+    @property
+    def ok(self) -> bool:
+        """if Ayla accepted the datapoint"""
+        return self.status in (200, 201)
+
+
+class _PropertyLayout:
+    """name index for one order of property names
+
+    Devices of one product report the same names in the same order, so the
+    index is shared between all of their PropertySets.
+    """
+
+    __slots__ = ("positions", "duplicates")
+
+    _cache: dict[tuple[str, ...], "_PropertyLayout"] = {}
+
+    def __init__(self, names: tuple[str, ...]) -> None:
+        self.positions: dict[str, int] = {}
+        self.duplicates: dict[str, tuple[int, ...]] = {}
+        for pos, name in enumerate(names):
+            first = self.positions.setdefault(name, pos)
+            if first != pos:
+                self.duplicates[name] = (
+                    self.duplicates.get(name, (first,)) + (pos,)
+                )
+
+    @classmethod
+    def for_names(cls, names: tuple[str, ...]) -> "_PropertyLayout":
+        """shared layout for the given names"""
+        layout = cls._cache.get(names)
+        if layout is None:
+            if len(cls._cache) >= 256:
+                cls._cache.clear()
+            layout = cls._cache[names] = cls(names)
+        return layout
+
+
+class PropertySet(Sequence):
+    """Properties of one device, indexed by name and key.
+
+    Behaves like the list returned before, lookups by name or key are O(1).
+    Ayla may report a name more than once (the Oekoboiler reports F104 as
+    integer and as boolean property). by_name() returns the first of those
+    like the former linear search did, get_all() returns all of them and
+    duplicates lists every ambiguous name.
+    """
+
+    __slots__ = ("_items", "_layout", "_by_key")
+
+    def __init__(self, props: Iterable[AylaProperty] = ()) -> None:
+        self._items: tuple[AylaProperty, ...] = tuple(props)
+        self._layout = _PropertyLayout.for_names(
+            tuple(prop.name for prop in self._items)
+        )
+        self._by_key: dict = None
+
+    def __getitem__(self, index):
+        return self._items[index]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __repr__(self) -> str:
+        return f"PropertySet({list(self._items)!r})"
+
+    def by_name(self, name: str) -> AylaProperty:
+        """first property with the given name, raises KeyError"""
+        return self._items[self._layout.positions[name]]
+
+    def by_key(self, key) -> AylaProperty:
+        """property with the given Ayla key, raises KeyError"""
+        if self._by_key is None:
+            self._by_key = {prop.key: prop for prop in self._items}
+        return self._by_key[key]
+
+    def get(self, name: str, default=None) -> AylaProperty:
+        """first property with the given name or default"""
+        pos = self._layout.positions.get(name)
+        return default if pos is None else self._items[pos]
+
+    def get_all(self, name: str) -> list[AylaProperty]:
+        """all properties with the given name"""
+        positions = self._layout.duplicates.get(name)
+        if positions is None:
+            prop = self.get(name)
+            return [] if prop is None else [prop]
+        return [self._items[pos] for pos in positions]
+
+    def updated(self, props: Iterable[AylaProperty]) -> "PropertySet":
+        """copy with props replacing the properties with the same key
+
+        Properties not known yet are appended. If nothing is replaced by a
+        different object, the set itself is returned.
+        """
+        new = {prop.key: prop for prop in props}
+        items = [new.pop(prop.key, prop) for prop in self._items]
+        if not new and all(
+            item is prop for item, prop in zip(items, self._items)
+        ):
+            return self
+        items.extend(new.values())
+        return PropertySet(items)
+
+    @property
+    def duplicates(self) -> dict[str, list[AylaProperty]]:
+        """names reported more than once with all of their properties"""
+        return {name: self.get_all(name) for name in self._layout.duplicates}
+
+
+def _previous_property(
+    previous: PropertySet, pos: int, key
+) -> AylaProperty:
+    """property with the key in previous, checks the same position first"""
+    if not previous:
+        return None
+    if pos < len(previous) and previous[pos].key == key:
+        return previous[pos]
+    try:
+        return previous.by_key(key)
+    except KeyError:
+        return None
+
+
+async def _json_body(resp) -> Any:
+    """JSON body of a response, None if it has none"""
+    try:
+        return await resp.json(content_type=None)
+    except ValueError:
+        return None
 
 
 class AylaService:
-    """Class to make authenticated requests to Ayla cloud."""
+    """Class to make authenticated requests to Ayla cloud.
 
-    def __init__(self, credentials: Credentials):
-        """Initialize the auth."""
-        self.host = "https://user-field-eu.aylanetworks.com"
+    All requests share one session (and therefore one keep-alive connection
+    pool). Pass your own session to share it with other code, otherwise the
+    service creates one on first use and closes it in close() or when used
+    as async context manager.
+
+    Failed requests are retried according to the RetryPolicy given as
+    `retry` (see oekoboilerapi.retry). With a rate_limiter requests wait
+    for the budget of their host and kind (see oekoboilerapi.ratelimit).
+    With circuits, requests to failing hosts and devices and to offline
+    devices are refused right away (see oekoboilerapi.circuit). With a
+    catalog the static metadata of properties is kept once per product
+    (see oekoboilerapi.catalog).
+    """
+
+    def __init__(
+        self,
+        credentials: Credentials,
+        session: ClientSession = None,
+        connection: ConnectionSettings = None,
+        host: str = USER_HOST,
+        ads_host: str = ADS_HOST,
+        token_store=None,
+        retry: RetryPolicy = None,
+        rate_limiter: RateLimiter = None,
+        circuits: CircuitBreakers = None,
+        catalog: PropertyCatalog = None,
+    ):
+        """Initialize the auth.
+
+        With a token_store (see oekoboilerapi.tokenstore) a still valid
+        token of an earlier run is restored instead of signing in again.
+        """
+        self.host = host
+        self.ads_host = ads_host
         self.access_token = None
         self.credentials = credentials
+        self.token_store = token_store
+        self.connection = connection or ConnectionSettings()
+        self.retry = retry or RetryPolicy()
+        self.rate_limiter = rate_limiter
+        self.circuits = circuits
+        self.catalog = catalog
+
+        self._session: ClientSession = session
+        self._owns_session = session is None
+        self._token_task: asyncio.Task = None
+        self._renewal_task: asyncio.Task = None
+        self.token_renewals: deque[TokenRenewal] = deque(maxlen=100)
+
+    async def __aenter__(self) -> "AylaService":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    @property
+    def session(self) -> ClientSession:
+        """shared session for all requests, created on first use"""
+        if self._session is None or self._session.closed:
+            self._session = self.connection.create_session()
+            self._owns_session = True
+        return self._session
+
+    async def close(self):
+        """closes the session (if created by this service)"""
+        await self.stop_token_renewal()
+        if (
+            self._owns_session
+            and self._session is not None
+            and not self._session.closed
+        ):
+            await self._session.close()
+        self._session = None
 
     async def login(self) -> bool:
         """Login to Ayla Cloud"""
@@ -75,35 +476,164 @@ class AylaService:
         headers = {"Content-Type": "application/json; charset=utf-8"}
         payload = self.credentials.to_json_str()
 
-        async with ClientSession() as session:
-            try:
-                async with session.post(
-                    f"{self.host}/users/sign_in.json",
-                    json=payload,
-                    headers=headers,
-                ) as resp:
-                    if resp.status == 200:
-                        data = await resp.json()
-                        self.access_token = AccessToken(
-                            **data, expire_date=None
-                        )
-                        self.access_token.activate()
-                        return True
-                    raise LoginFailedError(await resp.json(), resp.status)
+        try:
+            status, data = await self._send(
+                "POST",
+                f"{self.host}/users/sign_in.json",
+                json=payload,
+                headers=headers,
+            )
+        except ClientConnectorError as exc:
+            raise NoAccessError from exc
 
-            except ClientConnectorError as exc:
-                raise NoAccessError from exc
+        if status == 200:
+            self.access_token = AccessToken(**data, expire_date=None)
+            self.access_token.activate()
+            return True
+        raise LoginFailedError(data, status)
 
     async def get_token(self) -> str:
-        """get auth token for requests. Refreshs if necessary"""
+        """get auth token for requests. Refreshs if necessary
+
+        Concurrent callers share one in-flight login/refresh, so a burst of
+        requests with an expired token results in one auth request only.
+        """
 
-        if self.access_token is None:
-            await self.login()
-        elif self.access_token.is_expired(datetime.now()):
-            await self.refresh_token()
+        if self.access_token is None or self.access_token.is_expired():
+            await asyncio.shield(self._shared_renewal())
 
         return self.access_token.access_token
 
+    def _shared_renewal(self) -> asyncio.Future:
+        """returns the running login/refresh or starts a new one"""
+
+        if self._token_task is None or self._token_task.done():
+            self._token_task = asyncio.ensure_future(self._renew_token())
+        return self._token_task
+
+    @property
+    def token_store_key(self) -> str:
+        """key of this account in the token store"""
+        return f"{self.credentials.app_id}:{self.credentials.email}"
+
+    async def _renew_token(self):
+        """get a new token from the token store, by refresh or by login
+
+        The store stays locked during the renewal, so other processes
+        sharing it wait and pick up the new token instead of renewing (and
+        invalidating the refresh token) themselves.
+        """
+
+        if self.token_store is None:
+            await self._refresh_or_login()
+            return
+
+        key = self.token_store_key
+        lock = self.token_store.lock(key)
+        await asyncio.to_thread(lock.__enter__)
+        try:
+            stored = await asyncio.to_thread(self.token_store.load, key)
+            if (
+                stored is not None
+                and not stored.is_expired()
+                and (
+                    self.access_token is None
+                    or stored.access_token != self.access_token.access_token
+                )
+            ):
+                self.access_token = stored
+                self.token_renewals.append(
+                    TokenRenewal(datetime.now(), 0.0, "store", True)
+                )
+                return
+
+            await self._refresh_or_login()
+            await asyncio.to_thread(
+                self.token_store.save, key, self.access_token
+            )
+        finally:
+            await asyncio.to_thread(lock.__exit__, None, None, None)
+
+    async def _refresh_or_login(self):
+        """refresh the current token, falls back to login"""
+
+        started_at = datetime.now()
+        start = time.perf_counter()
+        method = "refresh"
+        success = False
+        try:
+            if self.access_token is None or not await self.refresh_token():
+                method = "login"
+                await self.login()
+            success = True
+        finally:
+            self.token_renewals.append(
+                TokenRenewal(
+                    started_at=started_at,
+                    duration=time.perf_counter() - start,
+                    method=method,
+                    success=success,
+                )
+            )
+
+    def start_token_renewal(
+        self, lead: float = 300, jitter: float = 60, retry_delay: float = 30
+    ):
+        """renew the token in the background before it expires
+
+        The renewal runs `lead` seconds (minus a random jitter of up to
+        `jitter` seconds) before get_token would consider the token
+        expired, so requests never have to wait for auth.
+        """
+
+        if self._renewal_task is None or self._renewal_task.done():
+            self._renewal_task = asyncio.create_task(
+                self._token_renewal_loop(lead, jitter, retry_delay)
+            )
+
+    async def stop_token_renewal(self):
+        """stop the background renewal (if running)"""
+
+        task, self._renewal_task = self._renewal_task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def _seconds_until_renewal(self, lead: float, jitter: float) -> float:
+        token = self.access_token
+        if token is None or token.expire_monotonic is None:
+            return 0
+        renew_at = (
+            token.expire_monotonic
+            - TOKEN_EXPIRY_MARGIN.total_seconds()
+            - lead
+            - random.uniform(0, jitter)
+        )
+        return max(0, renew_at - time.monotonic())
+
+    async def _token_renewal_loop(
+        self, lead: float, jitter: float, retry_delay: float
+    ):
+        delay = self._seconds_until_renewal(lead, jitter)
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await asyncio.shield(self._shared_renewal())
+                delay = max(
+                    self._seconds_until_renewal(lead, jitter), retry_delay
+                )
+            except (
+                ClientError,
+                asyncio.TimeoutError,
+                NoAccessError,
+                LoginFailedError,
+                CircuitOpenError,
+            ):
+                delay = retry_delay
+
     async def refresh_token(self) -> bool:
         """send request to refresh token"""
         payload = {
@@ -114,34 +644,140 @@ class AylaService:
 
         headers = {
             "Content-Type": "application/json; charset=utf-8",
-            "Authorization": f"auth_token {self.access_token}",
+            "Authorization": f"auth_token {self.access_token.access_token}",
         }
 
-        async with ClientSession() as session:
-            async with session.post(
-                f"{self.host}/users/refresh_token.json",
-                json=payload,
-                headers=headers,
-            ) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    self.access_token = AccessToken(**data, expire_date=None)
-                    self.access_token.activate()
-                    return True
+        status, data = await self._send(
+            "POST",
+            f"{self.host}/users/refresh_token.json",
+            json=payload,
+            headers=headers,
+        )
+        if status == 200:
+            self.access_token = AccessToken(**data, expire_date=None)
+            self.access_token.activate()
+            return True
+
+        return False
+
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        idempotent: bool = True,
+        dsn: str = None,
+        **kwargs,
+    ) -> tuple[int, Any]:
+        """sends a request through the circuit breakers of host and dsn
+
+        Raises CircuitOpenError (DeviceOfflineError) instead of sending if
+        one of them is open. Connection errors and 5xx answers left after
+        all retries count as failures.
+        """
+
+        if self.circuits is None:
+            return await self._send_attempts(method, url, idempotent, **kwargs)
+
+        if dsn is not None and self.circuits.is_offline(dsn):
+            raise DeviceOfflineError(dsn)
+        host = self.ads_host if url.startswith(self.ads_host) else self.host
+        breakers = [(host, self.circuits.host(host))]
+        if dsn is not None:
+            breakers.append((dsn, self.circuits.device(dsn)))
+        allowed = []
+        for key, breaker in breakers:
+            if not breaker.allow():
+                for breaker in allowed:
+                    breaker.release()
+                raise CircuitOpenError(key)
+            allowed.append(breaker)
+
+        try:
+            status, data = await self._send_attempts(
+                method, url, idempotent, **kwargs
+            )
+        except (ClientError, asyncio.TimeoutError):
+            for breaker in allowed:
+                breaker.failure()
+            raise
+        except BaseException:
+            for breaker in allowed:
+                breaker.release()
+            raise
+        for breaker in allowed:
+            if status >= 500:
+                breaker.failure()
+            else:
+                breaker.success()
+        return status, data
+
+    async def _send_attempts(
+        self, method: str, url: str, idempotent: bool, **kwargs
+    ) -> tuple[int, Any]:
+        """sends a request, retried according to the retry policy
+
+        Returns the status and JSON body (None if there is none) of the last
+        attempt. All attempts share the deadline of the policy, a retry that
+        would wait beyond it is not made. Connection errors are raised once
+        no retry is left.
+        """
+
+        policy = self.retry
+        limiter = self.rate_limiter
+        auth_host = not url.startswith(self.ads_host)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + policy.deadline
+        attempt = 0
+        while True:
+            attempt += 1
+            if limiter is not None:
+                await limiter.throttle(auth_host, method)
+            remaining = deadline - loop.time()
+            # a total of 0 would disable the timeout
+            timeout = ClientTimeout(
+                total=max(0.001, min(remaining, self.connection.timeout))
+            )
+            try:
+                async with self.session.request(
+                    method, url, timeout=timeout, **kwargs
+                ) as resp:
+                    delay = policy.retry_delay(
+                        attempt,
+                        idempotent,
+                        status=resp.status,
+                        retry_after=parse_retry_after(
+                            resp.headers.get("Retry-After")
+                        ),
+                    )
+                    if resp.status == 429 and limiter is not None:
+                        limiter.pause(
+                            limiter.bucket_name(auth_host, method),
+                            delay or policy.base_delay,
+                        )
+                    if delay is None or loop.time() + delay > deadline:
+                        return resp.status, await _json_body(resp)
+            except (ClientError, asyncio.TimeoutError) as exc:
+                delay = policy.retry_delay(attempt, idempotent, exc=exc)
+                if delay is None or loop.time() + delay > deadline:
+                    raise
+            await asyncio.sleep(delay)
 
-                return False
+    async def request(self, target_url, params=None, dsn: str = None):
+        """make requst to ayla networks
 
-    async def request(self, target_url):
-        """make requst to ayla networks"""
+        Raises RequestFailedError if Ayla answers with an error (after all
+        retries). Requests concerning a device pass its dsn for the
+        circuit breakers.
+        """
 
         headers = await self.get_json_header_with_token()
 
-        async with ClientSession() as session:
-            async with session.get(
-                target_url,
-                headers=headers,
-            ) as resp:
-                return await resp.json()
+        status, data = await self._send(
+            "GET", target_url, dsn=dsn, headers=headers, params=params
+        )
+        if status >= 400:
+            raise RequestFailedError(data, status)
+        return data
 
     async def get_json_header_with_token(self) -> str:
         """Header object for content-type and accept json with token"""
@@ -152,89 +788,256 @@ class AylaService:
         }
 
     async def get_devices(self):
-        """get devices for current Ayla account"""
-        json = await self.request(
-            "https://ads-eu.aylanetworks.com/apiv1/devices"
-        )
+        """get devices for current Ayla account
+
+        Their connection status updates the offline devices of circuits.
+        """
+        json = await self.request(f"{self.ads_host}/devices")
+        if self.circuits is not None:
+            self.circuits.update_devices(json)
         return json
 
     async def get_dsns_info(self, dsn):
         """get dsns ifno for current Ayla account"""
-        json = await self.request(
-            "https://ads-eu.aylanetworks.com/apiv1/dsns/{dsn}"
-        )
+        json = await self.request(f"{self.ads_host}/dsns/{dsn}")
+        if self.circuits is not None:
+            self.circuits.update_devices([json])
         return json
 
-    async def get_properties(self, dsn: str):
-        """get properties for specific device from Ayla cloud"""
+    async def get_properties(
+        self,
+        dsn: str,
+        names: Iterable[str] = None,
+        previous: PropertySet = None,
+    ):
+        """get properties for specific device from Ayla cloud
+
+        With names only those properties are requested (Ayla names[]
+        filter), which keeps hot-path polls small. Unchanged properties of
+        previous are reused (see process_properties).
+        """
+        params = None
+        if names:
+            params = [("names[]", name) for name in names]
         json = await self.request(
-            f"https://ads-eu.aylanetworks.com/apiv1/dsns/{dsn}/properties"
+            f"{self.ads_host}/dsns/{dsn}/properties", params=params, dsn=dsn
         )
-        return self.process_properties(json)
+        props = self.process_properties(json, previous)
+        if self.catalog is not None and self.catalog.dirty:
+            await self.catalog.async_save()
+        return props
 
-    def process_properties(self, data: str) -> list:
-        """Create properties from AylaAnswer"""
+    def process_properties(
+        self, data: str, previous: PropertySet = None
+    ) -> PropertySet:
+        """Create properties from AylaAnswer
+
+        With previous (the last properties of the device), properties whose
+        value and data_updated_at did not change are taken from previous
+        instead of created again. If nothing changed at all, previous itself
+        is returned. With a catalog, the metadata of the answer is only read
+        for products (or properties) not in the catalog yet.
+        """
+        product = self.catalog.for_answer(data) if self.catalog else None
         props = []
-        for prop in data:
-            date: datetime = None
-            try:
-                date = datetime.strptime(
-                    f"{prop['property']['data_updated_at']}",
-                    "%Y-%m-%dT%H:%M:%SZ",
-                ).replace(tzinfo=timezone.utc)
-            except ValueError:
-                pass
+        in_place = 0
+        meta = None
+        for pos, prop in enumerate(data):
+            prop = prop["property"]
+            if product is None:
+                base_type = sys.intern(prop["base_type"])
+            else:
+                meta = product.get(prop["name"], prop["base_type"])
+                if meta is None:
+                    meta = self.catalog.learn(product, prop)
+                base_type = meta.base_type
+            value = decode_value(base_type, prop["value"])
+            data_updated_at = parse_timestamp(prop["data_updated_at"])
+
+            current = _previous_property(previous, pos, prop["key"])
+            if (
+                current is not None
+                and not current.pending
+                and current.base_type is base_type
+                and current.meta is meta
+                and current.data_updated_at == data_updated_at
+                and current.value == value
+            ):
+                in_place += pos < len(previous) and previous[pos] is current
+                props.append(current)
+                continue
 
             props.append(
                 AylaProperty(
-                    name=prop["property"]["name"],
-                    key=prop["property"]["key"],
-                    data_updated_at=date,
-                    value=prop["property"]["value"],
+                    name=meta.name if meta else sys.intern(prop["name"]),
+                    key=prop["key"],
+                    data_updated_at=data_updated_at,
+                    value=value,
+                    base_type=base_type,
+                    meta=meta,
                 )
             )
-        return props
+        if previous is not None and in_place == len(previous) == len(props):
+            return previous
+        return PropertySet(props)
+
+    async def register_device(self, dsn: str) -> bool:
+        """registers a device for the account, returns if Ayla accepted it"""
 
-    async def register_device(self, dsn: str):
         headers = await self.get_json_header_with_token()
-        print(f"register device with dsn: {dsn}!")
-
-        async with ClientSession() as session:
-            async with session.post(
-                "https://ads-eu.aylanetworks.com/apiv1/devices",
-                json={
-                    "device": {
-                        "dsn": f"{dsn}",
-                    }
-                },
-                headers=headers,
-            ) as resp:
-                if resp.status:
-                    print(resp)
-                    return True
-                return False
+        _LOGGER.debug("register device with dsn: %s", dsn)
+
+        status, data = await self._send(
+            "POST",
+            f"{self.ads_host}/devices",
+            idempotent=False,
+            json={
+                "device": {
+                    "dsn": f"{dsn}",
+                }
+            },
+            headers=headers,
+        )
+        if status in (200, 201):
+            return True
+        _LOGGER.warning(
+            "registering device %s failed: %s %s", dsn, status, data
+        )
+        return False
 
     async def update_property(
         self, ayla_prop_id: str, ayla_prop_value: any
     ) -> bool:
         """Update property for an AylaDevice"""
 
+        return (
+            await self.write_datapoint(ayla_prop_id, ayla_prop_value)
+            is not None
+        )
+
+    async def write_datapoint(
+        self, ayla_prop_id: str, ayla_prop_value: any
+    ) -> dict:
+        """Writes a datapoint, returns it (with its id) or None if rejected
+
+        An accepted datapoint without answer body is returned as {}.
+        """
+
+        headers = await self.get_json_header_with_token()
+
+        status, data = await self._send(
+            "POST",
+            f"{self.ads_host}/properties/{ayla_prop_id}/datapoints",
+            idempotent=False,
+            json={
+                "datapoint": {
+                    "value": f"{ayla_prop_value}",
+                }
+            },
+            headers=headers,
+        )
+        if status in (200, 201):
+            if not isinstance(data, dict):
+                return {}
+            return data.get("datapoint", data)
+        return None
+
+    async def get_property_acks(
+        self, dsn: str, names: Iterable[str]
+    ) -> dict[str, DatapointAck]:
+        """latest acknowledgments of the given properties of a device
+
+        One request covers all given properties (Ayla names[] filter).
+        """
+
+        json = await self.request(
+            f"{self.ads_host}/dsns/{dsn}/properties",
+            params=[("names[]", name) for name in names],
+            dsn=dsn,
+        )
+        acks = {}
+        for prop in json:
+            prop = prop["property"]
+            acks.setdefault(
+                prop["name"],
+                DatapointAck(
+                    dsn=dsn,
+                    name=prop["name"],
+                    ack_enabled=bool(prop.get("ack_enabled")),
+                    ack_status=prop.get("ack_status"),
+                    ack_message=prop.get("ack_message"),
+                    acked_at=parse_timestamp(prop.get("acked_at")),
+                    value=decode_value(prop["base_type"], prop.get("value")),
+                    base_type=prop["base_type"],
+                ),
+            )
+        return acks
+
+    async def update_properties_batch(
+        self, writes: Iterable[tuple[str, str, Any]]
+    ) -> list[WriteResult]:
+        """writes (dsn, property name, value) datapoints in one request
+
+        Uses the Ayla batch datapoints endpoint, so writes for several
+        properties and several devices share one round trip. Returns the
+        outcome of every write in the order given.
+        """
+
+        writes = list(writes)
+        if not writes:
+            return []
         headers = await self.get_json_header_with_token()
 
-        async with ClientSession() as session:
-            async with session.post(
-                f"https://ads-eu.aylanetworks.com/apiv1/"
-                f"properties/{ayla_prop_id}/datapoints",
-                json={
-                    "datapoint": {
-                        "value": f"{ayla_prop_value}",
+        status, answers = await self._send(
+            "POST",
+            f"{self.ads_host}/batch_datapoints.json",
+            idempotent=False,
+            json={
+                "batch_datapoints": [
+                    {
+                        "dsn": dsn,
+                        "name": name,
+                        "datapoint": {"value": f"{value}"},
                     }
-                },
-                headers=headers,
-            ) as resp:
-                if resp.status:
-                    return True
-                return False
+                    for dsn, name, value in writes
+                ]
+            },
+            headers=headers,
+        )
+        if status not in (200, 201, 207):
+            return [
+                WriteResult(dsn, name, value, status)
+                for dsn, name, value in writes
+            ]
+
+        # writes without an answer keep status 0 (outcome unknown)
+        by_property = {
+            (answer.get("dsn"), answer.get("name")): answer
+            for answer in (answers if isinstance(answers, list) else ())
+            if isinstance(answer, dict)
+        }
+        results = []
+        for dsn, name, value in writes:
+            answer = by_property.get((dsn, name), {})
+            results.append(
+                WriteResult(
+                    dsn,
+                    name,
+                    value,
+                    answer.get("status", 0),
+                    answer.get("datapoint"),
+                )
+            )
+        return results
+
+    async def update_properties(
+        self, dsn: str, values: Mapping[str, Any]
+    ) -> dict[str, WriteResult]:
+        """writes several properties of one device in one request"""
+        results = await self.update_properties_batch(
+            (dsn, name, value) for name, value in values.items()
+        )
+        return {result.name: result for result in results}
 
     async def update_property_by_name(
         self,
@@ -250,6 +1053,8 @@ class AylaService:
 
     def get_property_by_name(self, props: list[AylaProperty], name: str):
         """Returns the first property with the given name (if exists)"""
+        if isinstance(props, PropertySet):
+            return props.by_name(name)
         return next(prop for prop in props if prop.name == name)
 
 
@@ -264,3 +1069,12 @@ class LoginFailedError(Exception):
         self.http_status: int = http_status
         self.message: str = message
         super().__init__()
+
+
+class RequestFailedError(Exception):
+    """Error if Ayla Cloud answers a request with an error status"""
+
+    def __init__(self, message: str, http_status: int) -> None:
+        self.http_status: int = http_status
+        self.message: str = message
+        super().__init__()
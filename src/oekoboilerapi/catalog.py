@@ -0,0 +1,215 @@
+"""Static property metadata per product, shared by all snapshots"""
+import asyncio
+import json
+import sys
+import time
+from dataclasses import asdict, dataclass
+
+from oekoboilerapi.jsonfile import write_json_atomic
+
+
+@dataclass(frozen=True, slots=True)
+class PropertyMeta:
+    """static metadata of a property, the same for all devices of a product"""
+
+    name: str
+    base_type: str
+    read_only: bool = False
+    direction: str = None
+    display_name: str = None
+    retention_days: int = None
+    ack_enabled: bool = False
+
+    @classmethod
+    def from_answer(cls, prop: dict) -> "PropertyMeta":
+        """metadata of a property of an Ayla properties answer"""
+        return cls(
+            name=sys.intern(prop["name"]),
+            base_type=sys.intern(prop["base_type"]),
+            read_only=bool(prop.get("read_only")),
+            direction=prop.get("direction"),
+            display_name=prop.get("display_name"),
+            retention_days=prop.get("retention_days"),
+            ack_enabled=bool(prop.get("ack_enabled")),
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PropertyMeta":
+        """restores metadata exported with dataclasses.asdict"""
+        return cls(
+            **{
+                **data,
+                "name": sys.intern(data["name"]),
+                "base_type": sys.intern(data["base_type"]),
+            }
+        )
+
+
+class ProductCatalog:
+    """metadata of the properties of one product, by name and base_type
+
+    A name can be reported with several base types (the Oekoboiler reports
+    F104 as integer and as boolean property), get() tells them apart.
+    """
+
+    def __init__(
+        self,
+        product_name: str,
+        properties=(),
+        fetched_at: float = None,
+    ) -> None:
+        self.product_name = product_name
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+        self._by_name: dict[str, tuple[PropertyMeta, ...]] = {}
+        for meta in properties:
+            self.add(meta)
+
+    def __iter__(self):
+        for metas in self._by_name.values():
+            yield from metas
+
+    def __len__(self) -> int:
+        return sum(len(metas) for metas in self._by_name.values())
+
+    def get(self, name: str, base_type: str = None) -> PropertyMeta:
+        """metadata of the property, None if unknown
+
+        Without base_type the first property of the name is returned.
+        """
+        metas = self._by_name.get(name)
+        if metas is None:
+            return None
+        if base_type is None:
+            return metas[0]
+        for meta in metas:
+            if meta.base_type == base_type:
+                return meta
+        return None
+
+    def add(self, meta: PropertyMeta) -> PropertyMeta:
+        """adds or replaces the metadata of a property"""
+        metas = tuple(
+            known
+            for known in self._by_name.get(meta.name, ())
+            if known.base_type != meta.base_type
+        )
+        self._by_name[meta.name] = metas + (meta,)
+        return meta
+
+    def is_stale(self, ttl: float, now: float = None) -> bool:
+        """if the metadata is older than ttl seconds"""
+        return self.fetched_at + ttl < (time.time() if now is None else now)
+
+    def to_dict(self) -> dict:
+        """exports the catalog for persisting"""
+        return {
+            "product_name": self.product_name,
+            "fetched_at": self.fetched_at,
+            "properties": [asdict(meta) for meta in self],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ProductCatalog":
+        """restores a catalog exported with to_dict"""
+        return cls(
+            data["product_name"],
+            (PropertyMeta.from_dict(meta) for meta in data["properties"]),
+            data["fetched_at"],
+        )
+
+
+class PropertyCatalog:
+    """Shared static metadata of the properties of each product.
+
+    Ayla repeats the metadata of every property in every properties answer.
+    The catalog keeps it once per product_name: it is taken from the first
+    answer of a product and taken again once older than ttl seconds.
+    Properties created with a catalog (see AylaService) keep their name
+    and base_type and reference the rest of the metadata (meta).
+
+    With a path the catalog is kept in a JSON file and survives restarts.
+    Changes only mark the catalog dirty, AylaService writes it once per
+    answer in a worker thread (async_save).
+    """
+
+    def __init__(self, ttl: float = 86400.0, path: str = None) -> None:
+        self.ttl = ttl
+        self.path = path
+        self.dirty = False
+        self._products: dict[str, ProductCatalog] = None
+        self._save_lock: asyncio.Lock = None
+
+    @property
+    def products(self) -> dict[str, ProductCatalog]:
+        """catalogs by product_name, loaded from path on first use"""
+        if self._products is None:
+            self._products = self._read()
+        return self._products
+
+    def _read(self) -> dict[str, ProductCatalog]:
+        if self.path is None:
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                data = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        return {
+            product["product_name"]: ProductCatalog.from_dict(product)
+            for product in data
+        }
+
+    def save(self) -> None:
+        """writes the catalog to path (if set)"""
+        self.dirty = False
+        if self.path is not None:
+            write_json_atomic(self.path, self._export())
+
+    async def async_save(self) -> None:
+        """writes a dirty catalog to path without blocking the event loop"""
+        if self._save_lock is None:
+            self._save_lock = asyncio.Lock()
+        async with self._save_lock:
+            if not self.dirty:
+                return
+            self.dirty = False
+            if self.path is not None:
+                await asyncio.to_thread(
+                    write_json_atomic, self.path, self._export()
+                )
+
+    def _export(self) -> list[dict]:
+        return [product.to_dict() for product in self.products.values()]
+
+    def product(self, product_name: str, now: float = None) -> ProductCatalog:
+        """catalog of the product, None if unknown or stale"""
+        product = self.products.get(product_name)
+        if product is None or product.is_stale(self.ttl, now):
+            return None
+        return product
+
+    def for_answer(self, data: list, now: float = None) -> ProductCatalog:
+        """catalog of the product of a properties answer
+
+        If the product is unknown or stale, its metadata is taken from the
+        answer. Properties missing in a (filtered) answer keep their
+        former metadata.
+        """
+        if not data:
+            return None
+        product_name = data[0]["property"].get("product_name")
+        product = self.product(product_name, now)
+        if product is None:
+            product = ProductCatalog(
+                product_name, self.products.get(product_name, ()), now
+            )
+            for prop in data:
+                product.add(PropertyMeta.from_answer(prop["property"]))
+            self.products[product_name] = product
+            self.dirty = True
+        return product
+
+    def learn(self, product: ProductCatalog, prop: dict) -> PropertyMeta:
+        """adds a property missing in the catalog of its product"""
+        self.dirty = True
+        return product.add(PropertyMeta.from_answer(prop))
@@ -0,0 +1,86 @@
+"""Changed properties between snapshots and their delivery to consumers"""
+import asyncio
+from dataclasses import dataclass
+
+from oekoboilerapi.aylaservice import AylaProperty, PropertySet
+
+
+@dataclass(frozen=True, slots=True)
+class PropertyChange:
+    """a property that changed with an update (old is None if it is new)"""
+
+    device_id: str
+    name: str
+    old: AylaProperty
+    new: AylaProperty
+
+
+def diff(
+    device_id: str, old: PropertySet, new: PropertySet
+) -> list[PropertyChange]:
+    """properties of new that changed against old, matched by key
+
+    A property changed if its data_updated_at, value or pending flag
+    differs. Properties missing in new are not reported.
+    """
+
+    changes = []
+    for prop in new:
+        try:
+            before = old.by_key(prop.key) if old else None
+        except KeyError:
+            before = None
+        if before is prop:
+            continue
+        if (
+            before is None
+            or before.data_updated_at != prop.data_updated_at
+            or before.value != prop.value
+            or before.pending != prop.pending
+        ):
+            changes.append(PropertyChange(device_id, prop.name, before, prop))
+    return changes
+
+
+class ChangeWatcher:
+    """Async iterator over the changes of a boiler (see Oekoboiler.watch).
+
+    Changes wait in a queue of at most `maxsize` entries. If the consumer
+    falls behind, the oldest changes are dropped (counted in dropped), so
+    the updating side never waits for it.
+    """
+
+    def __init__(self, maxsize: int = 100) -> None:
+        self._queue: asyncio.Queue[PropertyChange] = asyncio.Queue(maxsize)
+        self.dropped = 0
+        self.closed = False
+
+    def __aiter__(self) -> "ChangeWatcher":
+        return self
+
+    async def __anext__(self) -> PropertyChange:
+        if self.closed and self._queue.empty():
+            raise StopAsyncIteration
+        change = await self._queue.get()
+        if change is None:
+            raise StopAsyncIteration
+        return change
+
+    def put(self, change: PropertyChange):
+        """queues a change, dropping the oldest one if full"""
+        if self.closed:
+            return
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(change)
+
+    def close(self):
+        """ends the iteration once the queued changes are consumed"""
+        if self.closed:
+            return
+        self.closed = True
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(None)
@@ -0,0 +1,161 @@
+"""Circuit breakers for Ayla hosts and devices"""
+import time
+from collections.abc import Iterable
+
+
+class CircuitBreaker:
+    """Stops requests to a failing host or device.
+
+    After `threshold` failures in a row the circuit opens and requests are
+    refused for `reset_timeout` seconds. Then it is half open: one probe
+    request is let through, its success closes the circuit again, its
+    failure opens it for another `reset_timeout`.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    __slots__ = (
+        "threshold",
+        "reset_timeout",
+        "failures",
+        "opened_at",
+        "_probing",
+    )
+
+    def __init__(self, threshold: int = 5, reset_timeout: float = 30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        """closed, open or half_open"""
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow(self) -> bool:
+        """if a request may be sent, takes the probe slot if half open"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def success(self):
+        """a request succeeded, closes the circuit"""
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def failure(self):
+        """a request failed, opens the circuit at the threshold"""
+        self.failures += 1
+        if self._probing or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def release(self):
+        """a request ended without telling anything about the circuit"""
+        self._probing = False
+
+
+class CircuitBreakers:
+    """Circuit breakers per host and per dsn and the offline devices.
+
+    Devices reported offline (see update_devices, fed by
+    AylaService.get_devices) are not requested until they are reported
+    online again or `offline_ttl` seconds have passed.
+    """
+
+    def __init__(
+        self,
+        threshold: int = 5,
+        reset_timeout: float = 30.0,
+        device_threshold: int = 3,
+        device_reset_timeout: float = 300.0,
+        offline_ttl: float = 300.0,
+    ) -> None:
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.device_threshold = device_threshold
+        self.device_reset_timeout = device_reset_timeout
+        self.offline_ttl = offline_ttl
+
+        self.hosts: dict[str, CircuitBreaker] = {}
+        self.devices: dict[str, CircuitBreaker] = {}
+        self._offline: dict[str, float] = {}
+
+    def host(self, name: str) -> CircuitBreaker:
+        """breaker of a host, created on first use"""
+        breaker = self.hosts.get(name)
+        if breaker is None:
+            breaker = self.hosts[name] = CircuitBreaker(
+                self.threshold, self.reset_timeout
+            )
+        return breaker
+
+    def device(self, dsn: str) -> CircuitBreaker:
+        """breaker of a device, created on first use"""
+        breaker = self.devices.get(dsn)
+        if breaker is None:
+            breaker = self.devices[dsn] = CircuitBreaker(
+                self.device_threshold, self.device_reset_timeout
+            )
+        return breaker
+
+    def mark_offline(self, dsn: str):
+        """skip the device until it is online again"""
+        self._offline[dsn] = time.monotonic() + self.offline_ttl
+
+    def mark_online(self, dsn: str):
+        """poll the device again"""
+        self._offline.pop(dsn, None)
+
+    def is_offline(self, dsn: str) -> bool:
+        """if the device was reported offline (within offline_ttl)"""
+        until = self._offline.get(dsn)
+        if until is None:
+            return False
+        if until <= time.monotonic():
+            del self._offline[dsn]
+            return False
+        return True
+
+    @property
+    def offline(self) -> set[str]:
+        """dsns currently cached as offline"""
+        return {dsn for dsn in list(self._offline) if self.is_offline(dsn)}
+
+    def update_devices(self, devices: Iterable[dict]):
+        """takes the connection status of devices as listed by Ayla"""
+        for device in devices:
+            device = device.get("device", device)
+            dsn = device.get("dsn")
+            status = device.get("connection_status")
+            if dsn is None or status is None:
+                continue
+            if status.lower() == "online":
+                self.mark_online(dsn)
+            else:
+                self.mark_offline(dsn)
+
+
+class CircuitOpenError(Exception):
+    """Error if requests to a host or device are suspended"""
+
+    def __init__(self, key: str) -> None:
+        self.key: str = key
+        super().__init__(key)
+
+
+class DeviceOfflineError(CircuitOpenError):
+    """Error if a device is known to be offline"""
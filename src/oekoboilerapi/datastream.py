@@ -0,0 +1,234 @@
+"""Push updates of properties through the Ayla datastream service"""
+import asyncio
+import json
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+from aiohttp import ClientWSTimeout, WSMsgType, WSServerHandshakeError
+
+from oekoboilerapi.aylaservice import (
+    AylaService,
+    RequestFailedError,
+    parse_timestamp,
+)
+from oekoboilerapi.fleet import FleetPoller
+from oekoboilerapi.oekoboiler import Oekoboiler
+from oekoboilerapi.retry import RetryPolicy
+
+_LOGGER = logging.getLogger(__name__)
+
+STREAM_HOST = "https://stream-field-eu.aylanetworks.com"
+
+HEARTBEAT = "Z"
+
+
+@dataclass(frozen=True, slots=True)
+class DatapointEvent:
+    """a datapoint pushed by the datastream"""
+
+    dsn: str
+    name: str
+    value: Any
+    updated_at: datetime
+    seq: int = None
+
+
+def parse_message(message: str) -> DatapointEvent:
+    """parses a "<length>|<payload>" stream message
+
+    Returns None for heartbeats and events other than datapoints.
+    """
+
+    _, sep, payload = message.partition("|")
+    if not sep or payload == HEARTBEAT:
+        return None
+    try:
+        data = json.loads(payload)
+        metadata = data["metadata"]
+        datapoint = data["datapoint"]
+    except (ValueError, KeyError, TypeError):
+        return None
+    if metadata.get("event_type", "datapoint") != "datapoint":
+        return None
+
+    seq = data.get("seq")
+    return DatapointEvent(
+        dsn=metadata["dsn"],
+        name=metadata["property_name"],
+        value=datapoint.get("value"),
+        updated_at=parse_timestamp(
+            datapoint.get("updated_at") or datapoint.get("created_at")
+        ),
+        seq=None if seq is None else int(seq),
+    )
+
+
+class DatastreamClient:
+    """Applies datapoints pushed by the Ayla datastream to Oekoboilers.
+
+    One subscription covers all devices of `oem_model`, events of
+    subscribed boilers update their properties as they arrive. If the
+    stream drops or stays silent for `receive_timeout` seconds, the client
+    reconnects with backoff (`reconnect`) using the same subscription. A
+    new one is only created if the stream rejects its key, the replaced
+    and (on close) the last subscription are deleted. After a reconnect
+    the subscribed boilers are polled once to fill the gap.
+    """
+
+    def __init__(
+        self,
+        service: AylaService,
+        oem_model: str,
+        host: str = STREAM_HOST,
+        reconnect: RetryPolicy = None,
+        receive_timeout: float = 90.0,
+    ) -> None:
+        self.service = service
+        self.oem_model = oem_model
+        self.host = host
+        self.reconnect = reconnect or RetryPolicy(base_delay=1, max_delay=60)
+        self.receive_timeout = receive_timeout
+
+        self.boilers: dict[str, Oekoboiler] = {}
+        self.connects = 0
+        self.events = 0
+        self.connected = asyncio.Event()
+        self.subscription: dict = None
+        self._task: asyncio.Task = None
+
+    def subscribe(self, boiler: Oekoboiler):
+        """apply pushed datapoints to the boiler"""
+        self.boilers[boiler.device_id] = boiler
+
+    def unsubscribe(self, boiler: Oekoboiler):
+        """stop applying datapoints to the boiler"""
+        self.boilers.pop(boiler.device_id, None)
+
+    def start(self):
+        """connect in the background (if not running)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """disconnect and delete the subscription"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self.connected.clear()
+        await self._delete_subscription()
+
+    async def _create_subscription(self) -> str:
+        """subscribes to datapoints, returns the stream key"""
+
+        headers = await self.service.get_json_header_with_token()
+        status, data = await self.service._send(
+            "POST",
+            f"{self.host}/api/v1/subscriptions.json",
+            idempotent=False,
+            json={
+                "subscription": {
+                    "oem_model": self.oem_model,
+                    "dsn": "*",
+                    "property_name": "*",
+                    "subscription_type": "datapoint",
+                    "client_type": "cloud",
+                    "name": "oekoboilerapi",
+                }
+            },
+            headers=headers,
+        )
+        if status >= 400:
+            raise RequestFailedError(data, status)
+        self.subscription = data["subscription"]
+        return self.subscription["stream_key"]
+
+    async def _delete_subscription(self):
+        """deletes the current subscription (if any), errors are logged"""
+
+        subscription, self.subscription = self.subscription, None
+        if subscription is None:
+            return
+        try:
+            headers = await self.service.get_json_header_with_token()
+            status, data = await self.service._send(
+                "DELETE",
+                f"{self.host}/api/v1/subscriptions/{subscription['id']}.json",
+                headers=headers,
+            )
+        except Exception as exc:  # the subscription expires on its own
+            _LOGGER.debug("deleting datastream subscription failed: %r", exc)
+            return
+        if status >= 400 and status != 404:
+            _LOGGER.debug(
+                "deleting datastream subscription failed: %s %s", status, data
+            )
+
+    async def _run(self):
+        failures = 0
+        while True:
+            try:
+                await self._stream()
+                failures = 0
+            except Exception as exc:  # reconnected after the backoff
+                failures += 1
+                _LOGGER.debug("datastream failed: %r", exc)
+            self.connected.clear()
+            await asyncio.sleep(self.reconnect.backoff(max(failures, 1)))
+
+    async def _connect(self):
+        """websocket of the stream, subscribes (again) if needed"""
+
+        if self.subscription is None:
+            await self._create_subscription()
+        else:
+            try:
+                return await self._ws_connect()
+            except WSServerHandshakeError as exc:
+                if exc.status not in (401, 403, 404):
+                    raise
+                # expired or deleted on the server, replace it
+                await self._delete_subscription()
+                await self._create_subscription()
+        return await self._ws_connect()
+
+    async def _ws_connect(self):
+        return await self.service.session.ws_connect(
+            f"{self.host}/stream",
+            params={"stream_key": self.subscription["stream_key"]},
+            timeout=ClientWSTimeout(ws_receive=self.receive_timeout),
+        )
+
+    async def _stream(self):
+        async with await self._connect() as ws:
+            self.connects += 1
+            self.connected.set()
+            if self.connects > 1:
+                await self._fill_gap()
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    break
+                self._handle(msg.data)
+
+    def _handle(self, message: str):
+        event = parse_message(message)
+        if event is None:
+            return
+        boiler = self.boilers.get(event.dsn)
+        if boiler is None:
+            return
+        self.events += 1
+        boiler.apply_datapoint(event.name, event.value, event.updated_at)
+
+    async def _fill_gap(self):
+        """poll all boilers for the changes missed while disconnected"""
+        poller = FleetPoller(self.service, list(self.boilers))
+        async for result in poller.poll():
+            boiler = self.boilers.get(result.dsn)
+            if result.ok and boiler is not None:
+                boiler.apply_properties(result.properties)
@@ -0,0 +1,192 @@
+"""Poll many Oekoboilers of one Ayla account at once"""
+import asyncio
+import time
+from collections.abc import AsyncIterator, Callable, Iterable
+from contextlib import nullcontext
+from dataclasses import dataclass
+
+from oekoboilerapi.aylaservice import AylaProperty, AylaService, PropertySet
+from oekoboilerapi.circuit import DeviceOfflineError
+from oekoboilerapi.oekoboiler import Oekoboiler
+from oekoboilerapi.ratelimit import RateLimiter
+from oekoboilerapi.scheduler import AdaptiveScheduler
+
+
+@dataclass
+class FleetResult:
+    """outcome of polling a single device"""
+
+    dsn: str
+    properties: list[AylaProperty] = None
+    error: BaseException = None
+    duration: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        """if the properties were fetched"""
+        return self.error is None
+
+
+class FleetPoller:
+    """Fetches the properties of many devices with bounded concurrency.
+
+    At most `concurrency` requests are in flight, each device gets
+    `timeout` seconds. A failing device never affects the others, its
+    error is reported in its FleetResult instead.
+
+    If the service has a rate limiter, devices are polled at its read rate
+    and the wait for the budget does not count towards `timeout`. Devices
+    the service's circuits know as offline are skipped, their results carry
+    a DeviceOfflineError.
+
+    `previous` returns the last properties of a dsn, unchanged properties
+    are reused from them (see AylaService.process_properties).
+    """
+
+    def __init__(
+        self,
+        service: AylaService,
+        dsns: Iterable[str],
+        concurrency: int = 64,
+        timeout: float = 10.0,
+        previous: Callable[[str], PropertySet] = None,
+    ) -> None:
+        self.service = service
+        self.dsns: list[str] = list(dsns)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.previous = previous
+
+    def poll_duration(self) -> float:
+        """least seconds a poll of all devices takes within the quota"""
+        limiter = self.service.rate_limiter
+        if limiter is None:
+            return 0.0
+        return limiter.time_for(RateLimiter.READ, len(self.dsns))
+
+    async def _fetch(self, dsn: str) -> FleetResult:
+        circuits = self.service.circuits
+        if circuits is not None and circuits.is_offline(dsn):
+            return FleetResult(dsn, error=DeviceOfflineError(dsn))
+
+        limiter = self.service.rate_limiter
+        budget = nullcontext()
+        if limiter is not None:
+            await limiter.acquire(RateLimiter.READ)
+            budget = limiter.prepaid(RateLimiter.READ)
+
+        start = time.perf_counter()
+        try:
+            async with asyncio.timeout(self.timeout):
+                with budget:
+                    if self.previous is None:
+                        props = await self.service.get_properties(dsn)
+                    else:
+                        props = await self.service.get_properties(
+                            dsn, previous=self.previous(dsn)
+                        )
+        except Exception as exc:
+            return FleetResult(
+                dsn, error=exc, duration=time.perf_counter() - start
+            )
+        return FleetResult(
+            dsn, properties=props, duration=time.perf_counter() - start
+        )
+
+    async def poll(
+        self, dsns: Iterable[str] = None
+    ) -> AsyncIterator[FleetResult]:
+        """poll all (or the given) devices, yields results as they complete"""
+
+        dsns = self.dsns if dsns is None else list(dsns)
+        if not dsns:
+            return
+
+        pending = iter(dsns)
+        results: asyncio.Queue[FleetResult] = asyncio.Queue()
+
+        async def worker():
+            for dsn in pending:
+                results.put_nowait(await self._fetch(dsn))
+
+        # make sure the token exists before the workers start
+        await self.service.get_token()
+
+        workers = [
+            asyncio.create_task(worker())
+            for _ in range(min(self.concurrency, len(dsns)))
+        ]
+        try:
+            for _ in range(len(dsns)):
+                yield await results.get()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def poll_all(self) -> dict[str, FleetResult]:
+        """poll all devices, returns results by dsn"""
+        return {result.dsn: result async for result in self.poll()}
+
+
+class Fleet:
+    """Oekoboilers of one account, updated together by a FleetPoller
+
+    With a scheduler only the devices it considers due are polled, idle
+    boilers are polled less often than active ones (see AdaptiveScheduler).
+    """
+
+    def __init__(
+        self,
+        service: AylaService,
+        dsns: Iterable[str],
+        concurrency: int = 64,
+        timeout: float = 10.0,
+        scheduler: AdaptiveScheduler = None,
+    ) -> None:
+        self.scheduler = scheduler
+        self.boilers: dict[str, Oekoboiler] = {
+            dsn: Oekoboiler(service, dsn, scheduler=scheduler) for dsn in dsns
+        }
+        self.poller = FleetPoller(
+            service,
+            self.boilers,
+            concurrency=concurrency,
+            timeout=timeout,
+            previous=lambda dsn: self.boilers[dsn].boiler_data,
+        )
+
+    def __getitem__(self, dsn: str) -> Oekoboiler:
+        return self.boilers[dsn]
+
+    def __iter__(self):
+        return iter(self.boilers.values())
+
+    def __len__(self) -> int:
+        return len(self.boilers)
+
+    async def updates(self) -> AsyncIterator[FleetResult]:
+        """update all (due) boilers, yields results as they complete"""
+        dsns = None
+        if self.scheduler is not None:
+            dsns = self.scheduler.due(self.boilers)
+        async for result in self.poller.poll(dsns):
+            if result.ok:
+                self.boilers[result.dsn].apply_properties(result.properties)
+            elif self.scheduler is not None:
+                self.scheduler.postpone(result.dsn)
+            yield result
+
+    def next_update(self) -> float:
+        """seconds until the next boiler is due (0 without scheduler)"""
+        if self.scheduler is None:
+            return 0.0
+        return self.scheduler.next_due(self.boilers)
+
+    async def async_update(self) -> dict[str, BaseException]:
+        """update all boilers, returns the errors of failed devices"""
+        return {
+            result.dsn: result.error
+            async for result in self.updates()
+            if not result.ok
+        }
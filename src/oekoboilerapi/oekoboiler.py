@@ -1,57 +1,500 @@
+import asyncio
+import logging
+import time
+import weakref
+from collections.abc import Callable, Iterable, Mapping
+from dataclasses import dataclass, replace
 from datetime import datetime, timedelta
+from typing import Any
 
-from oekoboilerapi.aylaservice import AylaService, AylaProperty
+from oekoboilerapi.acks import AckTracker
+from oekoboilerapi.aylaservice import (
+    AylaProperty,
+    AylaService,
+    PropertySet,
+    WriteResult,
+    decode_value,
+)
+from oekoboilerapi.changes import ChangeWatcher, PropertyChange, diff
+from oekoboilerapi.priorities import PollPriorities
+from oekoboilerapi.scheduler import AdaptiveScheduler
+from oekoboilerapi.status import BoilerStatus, StatusDecoder
+from oekoboilerapi.writequeue import WriteQueue
+
+_LOGGER = logging.getLogger(__name__)
+
+_NO_PROPERTIES = PropertySet()
+
+
+@dataclass(frozen=True, slots=True)
+class BoilerSnapshot:
+    """properties of a boiler as fetched at one point in time"""
+
+    properties: PropertySet
+    fetched_at: float
+
+    @property
+    def age(self) -> timedelta:
+        """time since the properties were fetched"""
+        return timedelta(seconds=time.monotonic() - self.fetched_at)
+
+
+@dataclass(frozen=True, slots=True)
+class PendingWrite:
+    """value written to a property, not yet confirmed by a poll"""
+
+    value: Any
+    written_at: float
+
+
+class DeviceState:
+    """state of one device, shared by all Oekoboilers for its dsn"""
+
+    def __init__(self, device_id: str) -> None:
+        self.device_id = device_id
+        self.snapshot: BoilerSnapshot = None
+        self.last_update: datetime = None
+        self.refresh_task: asyncio.Task = None
+        self.refresh_names: frozenset[str] = None
+        self.status_decoder = StatusDecoder()
+        self.write_queue: WriteQueue = None
+        self.pending_writes: dict[str, PendingWrite] = {}
+        self.listeners: list[Callable[[PropertyChange], None]] = []
+        self.watchers: weakref.WeakSet[ChangeWatcher] = weakref.WeakSet()
+
+
+class DeviceRegistry:
+    """hands out one DeviceState per dsn
+
+    States are only kept while an Oekoboiler uses them. By default every
+    AylaService gets its own registry (see for_service).
+    """
+
+    _registries: "weakref.WeakKeyDictionary[AylaService, DeviceRegistry]" = (
+        weakref.WeakKeyDictionary()
+    )
+
+    def __init__(self) -> None:
+        self._states: weakref.WeakValueDictionary[str, DeviceState] = (
+            weakref.WeakValueDictionary()
+        )
+
+    @classmethod
+    def for_service(cls, service: AylaService) -> "DeviceRegistry":
+        """default registry of the given service"""
+        registry = cls._registries.get(service)
+        if registry is None:
+            registry = cls._registries[service] = cls()
+        return registry
+
+    def get(self, device_id: str) -> DeviceState:
+        """state for the dsn, created on first use"""
+        state = self._states.get(device_id)
+        if state is None:
+            state = self._states[device_id] = DeviceState(device_id)
+        return state
 
 
 class Oekoboiler:
-    """represent an oekoboiler and its current state"""
+    """represent an oekoboiler and its current state
+
+    With stale_while_revalidate, async_update returns right away once data
+    was fetched and refreshes in the background, the new snapshot replaces
+    the old one as a whole when the refresh is done. Only if the snapshot
+    is older than max_staleness callers wait for the refresh.
+
+    Oekoboilers for the same dsn share their state through a
+    DeviceRegistry, concurrent updates of all of them result in one fetch
+    as long as the running fetch covers the requested properties.
+    Otherwise the missing fetch starts once the running one is done.
+
+    Values missing in the fetched properties are read from the F100 status
+    blob. With status_only, async_update fetches nothing but F100.
+
+    With write_delay, set_target_temp writes are debounced by a WriteQueue:
+    bursts are collapsed to the last value and sent after the delay.
+
+    Successful writes patch the snapshot right away (read your writes), the
+    patched property is marked pending until a poll reports the value, the
+    device acks it (see set_values with an AckTracker) or pending_timeout
+    has passed.
+
+    With a scheduler, async_update polls when the AdaptiveScheduler says
+    the device is due instead of every update_delay_min.
+
+    With priorities, async_update fetches only the properties whose
+    priority class is due (see PollPriorities): hot ones often by a
+    filtered fetch, all of them rarely by a full fetch.
+
+    Every new snapshot is compared with the previous one once (by key and
+    data_updated_at), only changed properties are passed to listeners
+    (add_listener) and watchers (watch).
+    """
 
     PROP_NAME_TEMP_CURRENT = "F103"
     PROP_NAME_TEMP_SET = "F11"
     PROP_NAME_TEMP_DELTA = "F12"
     PROP_NAME_ON_STATE = "F104"
+    PROP_NAME_STATUS = "F100"
 
-    def __init__(self, service: AylaService, device_id: str) -> None:
+    def __init__(
+        self,
+        service: AylaService,
+        device_id: str,
+        stale_while_revalidate: bool = False,
+        max_staleness: timedelta = timedelta(minutes=5),
+        registry: DeviceRegistry = None,
+        status_only: bool = False,
+        write_delay: timedelta = None,
+        ack_tracker: AckTracker = None,
+        scheduler: AdaptiveScheduler = None,
+        priorities: PollPriorities = None,
+    ) -> None:
         self.device_id = device_id
         self.service: AylaService = service
-        self.last_update: datetime = None
-        self.boiler_data: list[AylaProperty] = []
+        registry = registry or DeviceRegistry.for_service(service)
+        self.state: DeviceState = registry.get(device_id)
 
         self.update_delay_min: timedelta = timedelta(seconds=5)
+        self.stale_while_revalidate = stale_while_revalidate
+        self.max_staleness = max_staleness
+        self.status_only = status_only
+        self.write_delay = write_delay
+        self.ack_tracker = ack_tracker
+        self.scheduler = scheduler
+        self.priorities = priorities
+        self.pending_timeout: timedelta = timedelta(minutes=1)
+
+    @property
+    def snapshot(self) -> BoilerSnapshot:
+        """last fetched properties (shared with all boilers for the dsn)"""
+        return self.state.snapshot
+
+    @snapshot.setter
+    def snapshot(self, snapshot: BoilerSnapshot):
+        previous, self.state.snapshot = self.state.snapshot, snapshot
+        if self.state.listeners or self.state.watchers:
+            self._dispatch(
+                diff(
+                    self.device_id,
+                    previous.properties if previous else None,
+                    snapshot.properties,
+                )
+            )
+
+    def add_listener(
+        self, callback: Callable[[PropertyChange], None]
+    ) -> Callable[[], None]:
+        """calls back with every changed property, returns the remover"""
+        self.state.listeners.append(callback)
+
+        def remove():
+            if callback in self.state.listeners:
+                self.state.listeners.remove(callback)
+
+        return remove
+
+    def watch(self, maxsize: int = 100) -> ChangeWatcher:
+        """async iterator over changed properties
+
+        Keeps at most maxsize changes for a slow consumer (dropping the
+        oldest), close() it to end the iteration.
+        """
+        watcher = ChangeWatcher(maxsize)
+        self.state.watchers.add(watcher)
+        return watcher
+
+    def _dispatch(self, changes: list[PropertyChange]):
+        for change in changes:
+            for callback in list(self.state.listeners):
+                try:
+                    callback(change)
+                except Exception:  # a listener never breaks the update
+                    _LOGGER.exception("listener of %s failed", self.device_id)
+            for watcher in list(self.state.watchers):
+                watcher.put(change)
+
+    @property
+    def last_update(self) -> datetime:
+        """time of the last fetch, None forces a fetch"""
+        return self.state.last_update
+
+    @last_update.setter
+    def last_update(self, last_update: datetime):
+        self.state.last_update = last_update
+
+    @property
+    def write_queue(self) -> WriteQueue:
+        """debouncing write queue of the device (shared for the dsn)"""
+        if self.state.write_queue is None:
+            self.state.write_queue = WriteQueue(
+                self.service,
+                self.device_id,
+                delay=(self.write_delay or timedelta()).total_seconds(),
+                current_value=self.get_value,
+            )
+        return self.state.write_queue
+
+    @property
+    def boiler_data(self) -> PropertySet:
+        """properties of the current snapshot"""
+        if self.snapshot is None:
+            return _NO_PROPERTIES
+        return self.snapshot.properties
+
+    async def async_update(self, names: Iterable[str] = None):
+        """update current values from Ayla cloud
+
+        With names only the given properties are fetched and updated, all
+        others keep their last value.
+        """
+
+        if names is None and self.status_only:
+            names = [self.PROP_NAME_STATUS]
+
+        if self.last_update is not None and not self.is_due():
+            return
+
+        if names is None and self.priorities is not None:
+            names = self.priorities.due()
+            if names == []:
+                return
+
+        task = self._refresh_task(None if names is None else list(names))
+
+        if (
+            self.stale_while_revalidate
+            and self.snapshot is not None
+            and self.snapshot.age <= self.max_staleness
+        ):
+            return
+        await asyncio.shield(task)
+
+    def is_due(self) -> bool:
+        """if the next async_update fetches data"""
+        if self.last_update is None:
+            return True
+        if self.scheduler is not None:
+            return self.scheduler.is_due(self.device_id)
+        return self.last_update + self.update_delay_min < datetime.now()
+
+    def _refresh_task(self, names: list[str] = None) -> asyncio.Task:
+        """running fetch if it covers names, else a new one after it"""
+        running = self.state.refresh_task
+        if running is not None and not running.done():
+            covered = self.state.refresh_names
+            if covered is None or (
+                names is not None and covered.issuperset(names)
+            ):
+                return running
+        else:
+            running = None
+
+        task = asyncio.create_task(self._refresh(names, after=running))
+        task.add_done_callback(self._refresh_done)
+        self.state.refresh_task = task
+        self.state.refresh_names = None if names is None else frozenset(names)
+        return task
+
+    async def _refresh(
+        self, names: Iterable[str] = None, after: asyncio.Task = None
+    ):
+        if after is not None:
+            # snapshots are applied in the order the fetches were started
+            await asyncio.wait([after])
+        props = await self.service.get_properties(
+            self.device_id, names, previous=self.boiler_data
+        )
+        if names:
+            props = self.boiler_data.updated(props)
+        self.apply_properties(props)
+        if self.priorities is not None:
+            self.priorities.polled(names or None)
+
+    def _refresh_done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            _LOGGER.debug(
+                "refresh of %s failed: %r", self.device_id, task.exception()
+            )
 
-    async def async_update(self):
-        """update current values from Ayla cloud"""
+    def apply_properties(self, props: list[AylaProperty]):
+        """set properties fetched elsewhere (e.g. by a FleetPoller)"""
+        if not isinstance(props, PropertySet):
+            props = PropertySet(props)
+        if self.scheduler is not None:
+            self.scheduler.observe(self.device_id, props)
+        props = self._reapply_pending(props)
+        self.snapshot = BoilerSnapshot(props, time.monotonic())
+        self.last_update = datetime.now()
 
+    def apply_datapoint(
+        self, name: str, value: Any, updated_at: datetime = None
+    ) -> bool:
+        """sets a value pushed for a property (e.g. by a datastream)
+
+        Returns False if it was ignored: the property is unknown (it is
+        fetched with the next update then) or has newer data already.
+        """
+        prop = self.boiler_data.get(name)
+        if prop is None:
+            self.last_update = None
+            return False
         if (
-            self.last_update is None
-            or self.last_update + self.update_delay_min < datetime.now()
+            updated_at is not None
+            and prop.data_updated_at is not None
+            and updated_at < prop.data_updated_at
         ):
-            self.boiler_data.clear()
-            self.boiler_data: list[
-                AylaProperty
-            ] = await self.service.get_properties(self.device_id)
-            self.last_update = datetime.now()
+            return False
+
+        self.apply_properties(
+            self.boiler_data.updated(
+                [
+                    replace(
+                        prop,
+                        value=decode_value(prop.base_type, value),
+                        data_updated_at=updated_at or prop.data_updated_at,
+                        pending=False,
+                    )
+                ]
+            )
+        )
+        return True
+
+    def _reapply_pending(self, props: PropertySet) -> PropertySet:
+        """keeps written values until a poll confirms them"""
+        pending = self.state.pending_writes
+        if not pending:
+            return props
+
+        timeout = self.pending_timeout.total_seconds()
+        patched = []
+        for name, write in list(pending.items()):
+            prop = props.get(name)
+            if prop is None:
+                continue
+            if (
+                prop.value == write.value
+                or time.monotonic() - write.written_at > timeout
+            ):
+                del pending[name]
+            elif not prop.pending:
+                patched.append(replace(prop, value=write.value, pending=True))
+        return props.updated(patched) if patched else props
+
+    def _patch(self, name: str, value: Any):
+        """shows a written value before the next poll"""
+        prop = self.boiler_data.get(name)
+        if prop is None:
+            # nothing to patch, fetch the property with the next update
+            self.last_update = None
+            return
+
+        value = decode_value(prop.base_type, value)
+        self.state.pending_writes[name] = PendingWrite(value, time.monotonic())
+        self.snapshot = BoilerSnapshot(
+            self.boiler_data.updated(
+                [replace(prop, value=value, pending=True)]
+            ),
+            self.snapshot.fetched_at,
+        )
 
     async def set_target_temp(self, target_temp_c: int):
         """Sets the target temp in C°"""
-        self.last_update = None
+        target_temp_c = int(round(target_temp_c))
+
+        if self.write_delay is not None:
+            result = await self.write_queue.submit(
+                self.PROP_NAME_TEMP_SET, target_temp_c
+            )
+            if result is None:
+                return True
+            if result.ok:
+                self._patch(self.PROP_NAME_TEMP_SET, target_temp_c)
+            return result.ok
+
+        if self.boiler_data.get(self.PROP_NAME_TEMP_SET) is None:
+            results = await self.set_values(
+                {self.PROP_NAME_TEMP_SET: target_temp_c}
+            )
+            return results[self.PROP_NAME_TEMP_SET].ok
 
-        return await self.service.update_property_by_name(
+        success = await self.service.update_property_by_name(
             self.boiler_data,
             self.PROP_NAME_TEMP_SET,
-            int(round(target_temp_c)),
+            target_temp_c,
         )
+        if success:
+            self._patch(self.PROP_NAME_TEMP_SET, target_temp_c)
+        return success
+
+    def _confirm(self, name: str):
+        """marks a pending value as confirmed by the device"""
+        self.state.pending_writes.pop(name, None)
+        prop = self.boiler_data.get(name)
+        if prop is not None and prop.pending:
+            self.snapshot = BoilerSnapshot(
+                self.boiler_data.updated([replace(prop, pending=False)]),
+                self.snapshot.fetched_at,
+            )
+
+    def _reject(self, name: str):
+        """drops a pending value the device refused, refetches it next"""
+        self.state.pending_writes.pop(name, None)
+        self.last_update = None
+
+    async def set_values(
+        self, values: Mapping[str, Any], wait_for_ack: bool = False
+    ) -> dict[str, WriteResult]:
+        """Sets several properties by name in one request
+
+        With wait_for_ack (requires an ack_tracker) the results carry the
+        device acknowledgment of their datapoint. Values the device rejects
+        stay pending only until the next update, which fetches right away.
+        """
+        results = await self.service.update_properties(self.device_id, values)
+        for name, result in results.items():
+            if result.ok:
+                self._patch(name, result.value)
+
+        if wait_for_ack:
+            if self.ack_tracker is None:
+                raise ValueError("wait_for_ack requires an ack_tracker")
+            acked = await asyncio.gather(
+                *(self.ack_tracker.wait_for(res) for res in results.values())
+            )
+            results = {result.name: result for result in acked}
+            for name, result in results.items():
+                if result.ack is None:
+                    continue
+                if result.ack.acked:
+                    self._confirm(name)
+                elif result.ack.rejected:
+                    self._reject(name)
+        return results
+
+    @property
+    def status(self) -> BoilerStatus:
+        """decoded F100 status blob (None if not fetched)"""
+        return self.state.status_decoder.decode(
+            self.boiler_data.get(self.PROP_NAME_STATUS)
+        )
+
+    def get_value(self, name: str):
+        """value of a property, falls back to the F100 status blob"""
+        prop = self.boiler_data.get(name)
+        if prop is not None:
+            return prop.value
+        status = self.status
+        if status is None or name.removeprefix("F") not in status.values:
+            raise KeyError(name)
+        return status.get(name)
 
     @property
     def temp_c_current(self):
         """Returns the current water temp in C°"""
-        return self.service.get_property_by_name(
-            self.boiler_data, Oekoboiler.PROP_NAME_TEMP_CURRENT
-        ).value
+        return self.get_value(Oekoboiler.PROP_NAME_TEMP_CURRENT)
 
     @property
     def temp_c_set(self):
         """Returns the current set temp in C°"""
-        return self.service.get_property_by_name(
-            self.boiler_data, Oekoboiler.PROP_NAME_TEMP_SET
-        ).value
+        return self.get_value(Oekoboiler.PROP_NAME_TEMP_SET)
@@ -0,0 +1,73 @@
+"""Poll priorities per property"""
+import time
+from collections.abc import Iterable, Mapping
+from datetime import timedelta
+
+HOT = "hot"
+WARM = "warm"
+COLD = "cold"
+
+DEFAULT_INTERVALS = {
+    HOT: timedelta(seconds=30),
+    WARM: timedelta(minutes=5),
+    COLD: timedelta(hours=1),
+}
+
+
+class PollPriorities:
+    """Poll intervals by priority class of the properties of one device.
+
+    Each property name maps to a class (hot, warm, cold or own classes
+    given with their intervals). A class is fetched whenever its interval
+    has passed, with a filtered fetch of just its properties. Properties
+    without a class belong to `default`; when it is due, one full fetch
+    refreshes all properties at once.
+    """
+
+    def __init__(
+        self,
+        priorities: Mapping[str, str],
+        intervals: Mapping[str, timedelta] = None,
+        default: str = COLD,
+    ) -> None:
+        self.priorities = dict(priorities)
+        self.intervals = {**DEFAULT_INTERVALS, **(intervals or {})}
+        self.default = default
+        unknown = {default, *self.priorities.values()} - set(self.intervals)
+        if unknown:
+            raise ValueError(f"no interval for priority {sorted(unknown)}")
+        self._polled_at: dict[str, float] = {}
+
+    def _is_due(self, priority: str, now: float) -> bool:
+        polled_at = self._polled_at.get(priority)
+        return (
+            polled_at is None
+            or now - polled_at >= self.intervals[priority].total_seconds()
+        )
+
+    def due(self, now: float = None) -> list[str]:
+        """names to fetch, None for a full fetch and [] if nothing is due"""
+
+        if now is None:
+            now = time.monotonic()
+        if self._is_due(self.default, now):
+            return None
+        return [
+            name
+            for name, priority in self.priorities.items()
+            if priority != self.default and self._is_due(priority, now)
+        ]
+
+    def polled(self, names: Iterable[str] = None, now: float = None):
+        """marks the classes of fetched names (all if None) as polled"""
+
+        if now is None:
+            now = time.monotonic()
+        if names is None:
+            priorities = set(self.intervals)
+        else:
+            priorities = {
+                self.priorities.get(name, self.default) for name in names
+            }
+        for priority in priorities:
+            self._polled_at[priority] = now
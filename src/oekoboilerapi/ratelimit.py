@@ -0,0 +1,178 @@
+"""Client side rate limits for requests to Ayla cloud"""
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+# names of buckets whose next request in this context is already paid for
+_PREPAID: ContextVar[list] = ContextVar("prepaid", default=None)
+
+
+@dataclass
+class BucketStats:
+    """state and counters of a TokenBucket"""
+
+    rate: float
+    capacity: float
+    tokens: float
+    waiting: int
+    max_waiting: int
+    acquired: int
+    wait_time: float
+
+
+class TokenBucket:
+    """async token bucket refilled with `rate` tokens per second
+
+    Holds at most `capacity` tokens (the burst size), callers waiting for a
+    token are served in order.
+    """
+
+    def __init__(self, rate: float, capacity: float = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+        self.waiting = 0
+        self.max_waiting = 0
+        self.acquired = 0
+        self.wait_time = 0.0
+
+    def _refill(self, now: float):
+        if now > self._updated:
+            self._tokens = min(
+                self.capacity,
+                self._tokens + (now - self._updated) * self.rate,
+            )
+            self._updated = now
+
+    def _delay(self, now: float) -> float:
+        """seconds until a token is available"""
+        self._refill(now)
+        if self._tokens >= 1:
+            return 0.0
+        return (self._updated - now) + (1 - self._tokens) / self.rate
+
+    async def acquire(self):
+        """waits for a token and takes it"""
+
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        start = time.monotonic()
+        try:
+            async with self._lock:
+                while (delay := self._delay(time.monotonic())) > 0:
+                    await asyncio.sleep(delay)
+                self._tokens -= 1
+                self.acquired += 1
+        finally:
+            self.waiting -= 1
+            self.wait_time += time.monotonic() - start
+
+    def pause(self, seconds: float):
+        """hand out no tokens for the given time (e.g. after a 429)"""
+        now = time.monotonic()
+        self._refill(now)
+        self._tokens = min(self._tokens, 0.0)
+        self._updated = max(self._updated, now + seconds)
+
+    def time_for(self, requests: int) -> float:
+        """seconds needed to hand out tokens for the given requests"""
+        now = time.monotonic()
+        self._refill(now)
+        missing = requests + self.waiting - self._tokens
+        return max(0.0, self._updated - now) + max(0.0, missing / self.rate)
+
+    def stats(self) -> BucketStats:
+        """current state and counters"""
+        self._refill(time.monotonic())
+        return BucketStats(
+            rate=self.rate,
+            capacity=self.capacity,
+            tokens=self._tokens,
+            waiting=self.waiting,
+            max_waiting=self.max_waiting,
+            acquired=self.acquired,
+            wait_time=self.wait_time,
+        )
+
+
+@dataclass
+class RateLimits:
+    """Requests per second and burst sizes of the rate limiter.
+
+    auth covers the user service (sign in and token refresh), read and write
+    the GETs and the other requests (datapoints) of the ads service. Ayla
+    does not publish its quotas, tune them to your account.
+    """
+
+    auth_rate: float = 0.5
+    auth_burst: float = 3
+    read_rate: float = 10.0
+    read_burst: float = 20
+    write_rate: float = 2.0
+    write_burst: float = 10
+
+
+class RateLimiter:
+    """token buckets for the auth host and reads and writes of ads host"""
+
+    AUTH = "auth"
+    READ = "read"
+    WRITE = "write"
+
+    def __init__(self, limits: RateLimits = None) -> None:
+        limits = limits or RateLimits()
+        self.buckets: dict[str, TokenBucket] = {
+            self.AUTH: TokenBucket(limits.auth_rate, limits.auth_burst),
+            self.READ: TokenBucket(limits.read_rate, limits.read_burst),
+            self.WRITE: TokenBucket(limits.write_rate, limits.write_burst),
+        }
+
+    @classmethod
+    def bucket_name(cls, auth_host: bool, method: str) -> str:
+        """bucket of a request to the auth or ads host"""
+        if auth_host:
+            return cls.AUTH
+        return cls.READ if method == "GET" else cls.WRITE
+
+    async def acquire(self, name: str):
+        """waits for a token of the named bucket"""
+        await self.buckets[name].acquire()
+
+    @contextmanager
+    def prepaid(self, name: str):
+        """the next request of the named bucket in this context was paid
+
+        For callers that acquire() first, e.g. to keep the wait for a token
+        out of their own timeout.
+        """
+        token = _PREPAID.set([*(_PREPAID.get() or ()), name])
+        try:
+            yield
+        finally:
+            _PREPAID.reset(token)
+
+    async def throttle(self, auth_host: bool, method: str):
+        """waits until a request may be sent"""
+        name = self.bucket_name(auth_host, method)
+        prepaid = _PREPAID.get()
+        if prepaid and name in prepaid:
+            prepaid.remove(name)
+            return
+        await self.acquire(name)
+
+    def pause(self, name: str, seconds: float):
+        """stop sending requests of the named bucket for a while"""
+        self.buckets[name].pause(seconds)
+
+    def time_for(self, name: str, requests: int) -> float:
+        """seconds the named bucket needs for the given requests"""
+        return self.buckets[name].time_for(requests)
+
+    def stats(self) -> dict[str, BucketStats]:
+        """state and queue depth of all buckets"""
+        return {name: bucket.stats() for name, bucket in self.buckets.items()}
@@ -0,0 +1,82 @@
+"""Retry policy for requests to Ayla cloud"""
+import random
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from aiohttp import ClientConnectorError
+
+
+def parse_retry_after(value: str) -> float:
+    """seconds to wait according to a Retry-After header (None if unset)
+
+    Accepts delay seconds as well as an HTTP date.
+    """
+
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+@dataclass
+class RetryPolicy:
+    """How failed requests are retried.
+
+    Retries wait an exponential backoff with full jitter, or longer if the
+    server asks for it with Retry-After. All attempts of one request share
+    the `deadline` budget (seconds). Requests that are not idempotent (new
+    datapoints) are only retried if the server surely did not process them
+    (connection not established, 429) unless retry_writes is set.
+    """
+
+    attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+    deadline: float = 60.0
+    retry_statuses: frozenset[int] = frozenset({429, 500, 502, 503, 504})
+    retry_writes: bool = False
+
+    def backoff(self, attempt: int) -> float:
+        """random delay before the given retry (1 = first retry)"""
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        )
+
+    def retry_delay(
+        self,
+        attempt: int,
+        idempotent: bool,
+        status: int = None,
+        exc: BaseException = None,
+        retry_after: float = None,
+    ) -> float:
+        """delay before the next attempt, None if it must not be retried"""
+
+        if attempt >= self.attempts:
+            return None
+        if exc is not None:
+            safe = isinstance(exc, ClientConnectorError)
+        elif status in self.retry_statuses:
+            safe = status == 429
+        else:
+            return None
+        if not (safe or idempotent or self.retry_writes):
+            return None
+
+        delay = self.backoff(attempt)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+NO_RETRY = RetryPolicy(attempts=1)
@@ -0,0 +1,165 @@
+"""Adaptive poll intervals learned from data_updated_at"""
+import time
+from collections.abc import Iterable
+from datetime import datetime
+
+from oekoboilerapi.aylaservice import AylaProperty
+
+
+def last_change(props: Iterable[AylaProperty]) -> datetime:
+    """newest data_updated_at of the properties (None if there is none)"""
+    return max(
+        (prop.data_updated_at for prop in props if prop.data_updated_at),
+        default=None,
+    )
+
+
+class AdaptiveInterval:
+    """Poll interval of one device, adapted to how often its data changes.
+
+    The time between observed changes is averaged (EWMA with `alpha`), the
+    device is polled twice per average period. Polls without a change back
+    the interval off by `backoff`. The interval stays within min_interval
+    and max_interval, so data is never staler than max_interval.
+
+    A change after several polls without one (or, before a period is
+    known, after more than two max_intervals) ends an idle phase. Its gap
+    is not averaged in: the interval is reset to min_interval and the
+    period is learned again from the next change.
+    """
+
+    __slots__ = (
+        "min_interval",
+        "max_interval",
+        "backoff",
+        "alpha",
+        "interval",
+        "period",
+        "changed_at",
+        "idle_polls",
+        "next_poll",
+    )
+
+    def __init__(
+        self,
+        min_interval: float = 5.0,
+        max_interval: float = 600.0,
+        backoff: float = 2.0,
+        alpha: float = 0.3,
+    ) -> None:
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.alpha = alpha
+        self.interval = min_interval
+        self.period: float = None
+        self.changed_at: datetime = None
+        self.idle_polls = 0
+        self.next_poll = 0.0
+
+    def observe(self, changed_at: datetime, now: float = None) -> float:
+        """takes the newest data_updated_at of a poll, returns the interval"""
+
+        if now is None:
+            now = time.monotonic()
+
+        if changed_at is not None and (
+            self.changed_at is None or changed_at > self.changed_at
+        ):
+            if self.changed_at is not None:
+                delta = (changed_at - self.changed_at).total_seconds()
+                if self._was_idle(delta):
+                    self.period = None
+                    self.interval = self.min_interval
+                elif self.period is None:
+                    self.period = delta
+                else:
+                    self.period = (
+                        self.alpha * delta + (1 - self.alpha) * self.period
+                    )
+                if self.period is not None:
+                    self.interval = self.period / 2
+            self.changed_at = changed_at
+            self.idle_polls = 0
+        else:
+            self.idle_polls += 1
+            self.interval *= self.backoff
+
+        self.interval = min(
+            self.max_interval, max(self.min_interval, self.interval)
+        )
+        self.next_poll = now + self.interval
+        return self.interval
+
+    def _was_idle(self, delta: float) -> bool:
+        """if the gap to the previous change includes an idle phase"""
+        if self.period is None:
+            return delta >= 2 * self.max_interval
+        return self.idle_polls > 1
+
+    def postpone(self, now: float = None):
+        """poll again after the current interval (e.g. after an error)"""
+        if now is None:
+            now = time.monotonic()
+        self.next_poll = now + self.interval
+
+    def is_due(self, now: float = None) -> bool:
+        """if the device should be polled"""
+        if now is None:
+            now = time.monotonic()
+        return self.next_poll <= now
+
+
+class AdaptiveScheduler:
+    """adaptive poll intervals of many devices (see AdaptiveInterval)"""
+
+    def __init__(
+        self,
+        min_interval: float = 5.0,
+        max_interval: float = 600.0,
+        backoff: float = 2.0,
+        alpha: float = 0.3,
+    ) -> None:
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.alpha = alpha
+        self.intervals: dict[str, AdaptiveInterval] = {}
+
+    def interval(self, dsn: str) -> AdaptiveInterval:
+        """interval of a device, created on first use"""
+        interval = self.intervals.get(dsn)
+        if interval is None:
+            interval = self.intervals[dsn] = AdaptiveInterval(
+                self.min_interval, self.max_interval, self.backoff, self.alpha
+            )
+        return interval
+
+    def observe(self, dsn: str, props: Iterable[AylaProperty]) -> float:
+        """takes the properties of a poll, returns the next interval"""
+        return self.interval(dsn).observe(last_change(props))
+
+    def postpone(self, dsn: str):
+        """poll the device again after its current interval"""
+        self.interval(dsn).postpone()
+
+    def is_due(self, dsn: str) -> bool:
+        """if the device should be polled"""
+        return self.interval(dsn).is_due()
+
+    def due(self, dsns: Iterable[str]) -> list[str]:
+        """the given devices that should be polled"""
+        now = time.monotonic()
+        return [dsn for dsn in dsns if self.interval(dsn).is_due(now)]
+
+    def next_due(self, dsns: Iterable[str]) -> float:
+        """seconds until the next of the given devices is due"""
+        now = time.monotonic()
+        return max(
+            0.0,
+            min(
+                (self.interval(dsn).next_poll for dsn in dsns),
+                default=now,
+            )
+            - now,
+        )
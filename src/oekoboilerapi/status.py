@@ -0,0 +1,92 @@
+"""Decoder for the F100 (F100_FSTS) status blob of the Oekoboiler
+
+F100 is a JSON object with the values of most other properties, keyed by
+their number without the "F" ("103" is F103, the current temperature).
+One read of F100 therefore replaces many single property reads.
+
+The device appends updated fields to the blob, so keys may appear more
+than once (e.g. "103":53,...,"103":54). The last occurrence is the newest
+value and wins, which is also how json.loads treats duplicate keys.
+"""
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from types import MappingProxyType
+from typing import Any, Mapping
+
+from oekoboilerapi.aylaservice import AylaProperty
+
+
+def _int(value: Any) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass(frozen=True, slots=True)
+class BoilerStatus:
+    """typed view of a decoded F100 blob"""
+
+    temp_c_current: int
+    temp_c_set: int
+    temp_c_delta: int
+    on_state: bool
+    schedule: tuple[str, ...]
+    clock: str
+    values: Mapping[str, Any]
+    updated_at: datetime
+
+    def get(self, prop_name: str, default=None) -> Any:
+        """raw value for a property name like "F103" (or "103")"""
+        return self.values.get(prop_name.removeprefix("F"), default)
+
+
+def decode_status(raw: str, updated_at: datetime = None) -> BoilerStatus:
+    """decodes the F100 blob, None if it is not a JSON object"""
+
+    try:
+        values = json.loads(raw)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(values, dict):
+        return None
+
+    on_state = _int(values.get("104"))
+    return BoilerStatus(
+        temp_c_current=_int(values.get("103")),
+        temp_c_set=_int(values.get("11")),
+        temp_c_delta=_int(values.get("12")),
+        on_state=None if on_state is None else bool(on_state),
+        schedule=tuple(
+            values[key] for key in ("107", "108", "109") if key in values
+        ),
+        clock=values.get("111"),
+        values=MappingProxyType(values),
+        updated_at=updated_at,
+    )
+
+
+class StatusDecoder:
+    """decodes F100 of one device, parsing only when it changed
+
+    The result is cached by data_updated_at and raw value: values patched
+    by writes or pushed datapoints can keep the timestamp.
+    """
+
+    __slots__ = ("_cache_key", "_status")
+
+    def __init__(self) -> None:
+        self._cache_key = None
+        self._status: BoilerStatus = None
+
+    def decode(self, prop: AylaProperty) -> BoilerStatus:
+        """decoded status of the given F100 property (None if empty)"""
+
+        if prop is None or prop.value is None:
+            return None
+        cache_key = (prop.data_updated_at, prop.value)
+        if cache_key != self._cache_key:
+            self._status = decode_status(prop.value, prop.data_updated_at)
+            self._cache_key = cache_key
+        return self._status
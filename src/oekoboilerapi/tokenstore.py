@@ -0,0 +1,151 @@
+"""Token stores to reuse Ayla access tokens across process restarts"""
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+from oekoboilerapi.aylaservice import AccessToken
+from oekoboilerapi.jsonfile import write_json_atomic
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+
+class TokenStore(ABC):
+    """Base class for token stores.
+
+    Tokens are stored per key (see AylaService.token_store_key). lock()
+    guards a whole load/renew/save cycle, implementations shared between
+    processes have to lock across processes as well.
+    """
+
+    def __init__(self) -> None:
+        self._thread_lock = threading.Lock()
+
+    @abstractmethod
+    def load(self, key: str) -> AccessToken | None:
+        """returns the stored token for key (if any)"""
+
+    @abstractmethod
+    def save(self, key: str, token: AccessToken) -> None:
+        """stores the token for key"""
+
+    @contextmanager
+    def lock(self, key: str):
+        """exclusive access to the store while renewing a token"""
+        with self._thread_lock:
+            yield
+
+
+class MemoryTokenStore(TokenStore):
+    """keeps tokens in memory, e.g. to share them between services"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._tokens: dict[str, dict] = {}
+
+    def load(self, key: str) -> AccessToken | None:
+        data = self._tokens.get(key)
+        return AccessToken.from_dict(data) if data else None
+
+    def save(self, key: str, token: AccessToken) -> None:
+        self._tokens[key] = token.to_dict()
+
+
+class _FileLock:
+    """advisory lock on a file, shared between processes on one host"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    @contextmanager
+    def locked(self):
+        """holds the lock (no-op where fcntl is not available)"""
+        with open(self.path, "a+", encoding="utf-8") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class FileTokenStore(TokenStore):
+    """keeps tokens in a JSON file, written atomically"""
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self.path = path
+        self._file_lock = _FileLock(f"{path}.lock")
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def load(self, key: str) -> AccessToken | None:
+        data = self._read().get(key)
+        return AccessToken.from_dict(data) if data else None
+
+    def save(self, key: str, token: AccessToken) -> None:
+        tokens = self._read()
+        tokens[key] = token.to_dict()
+        write_json_atomic(self.path, tokens)
+
+    @contextmanager
+    def lock(self, key: str):
+        with self._thread_lock, self._file_lock.locked():
+            yield
+
+
+class SqliteTokenStore(TokenStore):
+    """keeps tokens in a SQLite database"""
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self.path = path
+        self._file_lock = _FileLock(f"{path}.lock")
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS tokens "
+                    "(key TEXT PRIMARY KEY, token TEXT NOT NULL)"
+                )
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def load(self, key: str) -> AccessToken | None:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT token FROM tokens WHERE key = ?", (key,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return AccessToken.from_dict(json.loads(row[0])) if row else None
+
+    def save(self, key: str, token: AccessToken) -> None:
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO tokens (key, token) VALUES (?, ?)",
+                    (key, json.dumps(token.to_dict())),
+                )
+        finally:
+            conn.close()
+
+    @contextmanager
+    def lock(self, key: str):
+        with self._thread_lock, self._file_lock.locked():
+            yield
@@ -0,0 +1,129 @@
+"""Debounced writes of property values"""
+import asyncio
+from collections.abc import Callable, Iterable
+from typing import Any
+
+from oekoboilerapi.aylaservice import AylaService, WriteResult
+
+
+class WriteQueue:
+    """Collects the writes of one device and sends them debounced.
+
+    Writes are sent `delay` seconds after the first write of a burst, all
+    properties of the burst in one batch request. Only the last value per
+    property is sent (last write wins), sends run one after the other. A
+    write is dropped if its value is the one the device will have: the
+    value being sent for the property, else the one the device reports
+    (according to current_value, which raises KeyError for unknown
+    properties).
+
+    submit() returns a future resolving to the WriteResult once the value
+    was sent, or None if nothing had to be sent.
+    """
+
+    def __init__(
+        self,
+        service: AylaService,
+        dsn: str,
+        delay: float = 0.5,
+        current_value: Callable[[str], Any] = None,
+    ) -> None:
+        self.service = service
+        self.dsn = dsn
+        self.delay = delay
+        self.current_value = current_value
+
+        self._pending: dict[str, tuple[Any, list[asyncio.Future]]] = {}
+        self._timer: asyncio.TimerHandle = None
+        self._sending: set[asyncio.Task] = set()
+        self._send_lock = asyncio.Lock()
+        self._in_flight: dict[str, tuple[Any, object]] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def _is_current(self, name: str, value: Any) -> bool:
+        if name in self._in_flight:
+            return self._in_flight[name][0] == value
+        if self.current_value is None:
+            return False
+        try:
+            return self.current_value(name) == value
+        except KeyError:
+            return False
+
+    def submit(self, name: str, value: Any) -> asyncio.Future:
+        """queue a write, replacing a queued write of the same property"""
+
+        future = asyncio.get_running_loop().create_future()
+        _, futures = self._pending.pop(name, (None, []))
+        futures.append(future)
+
+        if self._is_current(name, value):
+            for waiting in futures:
+                if not waiting.done():
+                    waiting.set_result(None)
+            return future
+
+        self._pending[name] = (value, futures)
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.delay, self._send_later
+            )
+        return future
+
+    def _send_later(self):
+        self._timer = None
+        task = asyncio.create_task(self._send())
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def flush(self):
+        """send queued writes right away"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self._send()
+
+    def _sent(self, names: Iterable[str], token: object):
+        for name in names:
+            if self._in_flight.get(name, (None, None))[1] is token:
+                del self._in_flight[name]
+
+    async def _send(self):
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        token = object()
+        for name, (value, _) in pending.items():
+            self._in_flight[name] = (value, token)
+        error = None
+        try:
+            async with self._send_lock:
+                results: dict[str, WriteResult] = (
+                    await self.service.update_properties(
+                        self.dsn,
+                        {name: value for name, (value, _) in pending.items()},
+                    )
+                )
+        except Exception as exc:
+            error = exc
+        except BaseException:
+            self._sent(pending, token)
+            raise
+
+        for name, (value, futures) in pending.items():
+            for future in futures:
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(
+                        results.get(name)
+                        or WriteResult(self.dsn, name, value, 0)
+                    )
+        # writers waiting for the futures patch their snapshot when they
+        # wake up, the sent values count until then
+        asyncio.get_running_loop().call_soon(self._sent, pending, token)
@@ -0,0 +1,275 @@
+"""Local stand-in for the Ayla cloud used by tests and benchmarks"""
+import json
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from tests import utils
+
+
+class MockAylaServer:
+    """serves sign-in, device and property endpoints on localhost
+
+    Usage:
+        async with MockAylaServer() as server:
+            service = AylaService(creds, host=server.user_host,
+                                  ads_host=server.ads_host)
+
+    Faults added with inject() answer the next requests of a route instead
+    of its handler, e.g. to test retries.
+    """
+
+    def __init__(self, properties: list = None) -> None:
+        self.properties = properties or utils.mocked_water_heater_properties(
+            22, 60, 4, 1
+        )
+        self.devices: dict[str, str] = {}
+        self.calls: Counter = Counter()
+        self.connections: set[tuple] = set()
+        self.token_counter = 0
+        self.datapoints: list[tuple[str, str, str]] = []
+        self.rejected_names: set[str] = set()
+        self.acking_names: set[str] = set()
+        self.properties_bytes = 0
+        self._properties_bodies: dict[tuple, str] = {}
+        self._faults: dict[str, deque] = {}
+        self.subscriptions: list[dict] = []
+        self.subscription_counter = 0
+        self.streams: set[web.WebSocketResponse] = set()
+        self.stream_seq = 0
+
+        app = web.Application(middlewares=[self._track])
+        app.router.add_post("/users/sign_in.json", self._sign_in)
+        app.router.add_post("/users/refresh_token.json", self._refresh)
+        app.router.add_get("/apiv1/devices", self._devices)
+        app.router.add_get("/apiv1/dsns/{dsn}/properties", self._properties)
+        app.router.add_post(
+            "/apiv1/properties/{key}/datapoints", self._datapoint
+        )
+        app.router.add_post(
+            "/apiv1/batch_datapoints.json", self._batch_datapoints
+        )
+        app.router.add_post("/api/v1/subscriptions.json", self._subscribe)
+        app.router.add_delete(
+            "/api/v1/subscriptions/{id}.json", self._unsubscribe
+        )
+        app.router.add_get("/stream", self._stream)
+        self.app = app
+        self.server: TestServer = None
+
+    async def __aenter__(self) -> "MockAylaServer":
+        self.server = TestServer(self.app)
+        await self.server.start_server()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.drop_streams()
+        await self.server.close()
+
+    @property
+    def user_host(self) -> str:
+        """base url replacing https://user-field-eu.aylanetworks.com"""
+        return str(self.server.make_url("")).rstrip("/")
+
+    @property
+    def ads_host(self) -> str:
+        """base url replacing https://ads-eu.aylanetworks.com/apiv1"""
+        return str(self.server.make_url("/apiv1"))
+
+    def inject(
+        self,
+        route: str,
+        status: int = 503,
+        headers: dict = None,
+        times: int = 1,
+        disconnect: bool = False,
+    ):
+        """answer the next `times` requests of a route with an error
+
+        The route is the canonical one as counted in calls, with disconnect
+        the connection is dropped without an answer.
+        """
+        self._faults.setdefault(route, deque()).extend(
+            [(status, headers, disconnect)] * times
+        )
+
+    @web.middleware
+    async def _track(self, request: web.Request, handler):
+        self.connections.add(request.transport.get_extra_info("peername"))
+        route = request.match_info.route.resource.canonical
+        self.calls[route] += 1
+        faults = self._faults.get(route)
+        if faults:
+            status, headers, disconnect = faults.popleft()
+            if disconnect:
+                request.transport.close()
+            return web.json_response(
+                {"error": "injected"}, status=status, headers=headers
+            )
+        return await handler(request)
+
+    def _new_token(self) -> dict:
+        self.token_counter += 1
+        return utils.mocked_login_answer(
+            f"token_{self.token_counter}", f"refresh_{self.token_counter}"
+        )
+
+    async def _sign_in(self, _request: web.Request) -> web.Response:
+        return web.json_response(self._new_token())
+
+    async def _refresh(self, _request: web.Request) -> web.Response:
+        return web.json_response(self._new_token())
+
+    async def _devices(self, _request: web.Request) -> web.Response:
+        return web.json_response(
+            [
+                {"device": {"dsn": dsn, "connection_status": status}}
+                for dsn, status in self.devices.items()
+            ]
+        )
+
+    async def _properties(self, request: web.Request) -> web.Response:
+        names = tuple(request.query.getall("names[]", ()))
+        body = self._properties_bodies.get(names)
+        if body is None:
+            props = self.properties
+            if names:
+                props = [
+                    prop
+                    for prop in props
+                    if prop["property"]["name"] in names
+                ]
+            body = self._properties_bodies[names] = json.dumps(props)
+        self.properties_bytes += len(body)
+        return web.Response(text=body, content_type="application/json")
+
+    async def _batch_datapoints(self, request: web.Request) -> web.Response:
+        answers = []
+        for write in (await request.json())["batch_datapoints"]:
+            dsn, name = write["dsn"], write["name"]
+            if name in self.rejected_names:
+                answers.append(
+                    {"dsn": dsn, "name": name, "status": 422, "errors": {}}
+                )
+                continue
+            self.datapoints.append((dsn, name, write["datapoint"]["value"]))
+            created = datetime.now(timezone.utc)
+            now = created.strftime("%Y-%m-%dT%H:%M:%SZ")
+            if name in self.acking_names:
+                self._ack(
+                    name,
+                    write["datapoint"]["value"],
+                    (created + timedelta(seconds=1)).strftime(
+                        "%Y-%m-%dT%H:%M:%SZ"
+                    ),
+                )
+            answers.append(
+                {
+                    "dsn": dsn,
+                    "name": name,
+                    "status": 201,
+                    "datapoint": {
+                        "id": f"dp_{len(self.datapoints)}",
+                        "value": write["datapoint"]["value"],
+                        "created_at": now,
+                    },
+                }
+            )
+        return web.json_response(answers, status=207)
+
+    def set_value(self, name: str, value, updated_at: str = None) -> str:
+        """changes a property as if the device reported a new value"""
+        updated_at = updated_at or datetime.now(timezone.utc).strftime(
+            "%Y-%m-%dT%H:%M:%SZ"
+        )
+        for prop in self.properties:
+            if prop["property"]["name"] == name:
+                prop["property"].update(
+                    value=value, data_updated_at=updated_at
+                )
+        self._properties_bodies.clear()
+        return updated_at
+
+    async def push(self, dsn: str, name: str, value, updated_at: str = None):
+        """changes a property and sends the datapoint to all streams"""
+        updated_at = self.set_value(name, value, updated_at)
+        self.stream_seq += 1
+        payload = json.dumps(
+            {
+                "seq": str(self.stream_seq),
+                "metadata": {
+                    "dsn": dsn,
+                    "property_name": name,
+                    "event_type": "datapoint",
+                },
+                "datapoint": {"value": value, "updated_at": updated_at},
+            }
+        )
+        for ws in list(self.streams):
+            await ws.send_str(f"{len(payload)}|{payload}")
+
+    async def heartbeat(self):
+        """sends a heartbeat to all streams"""
+        for ws in list(self.streams):
+            await ws.send_str("1|Z")
+
+    async def drop_streams(self):
+        """closes all stream connections"""
+        for ws in list(self.streams):
+            await ws.close()
+
+    async def _subscribe(self, request: web.Request) -> web.Response:
+        subscription = (await request.json())["subscription"]
+        self.subscription_counter += 1
+        subscription.update(
+            id=self.subscription_counter,
+            stream_key=f"stream_{self.subscription_counter}",
+        )
+        self.subscriptions.append(subscription)
+        return web.json_response({"subscription": subscription}, status=201)
+
+    async def _unsubscribe(self, request: web.Request) -> web.Response:
+        sub_id = int(request.match_info["id"])
+        for subscription in self.subscriptions:
+            if subscription["id"] == sub_id:
+                self.subscriptions.remove(subscription)
+                return web.json_response({}, status=200)
+        raise web.HTTPNotFound()
+
+    async def _stream(self, request: web.Request) -> web.WebSocketResponse:
+        keys = {sub["stream_key"] for sub in self.subscriptions}
+        if request.query.get("stream_key") not in keys:
+            raise web.HTTPUnauthorized()
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.streams.add(ws)
+        try:
+            async for _ in ws:
+                pass
+        finally:
+            self.streams.discard(ws)
+        return ws
+
+    def _ack(self, name: str, value: str, acked_at: str):
+        """device applies and acknowledges the value (at acked_at)"""
+        for prop in self.properties:
+            if prop["property"]["name"] == name:
+                prop["property"].update(
+                    value=value,
+                    ack_enabled=True,
+                    ack_status=0,
+                    ack_message=0,
+                    acked_at=acked_at,
+                )
+        self._properties_bodies.clear()
+
+    async def _datapoint(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        return web.json_response(body, status=201)
+
+
+def serve(port: int) -> None:
+    """runs the stand-in until killed, e.g. in a benchmark subprocess"""
+    web.run_app(MockAylaServer().app, host="127.0.0.1", port=port, print=None)
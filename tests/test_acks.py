@@ -0,0 +1,227 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock
+
+from oekoboilerapi.acks import AckTracker
+from oekoboilerapi.aylaservice import (
+    AylaService,
+    DatapointAck,
+    WriteResult,
+)
+from oekoboilerapi.oekoboiler import Oekoboiler
+from tests import utils
+from tests.mock_server import MockAylaServer
+
+PROPERTIES_ROUTE = "/apiv1/dsns/{dsn}/properties"
+
+
+class AckTrackerTestcase(unittest.IsolatedAsyncioTestCase):
+    """Test waiting for datapoint acknowledgments"""
+
+    async def test_acks_are_multiplexed_per_device(self):
+        """one status request per device covers all pending writes"""
+
+        async with MockAylaServer() as server:
+            server.acking_names.update({"F11", "F12"})
+            async with AylaService(
+                utils.mocked_credentials(),
+                host=server.user_host,
+                ads_host=server.ads_host,
+            ) as service:
+                sut = AckTracker(service, interval=0.01)
+                results = await service.update_properties_batch(
+                    [
+                        ("dsn1", "F11", 55),
+                        ("dsn1", "F12", 4),
+                        ("dsn2", "F11", 50),
+                    ]
+                )
+                results = await asyncio.gather(
+                    *(sut.wait_for(result) for result in results)
+                )
+
+        for result in results:
+            self.assertTrue(result.ack.acked)
+            self.assertEqual(result.ack.ack_status, 0)
+
+        self.assertEqual(server.calls[PROPERTIES_ROUTE], 2)
+        self.assertEqual(sut.pending, 0)
+
+    async def test_missing_ack_times_out(self):
+        """acks older than the datapoint do not count"""
+
+        service = AylaService(MagicMock())
+        service.get_property_acks = AsyncMock(
+            return_value={
+                "F11": DatapointAck(
+                    "dsn",
+                    "F11",
+                    True,
+                    acked_at=datetime.now(timezone.utc) - timedelta(hours=1),
+                )
+            }
+        )
+        sut = AckTracker(service, interval=0.01, timeout=0.05)
+
+        ack = await sut.wait("dsn", "F11")
+
+        self.assertTrue(ack.timed_out)
+        self.assertFalse(ack.acked)
+        self.assertGreater(service.get_property_acks.await_count, 1)
+
+    async def test_properties_without_acks_resolve_right_away(self):
+        """properties that are not ack_enabled are not waited for"""
+
+        service = AylaService(MagicMock())
+        service.get_property_acks = AsyncMock(
+            return_value={"F11": DatapointAck("dsn", "F11", False)}
+        )
+        sut = AckTracker(service, interval=0.01)
+
+        ack = await sut.wait("dsn", "F11")
+
+        self.assertFalse(ack.ack_enabled)
+        self.assertFalse(ack.timed_out)
+        service.get_property_acks.assert_awaited_once_with("dsn", ["F11"])
+
+    async def test_ack_of_same_second_needs_written_value(self):
+        """an earlier datapoint acked in the write's second is not ours"""
+
+        written_at = "2024-01-01T12:00:00Z"
+        ack = DatapointAck(
+            "dsn",
+            "F11",
+            True,
+            ack_status=0,
+            acked_at=datetime(2024, 1, 1, 12, tzinfo=timezone.utc),
+            value=50,
+            base_type="integer",
+        )
+        service = AylaService(MagicMock())
+        service.get_property_acks = AsyncMock(return_value={"F11": ack})
+        sut = AckTracker(service, interval=0.01, timeout=0.05)
+
+        previous = await sut.wait(
+            "dsn", "F11", {"value": "55", "created_at": written_at}
+        )
+        ours = await sut.wait(
+            "dsn", "F11", {"value": "50", "created_at": written_at}
+        )
+
+        self.assertTrue(previous.timed_out)
+        self.assertIs(ours, ack)
+
+    async def test_ack_without_created_at_is_matched_by_value(self):
+        """without server time the local clock is not compared"""
+
+        service = AylaService(MagicMock())
+        service.get_property_acks = AsyncMock(
+            return_value={
+                "F11": DatapointAck(
+                    "dsn",
+                    "F11",
+                    True,
+                    ack_status=0,
+                    acked_at=datetime.now(timezone.utc) - timedelta(hours=1),
+                    value=55,
+                    base_type="integer",
+                )
+            }
+        )
+        sut = AckTracker(service, interval=0.01, timeout=0.05)
+
+        self.assertTrue((await sut.wait("dsn", "F11", value=55)).acked)
+        self.assertTrue((await sut.wait("dsn", "F11", value=50)).timed_out)
+
+    async def test_nack_is_rejected(self):
+        """an error status of the device is no ack"""
+
+        service = AylaService(MagicMock())
+        service.get_property_acks = AsyncMock(
+            return_value={
+                "F11": DatapointAck(
+                    "dsn",
+                    "F11",
+                    True,
+                    ack_status=1,
+                    ack_message="out of range",
+                    acked_at=datetime.now(timezone.utc),
+                    value=90,
+                    base_type="integer",
+                )
+            }
+        )
+        sut = AckTracker(service, interval=0.01)
+
+        ack = await sut.wait("dsn", "F11", value=90)
+
+        self.assertTrue(ack.rejected)
+        self.assertFalse(ack.acked)
+
+
+class OekoboilerAckTestcase(unittest.IsolatedAsyncioTestCase):
+    """Test ack aware writes of the Oekoboiler"""
+
+    async def test_ack_confirms_pending_value(self):
+        """acknowledged writes are no longer pending"""
+
+        async with MockAylaServer() as server:
+            server.acking_names.add("F11")
+            async with AylaService(
+                utils.mocked_credentials(),
+                host=server.user_host,
+                ads_host=server.ads_host,
+            ) as service:
+                sut = Oekoboiler(
+                    service,
+                    "dsn",
+                    ack_tracker=AckTracker(service, interval=0.01),
+                )
+                await sut.async_update()
+
+                results = await sut.set_values({"F11": 55}, wait_for_ack=True)
+
+        self.assertTrue(results["F11"].ack.acked)
+        self.assertEqual(sut.temp_c_set, 55)
+        self.assertFalse(sut.boiler_data.by_name("F11").pending)
+        self.assertEqual(sut.state.pending_writes, {})
+
+    async def test_rejected_value_is_refetched(self):
+        """a value the device refuses is dropped and fetched again"""
+
+        service = AylaService(MagicMock())
+        service.request = AsyncMock(
+            return_value=utils.mocked_water_heater_properties(22, 60, 4, 1)
+        )
+        service.update_properties = AsyncMock(
+            return_value={
+                "F11": WriteResult("dsn", "F11", 90, 201, {"value": "90"})
+            }
+        )
+        service.get_property_acks = AsyncMock(
+            return_value={
+                "F11": DatapointAck(
+                    "dsn",
+                    "F11",
+                    True,
+                    ack_status=1,
+                    acked_at=datetime.now(timezone.utc),
+                    value=90,
+                    base_type="integer",
+                )
+            }
+        )
+        sut = Oekoboiler(
+            service, "dsn", ack_tracker=AckTracker(service, interval=0.01)
+        )
+        await sut.async_update()
+
+        results = await sut.set_values({"F11": 90}, wait_for_ack=True)
+
+        self.assertTrue(results["F11"].ack.rejected)
+        self.assertEqual(sut.state.pending_writes, {})
+        self.assertTrue(sut.is_due())
+        await sut.async_update()
+        self.assertEqual(sut.temp_c_set, 60)
+        self.assertFalse(sut.boiler_data.by_name("F11").pending)
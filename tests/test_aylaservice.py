@@ -1,8 +1,14 @@
+import asyncio
+import json
+import time
 import unittest
-from datetime import datetime, timedelta
-from unittest.mock import MagicMock
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock
 
+from aiohttp import ClientSession
 from aioresponses import aioresponses
+from yarl import URL
 
 from oekoboilerapi.aylaservice import (
     AccessToken,
@@ -10,8 +16,12 @@ from oekoboilerapi.aylaservice import (
     AylaService,
     LoginFailedError,
     NoAccessError,
+    PropertySet,
+    decode_value,
+    parse_timestamp,
 )
 from tests import utils
+from tests.mock_server import MockAylaServer
 
 
 class AccessTokenTestcase(unittest.TestCase):
@@ -63,6 +73,153 @@ class AccessTokenTestcase(unittest.TestCase):
         res = sut.is_expired(datetime.now() - timedelta(seconds=1))
         self.assertFalse(res)
 
+    def test_access_token_expired_monotonic(self):
+        """test expired function with the monotonic clock"""
+
+        sut = AccessToken(
+            "orig_token", "orig_refresh_token", 7200, "end_user", [], None
+        )
+        sut.activate()
+        self.assertFalse(sut.is_expired())
+
+        sut.expire_monotonic = time.monotonic() + 3599
+        self.assertTrue(sut.is_expired())
+
+
+class PropertySetTestcase(unittest.TestCase):
+    """Test the indexed property container"""
+
+    def setUp(self):
+        self.sut = AylaService(MagicMock()).process_properties(
+            utils.mocked_water_heater_properties(22, 60, 4, 1)
+        )
+
+    def test_sequence(self):
+        """still behaves like the list of properties"""
+
+        self.assertIsInstance(self.sut, PropertySet)
+        self.assertEqual(len(self.sut), 63)
+        self.assertEqual(self.sut[0].name, "End")
+        self.assertEqual(self.sut[-1].name, "version")
+        self.assertEqual([prop.name for prop in self.sut[1:3]], ["F100", "F101"])
+
+    def test_lookup(self):
+        """lookup by name and key"""
+
+        self.assertEqual(self.sut.by_name("F103").value, 22)
+        self.assertEqual(self.sut.by_key(588326021).name, "F11")
+        self.assertIsNone(self.sut.get("F999"))
+        with self.assertRaises(KeyError):
+            self.sut.by_name("F999")
+
+    def test_updated_without_changes(self):
+        """replacing properties by themselves keeps the set"""
+
+        self.assertIs(self.sut.updated([self.sut[1]]), self.sut)
+        self.assertIsNot(self.sut.updated([replace(self.sut[1])]), self.sut)
+
+    def test_duplicate_names(self):
+        """F104 is reported twice, first one wins for lookups by name"""
+
+        self.assertEqual(list(self.sut.duplicates), ["F104"])
+        first, second = self.sut.get_all("F104")
+        self.assertIs(self.sut.by_name("F104"), first)
+        self.assertEqual(first.key, 588326007)
+        self.assertEqual(second.key, 588325994)
+        self.assertEqual(self.sut.by_key(588325994).value, 1)
+        self.assertEqual(self.sut.get_all("F999"), [])
+
+
+class AylaPropertyTestcase(unittest.TestCase):
+    """Test property decoding"""
+
+    def test_decode_value(self):
+        """values are converted according to the base_type"""
+
+        self.assertEqual(decode_value("integer", "42"), 42)
+        self.assertEqual(decode_value("integer", 42), 42)
+        self.assertIs(decode_value("boolean", 1), True)
+        self.assertIs(decode_value("boolean", 0), False)
+        self.assertIs(decode_value("boolean", "true"), True)
+        self.assertEqual(decode_value("decimal", "21.5"), 21.5)
+        self.assertEqual(decode_value("string", 12), "12")
+        self.assertIsNone(decode_value("integer", None))
+        self.assertEqual(decode_value("integer", "n/a"), "n/a")
+        self.assertEqual(decode_value("file", "url"), "url")
+
+    def test_parse_timestamp(self):
+        """Ayla timestamps are parsed as UTC, null values become None"""
+
+        self.assertEqual(
+            parse_timestamp("2023-06-01T18:45:53Z"),
+            datetime(2023, 6, 1, 18, 45, 53, tzinfo=timezone.utc),
+        )
+        self.assertEqual(
+            parse_timestamp("2023-06-01T18:45:53"),
+            datetime(2023, 6, 1, 18, 45, 53, tzinfo=timezone.utc),
+        )
+        self.assertIs(
+            parse_timestamp("2023-06-01T18:45:53Z"),
+            parse_timestamp("2023-06-01T18:45:53Z"),
+        )
+        self.assertIsNone(parse_timestamp("null"))
+        self.assertIsNone(parse_timestamp(None))
+        self.assertIsNone(parse_timestamp("yesterday"))
+
+    def test_processed_properties(self):
+        """properties are decoded, immutable and share interned names"""
+
+        service = AylaService(MagicMock())
+        body = json.dumps(utils.mocked_water_heater_properties(22, 60, 4, 1))
+        props = service.process_properties(json.loads(body))
+        other = service.process_properties(json.loads(body))
+
+        self.assertIs(props.by_key(588325994).value, True)
+        self.assertEqual(props.by_name("F107").value, "13:00-18:50")
+        self.assertEqual(props.by_name("F103").base_type, "integer")
+        self.assertIs(props[5].name, other[5].name)
+        self.assertFalse(hasattr(props[5], "__dict__"))
+        with self.assertRaises(AttributeError):
+            props[5].value = 1
+
+    def test_unchanged_properties_are_reused(self):
+        """a poll only creates objects for properties that changed"""
+
+        service = AylaService(MagicMock())
+        previous = service.process_properties(
+            utils.mocked_water_heater_properties(22, 60, 4, 1)
+        )
+
+        self.assertIs(
+            service.process_properties(
+                utils.mocked_water_heater_properties(22, 60, 4, 1), previous
+            ),
+            previous,
+        )
+
+        answer = utils.mocked_water_heater_properties(23, 60, 4, 1)
+        for prop in answer:
+            if prop["property"]["name"] == "F103":
+                prop["property"]["data_updated_at"] = "2030-01-01T00:00:00Z"
+        props = service.process_properties(answer, previous)
+
+        self.assertEqual(props.by_name("F103").value, 23)
+        created = [
+            prop.name
+            for prop, old in zip(props, previous)
+            if prop is not old
+        ]
+        self.assertEqual(created, ["F103"])
+
+        patched = previous.updated(
+            [replace(previous.by_name("F11"), value=55, pending=True)]
+        )
+        props = service.process_properties(
+            utils.mocked_water_heater_properties(22, 60, 4, 1), patched
+        )
+        self.assertFalse(props.by_name("F11").pending)
+        self.assertIs(props.by_name("F103"), previous.by_name("F103"))
+
 
 class AylaServiceTestcase(unittest.IsolatedAsyncioTestCase):
     """Integration and unit tests for the AylaService class"""
@@ -72,6 +229,7 @@ class AylaServiceTestcase(unittest.IsolatedAsyncioTestCase):
         """Test if token is refreshed"""
 
         sut = AylaService(MagicMock())
+        self.addAsyncCleanup(sut.close)
         random_token = "orig_token"
         random_refresh_token = "orig_refresh_token"
         new_token = "new_token"
@@ -103,11 +261,148 @@ class AylaServiceTestcase(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(sut.access_token.access_token, new_token)
         self.assertEqual(sut.access_token.refresh_token, new_refresh_token)
 
+    @aioresponses()
+    async def test_concurrent_get_token_logs_in_once(
+        self, mocked: aioresponses
+    ):
+        """concurrent callers without token share one login"""
+
+        sut = AylaService(MagicMock())
+        self.addAsyncCleanup(sut.close)
+        url = "https://user-field-eu.aylanetworks.com/users/sign_in.json"
+        mocked.post(
+            url=url,
+            status=200,
+            payload=utils.mocked_login_answer("token", "refresh"),
+            repeat=True,
+        )
+
+        tokens = await asyncio.gather(*(sut.get_token() for _ in range(200)))
+
+        self.assertEqual(set(tokens), {"token"})
+        self.assertEqual(len(mocked.requests[("POST", URL(url))]), 1)
+
+    @aioresponses()
+    async def test_concurrent_get_token_refreshes_once(
+        self, mocked: aioresponses
+    ):
+        """concurrent callers with expired token share one refresh"""
+
+        sut = AylaService(MagicMock())
+        self.addAsyncCleanup(sut.close)
+        sut.access_token = AccessToken(
+            "old_token", "old_refresh", 86400, "EndUser", [], None
+        )
+        sut.access_token.activate()
+        sut.access_token.expire_monotonic = time.monotonic()
+
+        url = "https://user-field-eu.aylanetworks.com/users/refresh_token.json"
+        mocked.post(
+            url=url,
+            status=200,
+            payload=utils.mocked_login_answer("new_token", "new_refresh"),
+            repeat=True,
+        )
+
+        tokens = await asyncio.gather(*(sut.get_token() for _ in range(200)))
+
+        self.assertEqual(set(tokens), {"new_token"})
+        self.assertEqual(len(mocked.requests[("POST", URL(url))]), 1)
+        self.assertEqual(len(mocked.requests), 1)
+
+    @aioresponses()
+    async def test_failed_refresh_falls_back_to_login(
+        self, mocked: aioresponses
+    ):
+        """a rejected refresh token results in a new login"""
+
+        sut = AylaService(utils.mocked_credentials())
+        self.addAsyncCleanup(sut.close)
+        sut.access_token = AccessToken(
+            "old_token", "old_refresh", 0, "EndUser", [], None
+        )
+        sut.access_token.activate()
+
+        mocked.post(
+            url="https://user-field-eu.aylanetworks.com/users/refresh_token.json",
+            status=401,
+        )
+        mocked.post(
+            url="https://user-field-eu.aylanetworks.com/users/sign_in.json",
+            status=200,
+            payload=utils.mocked_login_answer("new_token", "new_refresh"),
+        )
+
+        self.assertEqual(await sut.get_token(), "new_token")
+
+    @aioresponses()
+    async def test_background_renewal(self, mocked: aioresponses):
+        """token is refreshed in the background before it expires"""
+
+        sut = AylaService(MagicMock())
+        self.addAsyncCleanup(sut.close)
+        sut.access_token = AccessToken(
+            "old_token", "old_refresh", 86400, "EndUser", [], None
+        )
+        sut.access_token.activate()
+        sut.access_token.expire_monotonic = time.monotonic() + 3600.05
+
+        mocked.post(
+            url="https://user-field-eu.aylanetworks.com/users/refresh_token.json",
+            status=200,
+            payload=utils.mocked_login_answer("new_token", "new_refresh"),
+        )
+
+        sut.start_token_renewal(lead=0, jitter=0)
+        await asyncio.sleep(0.2)
+        await sut.stop_token_renewal()
+
+        self.assertEqual(sut.access_token.access_token, "new_token")
+        self.assertEqual(len(sut.token_renewals), 1)
+        renewal = sut.token_renewals[0]
+        self.assertEqual(renewal.method, "refresh")
+        self.assertTrue(renewal.success)
+        self.assertGreaterEqual(renewal.duration, 0)
+
+        self.assertEqual(await sut.get_token(), "new_token")
+        self.assertEqual(len(mocked.requests), 1)
+
+    @aioresponses()
+    async def test_background_renewal_falls_back_to_login(
+        self, mocked: aioresponses
+    ):
+        """background renewal logs in if the refresh is rejected"""
+
+        sut = AylaService(utils.mocked_credentials())
+        self.addAsyncCleanup(sut.close)
+        sut.access_token = AccessToken(
+            "old_token", "old_refresh", 0, "EndUser", [], None
+        )
+        sut.access_token.activate()
+
+        mocked.post(
+            url="https://user-field-eu.aylanetworks.com/users/refresh_token.json",
+            status=401,
+        )
+        mocked.post(
+            url="https://user-field-eu.aylanetworks.com/users/sign_in.json",
+            status=200,
+            payload=utils.mocked_login_answer("new_token", "new_refresh"),
+        )
+
+        sut.start_token_renewal(lead=0, jitter=0)
+        await asyncio.sleep(0.1)
+        await sut.stop_token_renewal()
+
+        self.assertEqual(sut.access_token.access_token, "new_token")
+        self.assertEqual(sut.token_renewals[-1].method, "login")
+
     @aioresponses()
     async def test_login_ok(self, mocked: aioresponses):
         """test login"""
 
         sut = AylaService(MagicMock())
+        self.addAsyncCleanup(sut.close)
 
         random_token = "f5dd0ca57dcf42bb9badd3c86859372d"
         random_refresh_token = "myrefreshtoken"
@@ -137,6 +432,7 @@ class AylaServiceTestcase(unittest.IsolatedAsyncioTestCase):
         """test login if connection to ayla is not possible"""
 
         sut = AylaService(MagicMock())
+        self.addAsyncCleanup(sut.close)
 
         self.assertIsNone(sut.access_token)
 
@@ -153,6 +449,7 @@ class AylaServiceTestcase(unittest.IsolatedAsyncioTestCase):
         """test login if with wrong credentials"""
 
         sut = AylaService(MagicMock())
+        self.addAsyncCleanup(sut.close)
 
         error_msg = {"error": "Invalid email or password."}
         http_status = 401
@@ -174,6 +471,7 @@ class AylaServiceTestcase(unittest.IsolatedAsyncioTestCase):
         """test update"""
 
         sut = AylaService(MagicMock())
+        self.addAsyncCleanup(sut.close)
         test_property = AylaProperty(
             name="F103",
             key="123",
@@ -207,3 +505,142 @@ class AylaServiceTestcase(unittest.IsolatedAsyncioTestCase):
         self.assertTrue(
             await sut.update_property(test_property.key, test_property.value)
         )
+
+    @aioresponses()
+    async def test_update_rejected(self, post_mock):
+        """rejected datapoints are reported as failed"""
+
+        sut = AylaService(MagicMock())
+        self.addAsyncCleanup(sut.close)
+        sut.get_token = AsyncMock(return_value="token")
+        post_mock.post(
+            url="https://ads-eu.aylanetworks.com/apiv1/properties/123/datapoints",
+            status=422,
+            payload={"errors": {"value": ["is invalid"]}},
+        )
+
+        self.assertFalse(await sut.update_property("123", "test"))
+
+    @aioresponses()
+    async def test_writes_with_empty_body(self, post_mock):
+        """accepted writes without answer body do not fail"""
+
+        sut = AylaService(MagicMock())
+        self.addAsyncCleanup(sut.close)
+        sut.get_token = AsyncMock(return_value="token")
+        post_mock.post(
+            url="https://ads-eu.aylanetworks.com/apiv1/properties/123/datapoints",
+            status=201,
+            body="",
+        )
+        batch_url = "https://ads-eu.aylanetworks.com/apiv1/batch_datapoints.json"
+        post_mock.post(url=batch_url, status=207, body="")
+        post_mock.post(url=batch_url, status=200, payload={"unexpected": 1})
+
+        self.assertEqual(await sut.write_datapoint("123", "test"), {})
+        for _ in range(2):
+            results = await sut.update_properties_batch([("dsn", "F11", 55)])
+            self.assertEqual(results[0].status, 0)
+            self.assertFalse(results[0].ok)
+            self.assertIsNone(results[0].datapoint)
+
+    @aioresponses()
+    async def test_register_device(self, post_mock):
+        """only accepted registrations are reported as success"""
+
+        sut = AylaService(MagicMock())
+        self.addAsyncCleanup(sut.close)
+        sut.get_token = AsyncMock(return_value="token")
+        url = "https://ads-eu.aylanetworks.com/apiv1/devices"
+        post_mock.post(url=url, status=201, payload={"device": {}})
+        post_mock.post(url=url, status=422, payload={"errors": {}})
+
+        self.assertTrue(await sut.register_device("dsn"))
+        with self.assertLogs("oekoboilerapi.aylaservice", "WARNING"):
+            self.assertFalse(await sut.register_device("dsn"))
+
+
+class AylaServiceSessionTestcase(unittest.IsolatedAsyncioTestCase):
+    """Tests for the shared session and its lifecycle"""
+
+    async def test_requests_reuse_connection(self):
+        """all requests should go over one pooled connection"""
+
+        async with MockAylaServer() as server:
+            async with AylaService(
+                utils.mocked_credentials(),
+                host=server.user_host,
+                ads_host=server.ads_host,
+            ) as sut:
+                for _ in range(5):
+                    await sut.get_properties("dsn")
+                self.assertEqual(server.calls["/users/sign_in.json"], 1)
+                self.assertEqual(len(server.connections), 1)
+
+    async def test_get_properties_by_name(self):
+        """only the requested properties are transferred"""
+
+        async with MockAylaServer() as server:
+            async with AylaService(
+                utils.mocked_credentials(),
+                host=server.user_host,
+                ads_host=server.ads_host,
+            ) as sut:
+                props = await sut.get_properties("dsn", names=["F103", "F11"])
+                filtered_bytes = server.properties_bytes
+                all_props = await sut.get_properties("dsn")
+                full_bytes = server.properties_bytes - filtered_bytes
+
+        self.assertEqual([prop.name for prop in props], ["F103", "F11"])
+        self.assertEqual(props.by_name("F103").value, 22)
+        self.assertEqual(len(all_props), 63)
+        self.assertLess(filtered_bytes * 20, full_bytes)
+
+    async def test_batch_writes(self):
+        """writes for several devices go out in one request"""
+
+        async with MockAylaServer() as server:
+            server.rejected_names.add("F999")
+            async with AylaService(
+                utils.mocked_credentials(),
+                host=server.user_host,
+                ads_host=server.ads_host,
+            ) as sut:
+                results = await sut.update_properties_batch(
+                    [
+                        ("dsn1", "F11", 55),
+                        ("dsn1", "F107", "13:00-18:50"),
+                        ("dsn2", "F11", 50),
+                        ("dsn2", "F999", 1),
+                    ]
+                )
+                by_name = await sut.update_properties(
+                    "dsn1", {"F11": 56, "F12": 4}
+                )
+
+        self.assertEqual(server.calls["/apiv1/batch_datapoints.json"], 2)
+        self.assertEqual(
+            [result.ok for result in results], [True, True, True, False]
+        )
+        self.assertEqual(results[2].dsn, "dsn2")
+        self.assertEqual(results[2].datapoint["value"], "50")
+        self.assertEqual(results[3].status, 422)
+        self.assertEqual(set(by_name), {"F11", "F12"})
+        self.assertTrue(by_name["F12"].ok)
+        self.assertIn(("dsn1", "F107", "13:00-18:50"), server.datapoints)
+
+    async def test_context_manager_closes_own_session(self):
+        """session created by the service is closed on exit"""
+
+        async with AylaService(MagicMock()) as sut:
+            session = sut.session
+            self.assertIs(session, sut.session)
+        self.assertTrue(session.closed)
+
+    async def test_injected_session_stays_open(self):
+        """an injected session is used but not closed"""
+
+        async with ClientSession() as session:
+            async with AylaService(MagicMock(), session=session) as sut:
+                self.assertIs(session, sut.session)
+            self.assertFalse(session.closed)
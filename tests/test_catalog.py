@@ -0,0 +1,147 @@
+import copy
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from oekoboilerapi.aylaservice import AylaService
+from oekoboilerapi import catalog
+from oekoboilerapi.catalog import PropertyCatalog, PropertyMeta
+from tests import utils
+
+
+def filtered(data: list, *names: str) -> list:
+    """answer of a properties request with a names[] filter"""
+    return [prop for prop in data if prop["property"]["name"] in names]
+
+
+class PropertyCatalogTestcase(unittest.TestCase):
+    """Tests for the product metadata catalog"""
+
+    def setUp(self):
+        self.data = utils.mocked_water_heater_properties(22, 60, 4, 1)
+
+    def test_for_answer(self):
+        """metadata is taken once per product, by name and base_type"""
+
+        sut = PropertyCatalog(ttl=60)
+        product = sut.for_answer(self.data, now=1000)
+
+        self.assertEqual(product.product_name, "DES")
+        self.assertEqual(len(product), len(self.data))
+        self.assertEqual(
+            product.get("F110"),
+            PropertyMeta(
+                "F110", "string", True, "output", "F110_RFI", 30, False
+            ),
+        )
+        self.assertEqual(
+            product.get("F104", "integer").display_name, "F102_RMT"
+        )
+        self.assertEqual(
+            product.get("F104", "boolean").display_name, "F104_IS"
+        )
+        self.assertIsNone(product.get("F104", "decimal"))
+        self.assertIsNone(product.get("F999"))
+
+        self.assertIs(sut.for_answer(self.data, now=1030), product)
+        self.assertIsNone(sut.for_answer([]))
+
+    def test_stale_product_is_taken_again(self):
+        """after ttl a (filtered) answer updates the metadata"""
+
+        sut = PropertyCatalog(ttl=60)
+        product = sut.for_answer(self.data, now=1000)
+
+        changed = copy.deepcopy(filtered(self.data, "F103"))
+        changed[0]["property"]["display_name"] = "F103_NEW"
+        renewed = sut.for_answer(changed, now=1061)
+
+        self.assertIsNot(renewed, product)
+        self.assertEqual(renewed.fetched_at, 1061)
+        self.assertEqual(renewed.get("F103").display_name, "F103_NEW")
+        self.assertIs(renewed.get("F11"), product.get("F11"))
+
+    def test_persisted(self):
+        """a catalog with a path is restored by the next instance"""
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "catalog.json")
+            catalog = PropertyCatalog(path=path)
+            product = catalog.for_answer(self.data)
+            self.assertTrue(catalog.dirty)
+            catalog.save()
+
+            restored = PropertyCatalog(path=path).product("DES")
+
+            self.assertEqual(list(restored), list(product))
+            self.assertEqual(restored.fetched_at, product.fetched_at)
+            self.assertIsNone(PropertyCatalog(ttl=0, path=path).product("DES"))
+
+
+class CatalogPropertiesTestcase(unittest.TestCase):
+    """Tests for properties created with a catalog"""
+
+    def setUp(self):
+        self.catalog = PropertyCatalog()
+        self.service = AylaService(MagicMock(), catalog=self.catalog)
+
+    def test_properties_share_metadata(self):
+        """properties of all devices point to the same metadata"""
+
+        first = self.service.process_properties(
+            utils.mocked_water_heater_properties(22, 60, 4, 1)
+        )
+        second = self.service.process_properties(
+            utils.mocked_water_heater_properties(30, 55, 4, 0)
+        )
+        product = self.catalog.product("DES")
+
+        for prop, other in zip(first, second):
+            self.assertIs(prop.meta, product.get(prop.name, prop.base_type))
+            self.assertIs(other.meta, prop.meta)
+            self.assertIs(prop.name, prop.meta.name)
+        self.assertTrue(first.by_name("F110").meta.read_only)
+        self.assertEqual(
+            [prop.meta.base_type for prop in first.get_all("F104")],
+            ["integer", "boolean"],
+        )
+        self.assertEqual(second.by_name("F103").value, 30)
+
+    def test_unknown_property_is_learned(self):
+        """a property missing in the catalog of a product is added"""
+
+        data = utils.mocked_water_heater_properties(22, 60, 4, 1)
+        self.service.process_properties(filtered(data, "F103", "F11"))
+        props = self.service.process_properties(data)
+
+        self.assertEqual(len(self.catalog.product("DES")), len(data))
+        self.assertEqual(props.by_name("F12").meta.display_name, "F12_TS")
+
+
+class CatalogPersistenceTestcase(unittest.IsolatedAsyncioTestCase):
+    """Tests for writing the catalog of a service"""
+
+    async def test_saved_once_per_answer(self):
+        """learned properties are written together, off the event loop"""
+
+        data = utils.mocked_water_heater_properties(22, 60, 4, 1)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "catalog.json")
+            service = AylaService(
+                MagicMock(), catalog=PropertyCatalog(path=path)
+            )
+            service.request = AsyncMock(
+                side_effect=[filtered(data, "F103", "F11"), data, data]
+            )
+
+            with patch.object(
+                catalog, "write_json_atomic", wraps=catalog.write_json_atomic
+            ) as write:
+                for _ in range(3):
+                    await service.get_properties("dsn")
+
+            self.assertEqual(write.call_count, 2)
+            self.assertFalse(service.catalog.dirty)
+            restored = PropertyCatalog(path=path).product("DES")
+            self.assertEqual(len(restored), len(data))
@@ -0,0 +1,133 @@
+import unittest
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock
+
+from oekoboilerapi.aylaservice import AylaProperty, AylaService, PropertySet
+from oekoboilerapi.changes import ChangeWatcher, PropertyChange, diff
+from oekoboilerapi.oekoboiler import Oekoboiler
+from tests import utils
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def changed_properties(temp_current: int, updated_at: str) -> list:
+    """mocked properties with a new current temperature"""
+    props = utils.mocked_water_heater_properties(temp_current, 60, 4, 1)
+    for prop in props:
+        if prop["property"]["name"] == "F103":
+            prop["property"]["data_updated_at"] = updated_at
+    return props
+
+
+class DiffTestcase(unittest.TestCase):
+    """Tests for the delta between two property sets"""
+
+    def test_diff(self):
+        """changed and new properties by key"""
+
+        temp = AylaProperty("F103", 50, 1, START)
+        target = AylaProperty("F11", 60, 2, START)
+        mode = AylaProperty("F104", 1, 3, START)
+        old = PropertySet([temp, target, mode])
+
+        newer = replace(temp, data_updated_at=START + timedelta(seconds=1))
+        patched = replace(target, value=55, pending=True)
+        added = AylaProperty("F12", 4, 4, START)
+        new = PropertySet([newer, patched, replace(mode), added])
+
+        self.assertEqual(
+            diff("dsn", old, new),
+            [
+                PropertyChange("dsn", "F103", temp, newer),
+                PropertyChange("dsn", "F11", target, patched),
+                PropertyChange("dsn", "F12", None, added),
+            ],
+        )
+        self.assertEqual(len(diff("dsn", None, old)), 3)
+        self.assertEqual(diff("dsn", new, PropertySet([newer])), [])
+
+
+class ChangeWatcherTestcase(unittest.IsolatedAsyncioTestCase):
+    """Tests for the bounded change iterator"""
+
+    async def test_slow_consumer_drops_oldest(self):
+        """a full queue keeps the newest changes"""
+
+        sut = ChangeWatcher(maxsize=2)
+        changes = [
+            PropertyChange("dsn", f"F{i}", None, None) for i in range(4)
+        ]
+        for change in changes:
+            sut.put(change)
+        sut.close()
+
+        self.assertEqual([change async for change in sut], changes[3:])
+        self.assertEqual(sut.dropped, 3)
+
+        sut.put(changes[0])
+        self.assertEqual([change async for change in sut], [])
+
+
+class OekoboilerChangesTestcase(unittest.IsolatedAsyncioTestCase):
+    """Tests for change events of a boiler"""
+
+    async def asyncSetUp(self):
+        self.service = AylaService(MagicMock())
+        self.service.request = AsyncMock(
+            return_value=utils.mocked_water_heater_properties(22, 60, 4, 1)
+        )
+        self.sut = Oekoboiler(self.service, "device_id")
+        await self.sut.async_update()
+
+    async def update(self, temp_current: int, updated_at: str):
+        self.service.request.return_value = changed_properties(
+            temp_current, updated_at
+        )
+        self.sut.last_update = None
+        await self.sut.async_update()
+
+    async def test_listeners_get_changed_properties(self):
+        """only properties changed by a poll are dispatched"""
+
+        changes = []
+        remove = self.sut.add_listener(changes.append)
+
+        def broken(_change):
+            raise ValueError("broken listener")
+
+        self.sut.add_listener(broken)
+
+        await self.update(23, "2030-01-01T00:00:00Z")
+        await self.update(23, "2030-01-01T00:00:00Z")
+
+        self.assertEqual([change.name for change in changes], ["F103"])
+        self.assertEqual(changes[0].old.value, 22)
+        self.assertEqual(changes[0].new.value, 23)
+        self.assertEqual(self.sut.temp_c_current, 23)
+
+        remove()
+        await self.update(24, "2030-01-01T00:01:00Z")
+        self.assertEqual(len(changes), 1)
+
+    async def test_watch(self):
+        """changes of polls and writes arrive in order"""
+
+        watcher = self.sut.watch()
+        self.service.update_properties = AsyncMock(
+            side_effect=lambda dsn, values: {
+                name: MagicMock(ok=True, value=value)
+                for name, value in values.items()
+            }
+        )
+
+        await self.update(23, "2030-01-01T00:00:00Z")
+        await self.sut.set_values({"F11": 55})
+        watcher.close()
+
+        changes = [change async for change in watcher]
+        self.assertEqual(
+            [(change.name, change.new.value) for change in changes],
+            [("F103", 23), ("F11", 55)],
+        )
+        self.assertTrue(changes[1].new.pending)
@@ -0,0 +1,156 @@
+import time
+import unittest
+
+from oekoboilerapi.aylaservice import AylaService, RequestFailedError
+from oekoboilerapi.circuit import (
+    CircuitBreaker,
+    CircuitBreakers,
+    CircuitOpenError,
+    DeviceOfflineError,
+)
+from oekoboilerapi.fleet import FleetPoller
+from oekoboilerapi.retry import NO_RETRY
+from tests import utils
+from tests.mock_server import MockAylaServer
+
+PROPERTIES_ROUTE = "/apiv1/dsns/{dsn}/properties"
+
+
+class CircuitBreakerTestcase(unittest.TestCase):
+    """Tests for the circuit breaker states"""
+
+    def test_opens_after_threshold(self):
+        """failures in a row open the circuit, a success resets them"""
+
+        sut = CircuitBreaker(threshold=2, reset_timeout=60)
+        sut.failure()
+        sut.success()
+        sut.failure()
+        self.assertEqual(sut.state, CircuitBreaker.CLOSED)
+        self.assertTrue(sut.allow())
+
+        sut.failure()
+        self.assertEqual(sut.state, CircuitBreaker.OPEN)
+        self.assertFalse(sut.allow())
+
+    def test_half_open_probe(self):
+        """after the timeout a single probe decides"""
+
+        sut = CircuitBreaker(threshold=1, reset_timeout=0.05)
+        sut.failure()
+        time.sleep(0.06)
+
+        self.assertEqual(sut.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(sut.allow())
+        self.assertFalse(sut.allow())
+
+        sut.failure()
+        self.assertEqual(sut.state, CircuitBreaker.OPEN)
+
+        time.sleep(0.06)
+        self.assertTrue(sut.allow())
+        sut.success()
+        self.assertEqual(sut.state, CircuitBreaker.CLOSED)
+        self.assertTrue(sut.allow())
+
+    def test_offline_devices(self):
+        """offline devices are cached until online or expired"""
+
+        sut = CircuitBreakers(offline_ttl=0.05)
+        sut.update_devices(
+            [
+                {"device": {"dsn": "a", "connection_status": "Offline"}},
+                {"device": {"dsn": "b", "connection_status": "Online"}},
+                {"device": {"dsn": "c"}},
+            ]
+        )
+        self.assertEqual(sut.offline, {"a"})
+
+        sut.update_devices([{"dsn": "a", "connection_status": "Online"}])
+        self.assertFalse(sut.is_offline("a"))
+
+        sut.mark_offline("a")
+        time.sleep(0.06)
+        self.assertFalse(sut.is_offline("a"))
+
+
+class AylaServiceCircuitTestcase(unittest.IsolatedAsyncioTestCase):
+    """Tests for requests through circuit breakers"""
+
+    async def asyncSetUp(self):
+        self.server = MockAylaServer()
+        await self.server.__aenter__()
+        self.addAsyncCleanup(self.server.__aexit__, None, None, None)
+
+        self.circuits = CircuitBreakers(threshold=3, device_threshold=2)
+        self.sut = AylaService(
+            utils.mocked_credentials(),
+            host=self.server.user_host,
+            ads_host=self.server.ads_host,
+            retry=NO_RETRY,
+            circuits=self.circuits,
+        )
+        self.addAsyncCleanup(self.sut.close)
+
+    async def test_host_circuit(self):
+        """a failing host is not requested while its circuit is open"""
+
+        self.server.inject("/apiv1/devices", status=503, times=3)
+        for _ in range(3):
+            with self.assertRaises(RequestFailedError):
+                await self.sut.get_devices()
+
+        with self.assertRaises(CircuitOpenError) as ctx:
+            await self.sut.get_properties("dsn")
+
+        self.assertEqual(ctx.exception.key, self.server.ads_host)
+        self.assertEqual(self.server.calls["/apiv1/devices"], 3)
+        self.assertEqual(self.server.calls[PROPERTIES_ROUTE], 0)
+
+    async def test_device_circuit(self):
+        """a failing device does not stop requests for other devices"""
+
+        self.server.inject(PROPERTIES_ROUTE, status=500, times=2)
+        for _ in range(2):
+            with self.assertRaises(RequestFailedError):
+                await self.sut.get_properties("broken")
+
+        with self.assertRaises(CircuitOpenError) as ctx:
+            await self.sut.get_properties("broken")
+        props = await self.sut.get_properties("working")
+
+        self.assertEqual(ctx.exception.key, "broken")
+        self.assertEqual(props.by_name("F103").value, 22)
+        self.assertEqual(self.server.calls[PROPERTIES_ROUTE], 3)
+
+    async def test_client_errors_keep_circuit_closed(self):
+        """4xx answers are no failures of host or device"""
+
+        self.server.inject(PROPERTIES_ROUTE, status=404, times=3)
+        for _ in range(3):
+            with self.assertRaises(RequestFailedError):
+                await self.sut.get_properties("dsn")
+
+        await self.sut.get_properties("dsn")
+        self.assertEqual(self.circuits.device("dsn").failures, 0)
+
+    async def test_offline_devices_are_skipped(self):
+        """polls skip devices reported offline until they are online"""
+
+        self.server.devices = {"off": "Offline", "on": "Online"}
+        await self.sut.get_devices()
+
+        with self.assertRaises(DeviceOfflineError):
+            await self.sut.get_properties("off")
+        results = await FleetPoller(self.sut, ["off", "on"]).poll_all()
+
+        self.assertIsInstance(results["off"].error, DeviceOfflineError)
+        self.assertTrue(results["on"].ok)
+        self.assertEqual(self.server.calls[PROPERTIES_ROUTE], 1)
+
+        self.server.devices["off"] = "Online"
+        await self.sut.get_devices()
+        results = await FleetPoller(self.sut, ["off", "on"]).poll_all()
+
+        self.assertTrue(results["off"].ok)
+        self.assertEqual(self.server.calls[PROPERTIES_ROUTE], 3)
@@ -0,0 +1,177 @@
+import asyncio
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock
+
+from oekoboilerapi.aylaservice import AylaService
+from oekoboilerapi.datastream import (
+    DatapointEvent,
+    DatastreamClient,
+    parse_message,
+)
+from oekoboilerapi.oekoboiler import Oekoboiler
+from oekoboilerapi.retry import RetryPolicy
+from tests import utils
+from tests.mock_server import MockAylaServer
+
+
+class ParseMessageTestcase(unittest.TestCase):
+    """Tests for parsing stream messages"""
+
+    def test_datapoint(self):
+        """a datapoint event with its metadata"""
+
+        payload = (
+            '{"seq":"7","metadata":{"dsn":"dsn","property_name":"F103",'
+            '"event_type":"datapoint"},"datapoint":{"value":55,'
+            '"updated_at":"2024-01-01T12:00:00Z"}}'
+        )
+
+        self.assertEqual(
+            parse_message(f"{len(payload)}|{payload}"),
+            DatapointEvent(
+                "dsn",
+                "F103",
+                55,
+                datetime(2024, 1, 1, 12, tzinfo=timezone.utc),
+                7,
+            ),
+        )
+
+    def test_other_messages(self):
+        """heartbeats, other events and garbage are skipped"""
+
+        payload = (
+            '{"metadata":{"dsn":"dsn","event_type":"connectivity"},'
+            '"datapoint":{}}'
+        )
+        for message in ("1|Z", "garbage", "5|{...}", f"9|{payload}"):
+            with self.subTest(message=message):
+                self.assertIsNone(parse_message(message))
+
+
+class DatastreamClientTestcase(unittest.IsolatedAsyncioTestCase):
+    """Tests for the push client against a stand-in stream"""
+
+    async def asyncSetUp(self):
+        self.server = MockAylaServer()
+        await self.server.__aenter__()
+        self.addAsyncCleanup(self.server.__aexit__, None, None, None)
+
+        self.service = AylaService(
+            utils.mocked_credentials(),
+            host=self.server.user_host,
+            ads_host=self.server.ads_host,
+        )
+        self.addAsyncCleanup(self.service.close)
+        self.boiler = Oekoboiler(self.service, "dsn")
+        await self.boiler.async_update()
+
+    def create_client(self, **kwargs) -> DatastreamClient:
+        client = DatastreamClient(
+            self.service,
+            "oekoboiler",
+            host=self.server.user_host,
+            reconnect=RetryPolicy(base_delay=0.01),
+            **kwargs,
+        )
+        client.subscribe(self.boiler)
+        client.start()
+        self.addAsyncCleanup(client.close)
+        return client
+
+    async def wait_until(self, condition):
+        async with asyncio.timeout(2):
+            while not condition():
+                await asyncio.sleep(0.01)
+
+    async def test_pushed_values_are_applied(self):
+        """datapoints of subscribed boilers update their properties"""
+
+        sut = self.create_client()
+        await asyncio.wait_for(sut.connected.wait(), 2)
+
+        await self.server.heartbeat()
+        await self.server.push("other", "F103", 10)
+        await self.server.push("dsn", "F103", 70)
+        await self.wait_until(lambda: self.boiler.temp_c_current == 70)
+
+        self.assertEqual(sut.events, 1)
+        self.assertEqual(
+            self.server.subscriptions[0]["oem_model"], "oekoboiler"
+        )
+        self.assertEqual(self.server.calls["/apiv1/dsns/{dsn}/properties"], 1)
+
+    async def test_reconnect_fills_gap(self):
+        """after a dropped stream the client resubscribes and polls once"""
+
+        sut = self.create_client()
+        await asyncio.wait_for(sut.connected.wait(), 2)
+
+        await self.server.drop_streams()
+        self.server.set_value("F11", 45)
+        await self.wait_until(lambda: sut.connects == 2)
+        await self.wait_until(lambda: self.boiler.temp_c_set == 45)
+
+        self.assertEqual(
+            [sub["id"] for sub in self.server.subscriptions], [1]
+        )
+        await self.server.push("dsn", "F103", 71)
+        await self.wait_until(lambda: self.boiler.temp_c_current == 71)
+
+    async def test_rejected_subscription_is_replaced(self):
+        """a stream key the server no longer knows is subscribed again"""
+
+        sut = self.create_client()
+        await asyncio.wait_for(sut.connected.wait(), 2)
+
+        self.server.subscriptions.clear()
+        await self.server.drop_streams()
+        await self.wait_until(lambda: sut.connects == 2)
+
+        self.assertEqual(
+            [sub["id"] for sub in self.server.subscriptions], [2]
+        )
+        self.assertEqual(
+            self.server.calls["/api/v1/subscriptions/{id}.json"], 1
+        )
+
+    async def test_subscription_is_retried(self):
+        """subscribing is sent with the retries of the service"""
+
+        self.server.inject("/api/v1/subscriptions.json", status=429)
+        self.service._send = AsyncMock(wraps=self.service._send)
+        sut = self.create_client()
+        await asyncio.wait_for(sut.connected.wait(), 2)
+
+        self.assertEqual(self.server.calls["/api/v1/subscriptions.json"], 2)
+        self.assertEqual(self.service._send.await_count, 1)
+        self.assertEqual(sut.connects, 1)
+
+    async def test_close_deletes_subscription(self):
+        """no subscription is left behind"""
+
+        sut = self.create_client()
+        await asyncio.wait_for(sut.connected.wait(), 2)
+
+        await sut.close()
+
+        self.assertEqual(self.server.subscriptions, [])
+        self.assertIsNone(sut.subscription)
+
+    async def test_silent_stream_is_reconnected(self):
+        """no message within receive_timeout counts as a dropped stream"""
+
+        sut = self.create_client(receive_timeout=0.1)
+        await self.wait_until(lambda: sut.connects >= 2)
+
+    def test_older_datapoints_are_ignored(self):
+        """a push never replaces newer data"""
+
+        prop = self.boiler.boiler_data.by_name("F103")
+        older = prop.data_updated_at.replace(year=2000)
+
+        self.assertFalse(self.boiler.apply_datapoint("F103", 1, older))
+        self.assertFalse(self.boiler.apply_datapoint("unknown", 1))
+        self.assertIsNone(self.boiler.last_update)
+        self.assertEqual(self.boiler.temp_c_current, prop.value)
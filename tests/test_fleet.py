@@ -0,0 +1,99 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from oekoboilerapi.aylaservice import AylaService
+from oekoboilerapi.fleet import Fleet, FleetPoller
+from tests import utils
+from tests.mock_server import MockAylaServer
+
+
+class FleetPollerTestcase(unittest.IsolatedAsyncioTestCase):
+    """Tests for polling many devices"""
+
+    def setUp(self):
+        self.service = AylaService(MagicMock())
+        self.service.get_token = AsyncMock(return_value="token")
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def fake_get_properties(self, dsn: str):
+        """answers after a short delay, fails or hangs for some dsns"""
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            if dsn == "broken":
+                raise ValueError("broken device")
+            if dsn == "hanging":
+                await asyncio.sleep(10)
+            return [dsn]
+        finally:
+            self.in_flight -= 1
+
+    async def test_concurrency_is_bounded(self):
+        """never more requests in flight than configured"""
+
+        self.service.get_properties = self.fake_get_properties
+        sut = FleetPoller(
+            self.service, [f"dsn{i}" for i in range(50)], concurrency=5
+        )
+
+        results = await sut.poll_all()
+
+        self.assertEqual(len(results), 50)
+        self.assertTrue(all(result.ok for result in results.values()))
+        self.assertEqual(results["dsn7"].properties, ["dsn7"])
+        self.assertEqual(self.max_in_flight, 5)
+
+    async def test_errors_and_timeouts_are_isolated(self):
+        """failing devices are reported without affecting the others"""
+
+        self.service.get_properties = self.fake_get_properties
+        sut = FleetPoller(
+            self.service, ["ok", "broken", "hanging"], timeout=0.1
+        )
+
+        results = await sut.poll_all()
+
+        self.assertTrue(results["ok"].ok)
+        self.assertIsInstance(results["broken"].error, ValueError)
+        self.assertIsInstance(results["hanging"].error, TimeoutError)
+
+    async def test_results_are_yielded_as_completed(self):
+        """fast devices are reported before slow ones"""
+
+        async def get_properties(dsn):
+            await asyncio.sleep(0.05 if dsn == "slow" else 0)
+            return []
+
+        self.service.get_properties = get_properties
+        sut = FleetPoller(self.service, ["slow", "fast"])
+
+        order = [result.dsn async for result in sut.poll()]
+
+        self.assertEqual(order, ["fast", "slow"])
+
+
+class FleetTestcase(unittest.IsolatedAsyncioTestCase):
+    """Tests for updating a fleet of Oekoboilers"""
+
+    async def test_fleet_update(self):
+        """boilers of the fleet get their properties"""
+
+        async with MockAylaServer(
+            utils.mocked_water_heater_properties(22, 60, 4, 1)
+        ) as server:
+            async with AylaService(
+                utils.mocked_credentials(),
+                host=server.user_host,
+                ads_host=server.ads_host,
+            ) as service:
+                sut = Fleet(service, ["dsn1", "dsn2"])
+                errors = await sut.async_update()
+
+        self.assertEqual(errors, {})
+        self.assertEqual(len(sut), 2)
+        for boiler in sut:
+            self.assertEqual(boiler.temp_c_current, 22)
+            self.assertEqual(boiler.temp_c_set, 60)
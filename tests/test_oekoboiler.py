@@ -1,8 +1,15 @@
+import asyncio
+import time
 import unittest
+from datetime import timedelta
 from unittest.mock import AsyncMock, MagicMock
 
 from oekoboilerapi.aylaservice import AylaService
-from oekoboilerapi.oekoboiler import Oekoboiler
+from oekoboilerapi.oekoboiler import (
+    BoilerSnapshot,
+    DeviceRegistry,
+    Oekoboiler,
+)
 from tests import utils
 
 
@@ -29,3 +36,283 @@ class OekoboilerTestcase(unittest.IsolatedAsyncioTestCase):
         await sut.async_update()
         self.assertEqual(sut.temp_c_current, c_temp)
         self.assertEqual(sut.temp_c_set, set_temp)
+
+    async def test_update_selected_properties(self):
+        """only the requested properties are replaced"""
+
+        ayla_service = AylaService(MagicMock())
+        ayla_service.request = AsyncMock(
+            return_value=utils.mocked_water_heater_properties(22, 60, 4, 1)
+        )
+        sut = Oekoboiler(ayla_service, "device_id")
+        await sut.async_update()
+
+        ayla_service.request.return_value = [
+            prop
+            for prop in utils.mocked_water_heater_properties(35, 99, 4, 1)
+            if prop["property"]["name"] == "F103"
+        ]
+        sut.last_update = None
+        await sut.async_update(names=["F103"])
+
+        ayla_service.request.assert_awaited_with(
+            "https://ads-eu.aylanetworks.com/apiv1/dsns/device_id/properties",
+            params=[("names[]", "F103")],
+            dsn="device_id",
+        )
+        self.assertEqual(sut.temp_c_current, 35)
+        self.assertEqual(sut.temp_c_set, 60)
+        self.assertEqual(len(sut.boiler_data), 63)
+
+    async def test_unchanged_poll_keeps_properties(self):
+        """a poll without changes reuses the properties of the last one"""
+
+        ayla_service = AylaService(MagicMock())
+        ayla_service.request = AsyncMock(
+            side_effect=lambda *args, **kwargs: (
+                utils.mocked_water_heater_properties(22, 60, 4, 1)
+            )
+        )
+        sut = Oekoboiler(ayla_service, "device_id")
+
+        await sut.async_update()
+        props = sut.boiler_data
+        sut.last_update = None
+        await sut.async_update()
+
+        self.assertEqual(ayla_service.request.await_count, 2)
+        self.assertIs(sut.boiler_data, props)
+
+    async def test_set_values(self):
+        """several properties are written in one call"""
+
+        ayla_service = AylaService(MagicMock())
+        ayla_service.update_properties = AsyncMock(return_value={})
+        sut = Oekoboiler(ayla_service, "device_id")
+
+        await sut.set_values({"F11": 55, "F12": 4, "F107": "13:00-18:50"})
+
+        ayla_service.update_properties.assert_awaited_once_with(
+            "device_id", {"F11": 55, "F12": 4, "F107": "13:00-18:50"}
+        )
+        self.assertIsNone(sut.last_update)
+
+
+class OekoboilerStaleWhileRevalidateTestcase(unittest.IsolatedAsyncioTestCase):
+    """Test serving stale data while refreshing in the background"""
+
+    def setUp(self):
+        self.fetched = asyncio.Event()
+        self.ayla_service = AylaService(MagicMock())
+        self.ayla_service.request = AsyncMock(
+            return_value=utils.mocked_water_heater_properties(22, 60, 4, 1)
+        )
+        self.sut = Oekoboiler(
+            self.ayla_service,
+            "device_id",
+            stale_while_revalidate=True,
+            max_staleness=timedelta(minutes=1),
+        )
+
+    async def slow_request(self, *_args, **_kwargs):
+        """answers with new values once fetched is set"""
+        await self.fetched.wait()
+        return utils.mocked_water_heater_properties(30, 60, 4, 1)
+
+    async def test_first_update_blocks(self):
+        """without data callers have to wait"""
+
+        await self.sut.async_update()
+        self.assertEqual(self.sut.temp_c_current, 22)
+        self.assertLess(self.sut.snapshot.age, timedelta(seconds=1))
+
+    async def test_stale_data_is_served_while_refreshing(self):
+        """stale snapshot is returned right away and swapped later"""
+
+        await self.sut.async_update()
+        old_snapshot = self.sut.snapshot
+        self.ayla_service.request.side_effect = self.slow_request
+        self.sut.last_update = None
+
+        await self.sut.async_update()
+        self.assertIs(self.sut.snapshot, old_snapshot)
+        self.assertEqual(self.sut.temp_c_current, 22)
+
+        self.fetched.set()
+        await self.sut.state.refresh_task
+        self.assertIsNot(self.sut.snapshot, old_snapshot)
+        self.assertEqual(self.sut.temp_c_current, 30)
+        self.assertEqual(self.ayla_service.request.await_count, 2)
+
+    async def test_too_stale_data_blocks(self):
+        """snapshots older than max_staleness are not served"""
+
+        await self.sut.async_update()
+        self.sut.snapshot = BoilerSnapshot(
+            self.sut.snapshot.properties, time.monotonic() - 120
+        )
+        self.sut.last_update = None
+        self.ayla_service.request.return_value = (
+            utils.mocked_water_heater_properties(30, 60, 4, 1)
+        )
+
+        await self.sut.async_update()
+        self.assertEqual(self.sut.temp_c_current, 30)
+
+
+class OekoboilerCoalescingTestcase(unittest.IsolatedAsyncioTestCase):
+    """Test sharing fetches between concurrent callers"""
+
+    def setUp(self):
+        self.ayla_service = AylaService(MagicMock())
+        self.ayla_service.request = AsyncMock(side_effect=self.slow_request)
+
+    async def slow_request(self, *_args, params=None, **_kwargs):
+        """answers after a short delay (filtered by names[] params)"""
+        await asyncio.sleep(0.01)
+        props = utils.mocked_water_heater_properties(22, 60, 4, 1)
+        if params:
+            names = {name for _, name in params}
+            props = [
+                prop for prop in props if prop["property"]["name"] in names
+            ]
+        return props
+
+    async def test_concurrent_updates_share_one_fetch(self):
+        """concurrent callers on one boiler await the same fetch"""
+
+        sut = Oekoboiler(self.ayla_service, "device_id")
+
+        await asyncio.gather(*(sut.async_update() for _ in range(20)))
+
+        self.assertEqual(self.ayla_service.request.await_count, 1)
+        self.assertEqual(sut.temp_c_current, 22)
+
+    async def test_filtered_fetch_does_not_serve_full_update(self):
+        """a full update does not join a running filtered fetch"""
+
+        sut = Oekoboiler(self.ayla_service, "device_id")
+
+        await asyncio.gather(
+            sut.async_update(names=["F103"]),
+            sut.async_update(),
+            sut.async_update(names=["F11"]),
+        )
+
+        self.assertEqual(self.ayla_service.request.await_count, 2)
+        self.assertEqual(len(sut.boiler_data), 63)
+        self.assertEqual(sut.temp_c_set, 60)
+
+    async def test_full_fetch_serves_filtered_update(self):
+        """a filtered update joins a running full fetch"""
+
+        status_only = Oekoboiler(
+            self.ayla_service, "device_id", status_only=True
+        )
+        full = Oekoboiler(self.ayla_service, "device_id")
+
+        await asyncio.gather(
+            full.async_update(),
+            status_only.async_update(),
+            full.async_update(names=["F103", "F11"]),
+        )
+
+        self.assertEqual(self.ayla_service.request.await_count, 1)
+        self.assertEqual(len(status_only.boiler_data), 63)
+
+    async def test_boilers_with_same_dsn_share_state(self):
+        """boilers for one dsn share snapshot and in-flight fetch"""
+
+        dashboard = Oekoboiler(self.ayla_service, "device_id")
+        exporter = Oekoboiler(self.ayla_service, "device_id")
+        other = Oekoboiler(self.ayla_service, "other_device_id")
+
+        await asyncio.gather(
+            dashboard.async_update(),
+            exporter.async_update(),
+            dashboard.async_update(),
+        )
+
+        self.assertIs(dashboard.state, exporter.state)
+        self.assertIsNot(dashboard.state, other.state)
+        self.assertEqual(self.ayla_service.request.await_count, 1)
+        self.assertEqual(exporter.temp_c_current, 22)
+        self.assertIsNone(other.snapshot)
+
+    async def test_registry_is_per_service(self):
+        """boilers of different accounts do not share state"""
+
+        first = Oekoboiler(self.ayla_service, "device_id")
+        second = Oekoboiler(AylaService(MagicMock()), "device_id")
+        own_registry = Oekoboiler(
+            self.ayla_service, "device_id", registry=DeviceRegistry()
+        )
+
+        self.assertIsNot(first.state, second.state)
+        self.assertIsNot(first.state, own_registry.state)
+
+
+class OekoboilerReadYourWritesTestcase(unittest.IsolatedAsyncioTestCase):
+    """Test patching written values into the snapshot"""
+
+    async def asyncSetUp(self):
+        self.ayla_service = AylaService(MagicMock())
+        self.ayla_service.request = AsyncMock(
+            return_value=utils.mocked_water_heater_properties(22, 60, 4, 1)
+        )
+        self.ayla_service.update_property = AsyncMock(return_value=True)
+        self.sut = Oekoboiler(self.ayla_service, "device_id")
+        await self.sut.async_update()
+
+    async def poll(self, set_temp: int):
+        """forced update answered with the given set temperature"""
+        self.ayla_service.request.return_value = (
+            utils.mocked_water_heater_properties(22, set_temp, 4, 1)
+        )
+        self.sut.last_update = None
+        await self.sut.async_update()
+
+    async def test_write_is_visible_without_refetch(self):
+        """written value is served as pending right away"""
+
+        self.assertTrue(await self.sut.set_target_temp(55))
+
+        self.ayla_service.update_property.assert_awaited_once_with(
+            588326021, 55
+        )
+        await self.sut.async_update()
+        self.ayla_service.request.assert_awaited_once()
+        self.assertEqual(self.sut.temp_c_set, 55)
+        self.assertTrue(self.sut.boiler_data.by_name("F11").pending)
+
+    async def test_poll_confirms_pending_value(self):
+        """pending is kept until a poll reports the written value"""
+
+        await self.sut.set_target_temp(55)
+
+        await self.poll(60)
+        self.assertEqual(self.sut.temp_c_set, 55)
+        self.assertTrue(self.sut.boiler_data.by_name("F11").pending)
+
+        await self.poll(55)
+        self.assertEqual(self.sut.temp_c_set, 55)
+        self.assertFalse(self.sut.boiler_data.by_name("F11").pending)
+        self.assertEqual(self.sut.state.pending_writes, {})
+
+    async def test_unconfirmed_write_expires(self):
+        """polled value wins once the pending timeout passed"""
+
+        self.sut.pending_timeout = timedelta()
+        await self.sut.set_target_temp(55)
+
+        await self.poll(60)
+        self.assertEqual(self.sut.temp_c_set, 60)
+        self.assertFalse(self.sut.boiler_data.by_name("F11").pending)
+
+    async def test_failed_write_is_not_patched(self):
+        """rejected writes do not change the snapshot"""
+
+        self.ayla_service.update_property.return_value = False
+
+        self.assertFalse(await self.sut.set_target_temp(55))
+        self.assertEqual(self.sut.temp_c_set, 60)
@@ -0,0 +1,98 @@
+import unittest
+from datetime import timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+from oekoboilerapi.aylaservice import AylaService
+from oekoboilerapi.oekoboiler import Oekoboiler
+from oekoboilerapi.priorities import COLD, HOT, WARM, PollPriorities
+from tests import utils
+
+
+class PollPrioritiesTestcase(unittest.TestCase):
+    """Tests for due properties by priority class"""
+
+    def setUp(self):
+        self.sut = PollPriorities(
+            {"F103": HOT, "F104": HOT, "F11": WARM, "F107": COLD},
+            intervals={HOT: timedelta(seconds=10)},
+        )
+
+    def test_first_poll_is_full(self):
+        """nothing was polled yet, so everything is fetched"""
+        self.assertIsNone(self.sut.due(0))
+
+    def test_classes_are_due_by_interval(self):
+        """hot and warm properties are fetched filtered when due"""
+
+        self.sut.polled(None, 0)
+
+        self.assertEqual(self.sut.due(5), [])
+        self.assertEqual(self.sut.due(10), ["F103", "F104"])
+        self.sut.polled(["F103", "F104"], 10)
+        self.assertEqual(self.sut.due(15), [])
+        self.assertEqual(self.sut.due(300), ["F103", "F104", "F11"])
+        self.sut.polled(["F103", "F104", "F11"], 300)
+        self.assertIsNone(self.sut.due(3600))
+
+    def test_unknown_priority(self):
+        """every priority needs an interval"""
+        with self.assertRaises(ValueError):
+            PollPriorities({"F103": "urgent"})
+
+
+class OekoboilerPrioritiesTestcase(unittest.IsolatedAsyncioTestCase):
+    """Tests for boilers polled by property priorities"""
+
+    async def test_hot_properties_are_fetched_filtered(self):
+        """after the full fetch only due properties are requested"""
+
+        ayla_service = AylaService(MagicMock())
+        ayla_service.request = AsyncMock(
+            return_value=utils.mocked_water_heater_properties(22, 60, 4, 1)
+        )
+        priorities = PollPriorities(
+            {"F103": HOT}, intervals={HOT: timedelta()}
+        )
+        sut = Oekoboiler(ayla_service, "device_id", priorities=priorities)
+        sut.update_delay_min = timedelta()
+
+        await sut.async_update()
+        ayla_service.request.assert_awaited_with(
+            "https://ads-eu.aylanetworks.com/apiv1/dsns/device_id/properties",
+            params=None,
+            dsn="device_id",
+        )
+
+        ayla_service.request.return_value = [
+            prop
+            for prop in utils.mocked_water_heater_properties(35, 99, 4, 1)
+            if prop["property"]["name"] == "F103"
+        ]
+        await sut.async_update()
+
+        ayla_service.request.assert_awaited_with(
+            "https://ads-eu.aylanetworks.com/apiv1/dsns/device_id/properties",
+            params=[("names[]", "F103")],
+            dsn="device_id",
+        )
+        self.assertEqual(sut.temp_c_current, 35)
+        self.assertEqual(sut.temp_c_set, 60)
+
+    async def test_nothing_due(self):
+        """no request while no priority class is due"""
+
+        ayla_service = AylaService(MagicMock())
+        ayla_service.request = AsyncMock(
+            return_value=utils.mocked_water_heater_properties(22, 60, 4, 1)
+        )
+        sut = Oekoboiler(
+            ayla_service,
+            "device_id",
+            priorities=PollPriorities({"F103": HOT}),
+        )
+        sut.update_delay_min = timedelta()
+
+        await sut.async_update()
+        await sut.async_update()
+
+        self.assertEqual(ayla_service.request.await_count, 1)
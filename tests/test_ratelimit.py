@@ -0,0 +1,158 @@
+import asyncio
+import time
+import unittest
+
+from oekoboilerapi.aylaservice import AylaService, RequestFailedError
+from oekoboilerapi.fleet import FleetPoller
+from oekoboilerapi.ratelimit import RateLimiter, RateLimits, TokenBucket
+from oekoboilerapi.retry import NO_RETRY, RetryPolicy
+from tests import utils
+from tests.mock_server import MockAylaServer
+
+PROPERTIES_ROUTE = "/apiv1/dsns/{dsn}/properties"
+
+
+class TokenBucketTestcase(unittest.IsolatedAsyncioTestCase):
+    """Tests for the async token bucket"""
+
+    async def test_burst_then_rate(self):
+        """the burst is free, further tokens come at the rate"""
+
+        sut = TokenBucket(rate=20, capacity=2)
+
+        start = time.monotonic()
+        for _ in range(2):
+            await sut.acquire()
+        self.assertLess(time.monotonic() - start, 0.02)
+
+        for _ in range(3):
+            await sut.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.14)
+        self.assertEqual(sut.stats().acquired, 5)
+
+    async def test_queue_depth_and_order(self):
+        """waiters are counted and served in order"""
+
+        sut = TokenBucket(rate=50, capacity=1)
+        await sut.acquire()
+        served = []
+
+        async def waiter(i: int):
+            await sut.acquire()
+            served.append(i)
+
+        tasks = [asyncio.create_task(waiter(i)) for i in range(4)]
+        await asyncio.sleep(0)
+        self.assertEqual(sut.stats().waiting, 4)
+
+        await asyncio.gather(*tasks)
+
+        stats = sut.stats()
+        self.assertEqual(served, [0, 1, 2, 3])
+        self.assertEqual(stats.waiting, 0)
+        self.assertEqual(stats.max_waiting, 4)
+        self.assertGreater(stats.wait_time, 0)
+
+    async def test_pause(self):
+        """a paused bucket hands out nothing until the pause is over"""
+
+        sut = TokenBucket(rate=1000, capacity=10)
+        sut.pause(0.1)
+        self.assertGreaterEqual(sut.time_for(1), 0.09)
+
+        start = time.monotonic()
+        await sut.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_time_for(self):
+        """time needed for requests beyond the available tokens"""
+
+        sut = TokenBucket(rate=10, capacity=5)
+        self.assertEqual(sut.time_for(5), 0)
+        self.assertAlmostEqual(sut.time_for(25), 2, delta=0.01)
+
+
+class RateLimiterTestcase(unittest.IsolatedAsyncioTestCase):
+    """Tests for rate limited requests"""
+
+    async def asyncSetUp(self):
+        self.server = MockAylaServer()
+        await self.server.__aenter__()
+        self.addAsyncCleanup(self.server.__aexit__, None, None, None)
+
+    def create_service(self, retry: RetryPolicy = None, **limits):
+        service = AylaService(
+            utils.mocked_credentials(),
+            host=self.server.user_host,
+            ads_host=self.server.ads_host,
+            retry=retry,
+            rate_limiter=RateLimiter(RateLimits(**limits)),
+        )
+        self.addAsyncCleanup(service.close)
+        return service
+
+    def test_bucket_name(self):
+        """requests are budgeted by host and kind"""
+
+        self.assertEqual(RateLimiter.bucket_name(True, "POST"), "auth")
+        self.assertEqual(RateLimiter.bucket_name(False, "GET"), "read")
+        self.assertEqual(RateLimiter.bucket_name(False, "POST"), "write")
+
+    async def test_requests_use_their_bucket(self):
+        """reads, writes and auth are limited separately"""
+
+        sut = self.create_service(read_rate=20, read_burst=1)
+
+        start = time.monotonic()
+        await asyncio.gather(*(sut.get_properties("dsn") for _ in range(5)))
+        await sut.update_properties("dsn", {"F11": 50})
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+        stats = sut.rate_limiter.stats()
+        self.assertEqual(stats["auth"].acquired, 1)
+        self.assertEqual(stats["read"].acquired, 5)
+        self.assertEqual(stats["read"].max_waiting, 4)
+        self.assertEqual(stats["write"].acquired, 1)
+
+    async def test_throttling_pauses_bucket(self):
+        """a 429 stops all requests of its bucket for Retry-After"""
+
+        sut = self.create_service(retry=NO_RETRY)
+        self.server.inject(
+            PROPERTIES_ROUTE, status=429, headers={"Retry-After": "0.2"}
+        )
+
+        with self.assertRaises(RequestFailedError):
+            await sut.get_properties("dsn")
+        self.assertGreater(sut.rate_limiter.time_for("read", 1), 0.15)
+
+        start = time.monotonic()
+        await sut.get_properties("dsn")
+        self.assertGreater(time.monotonic() - start, 0.15)
+        self.assertEqual(self.server.calls[PROPERTIES_ROUTE], 2)
+
+    async def test_prepaid(self):
+        """a prepaid request does not take a second token"""
+
+        sut = self.create_service()
+        limiter = sut.rate_limiter
+        await sut.get_token()
+
+        await limiter.acquire("read")
+        with limiter.prepaid("read"):
+            await sut.get_properties("dsn")
+
+        self.assertEqual(limiter.stats()["read"].acquired, 1)
+
+    async def test_fleet_polls_within_quota(self):
+        """waiting for the budget does not time out devices"""
+
+        sut = self.create_service(read_rate=50, read_burst=1)
+        poller = FleetPoller(sut, [f"dsn{i}" for i in range(10)], timeout=0.1)
+        self.assertAlmostEqual(poller.poll_duration(), 0.18, delta=0.02)
+
+        start = time.monotonic()
+        results = await poller.poll_all()
+
+        self.assertTrue(all(result.ok for result in results.values()))
+        self.assertGreaterEqual(time.monotonic() - start, 0.17)
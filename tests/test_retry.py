@@ -0,0 +1,172 @@
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+from aiohttp import ClientConnectorError, ServerDisconnectedError
+
+from oekoboilerapi.aylaservice import AylaService, RequestFailedError
+from oekoboilerapi.retry import RetryPolicy, parse_retry_after
+from tests import utils
+from tests.mock_server import MockAylaServer
+
+PROPERTIES_ROUTE = "/apiv1/dsns/{dsn}/properties"
+DATAPOINT_ROUTE = "/apiv1/properties/{key}/datapoints"
+BATCH_ROUTE = "/apiv1/batch_datapoints.json"
+
+
+class RetryPolicyTestcase(unittest.TestCase):
+    """Tests for the retry decisions"""
+
+    def test_parse_retry_after(self):
+        """Retry-After as seconds or HTTP date"""
+
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertEqual(parse_retry_after("3"), 3.0)
+        self.assertEqual(parse_retry_after("-3"), 0.0)
+
+        date = datetime.now(timezone.utc) + timedelta(seconds=30)
+        self.assertAlmostEqual(
+            parse_retry_after(format_datetime(date, usegmt=True)), 30, delta=2
+        )
+
+    def test_backoff_is_bounded(self):
+        """jittered exponential backoff never exceeds its cap"""
+
+        sut = RetryPolicy(base_delay=1, max_delay=5)
+        for attempt, cap in [(1, 1), (2, 2), (3, 4), (4, 5), (10, 5)]:
+            for _ in range(20):
+                self.assertTrue(0 <= sut.backoff(attempt) <= cap)
+
+    def test_retry_delay(self):
+        """what is retried for reads and writes"""
+
+        sut = RetryPolicy(attempts=3)
+        refused = ClientConnectorError(None, OSError("refused"))
+
+        self.assertIsNotNone(sut.retry_delay(1, True, status=503))
+        self.assertIsNone(sut.retry_delay(3, True, status=503))
+        self.assertIsNone(sut.retry_delay(1, True, status=404))
+        self.assertIsNone(sut.retry_delay(1, False, status=503))
+        self.assertIsNotNone(sut.retry_delay(1, False, status=429))
+        self.assertIsNotNone(sut.retry_delay(1, False, exc=refused))
+        self.assertIsNone(
+            sut.retry_delay(1, False, exc=ServerDisconnectedError())
+        )
+        self.assertGreaterEqual(
+            sut.retry_delay(1, True, status=429, retry_after=7), 7
+        )
+        self.assertIsNotNone(
+            RetryPolicy(retry_writes=True).retry_delay(1, False, status=503)
+        )
+
+
+class AylaServiceRetryTestcase(unittest.IsolatedAsyncioTestCase):
+    """Tests for retried requests against a faulty server"""
+
+    async def asyncSetUp(self):
+        self.server = MockAylaServer()
+        await self.server.__aenter__()
+        self.addAsyncCleanup(self.server.__aexit__, None, None, None)
+
+    def create_service(self, **policy) -> AylaService:
+        policy.setdefault("base_delay", 0.01)
+        service = AylaService(
+            utils.mocked_credentials(),
+            host=self.server.user_host,
+            ads_host=self.server.ads_host,
+            retry=RetryPolicy(**policy),
+        )
+        self.addAsyncCleanup(service.close)
+        return service
+
+    async def test_reads_are_retried(self):
+        """server errors and dropped connections are retried for reads"""
+
+        sut = self.create_service(attempts=4)
+        self.server.inject(PROPERTIES_ROUTE, status=503, times=2)
+        self.server.inject(PROPERTIES_ROUTE, disconnect=True)
+
+        props = await sut.get_properties("dsn")
+
+        self.assertEqual(props.by_name("F103").value, 22)
+        self.assertEqual(self.server.calls[PROPERTIES_ROUTE], 4)
+
+    async def test_final_error_is_raised(self):
+        """an error status left after all attempts raises"""
+
+        sut = self.create_service(attempts=2)
+        self.server.inject(PROPERTIES_ROUTE, status=502, times=2)
+
+        with self.assertRaises(RequestFailedError) as ctx:
+            await sut.get_properties("dsn")
+
+        self.assertEqual(ctx.exception.http_status, 502)
+        self.assertEqual(ctx.exception.message, {"error": "injected"})
+        self.assertEqual(self.server.calls[PROPERTIES_ROUTE], 2)
+
+    async def test_retry_after_is_honoured(self):
+        """the delay requested by the server is waited"""
+
+        sut = self.create_service()
+        self.server.inject(
+            PROPERTIES_ROUTE, status=429, headers={"Retry-After": "0.3"}
+        )
+
+        start = time.monotonic()
+        await sut.get_properties("dsn")
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.3)
+        self.assertEqual(self.server.calls[PROPERTIES_ROUTE], 2)
+
+    async def test_deadline_budget(self):
+        """no retry waits beyond the deadline of the request"""
+
+        sut = self.create_service(deadline=1)
+        self.server.inject(
+            PROPERTIES_ROUTE, status=503, headers={"Retry-After": "5"}
+        )
+
+        start = time.monotonic()
+        with self.assertRaises(RequestFailedError):
+            await sut.get_properties("dsn")
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(self.server.calls[PROPERTIES_ROUTE], 1)
+
+    async def test_writes_are_not_repeated(self):
+        """datapoints are only resent if the server surely dropped them"""
+
+        sut = self.create_service()
+        self.server.inject(BATCH_ROUTE, status=500)
+
+        results = await sut.update_properties("dsn", {"F11": 55})
+
+        self.assertEqual(results["F11"].status, 500)
+        self.assertEqual(self.server.calls[BATCH_ROUTE], 1)
+
+        self.server.inject(DATAPOINT_ROUTE, status=429)
+        self.assertTrue(await sut.update_property("key", 55))
+        self.assertEqual(self.server.calls[DATAPOINT_ROUTE], 2)
+
+    async def test_retry_writes(self):
+        """writes are retried on server errors if configured"""
+
+        sut = self.create_service(retry_writes=True)
+        self.server.inject(BATCH_ROUTE, status=503)
+
+        results = await sut.update_properties("dsn", {"F11": 55})
+
+        self.assertTrue(results["F11"].ok)
+        self.assertEqual(self.server.datapoints, [("dsn", "F11", "55")])
+        self.assertEqual(self.server.calls[BATCH_ROUTE], 2)
+
+    async def test_login_is_retried(self):
+        """sign in is retried on server errors"""
+
+        sut = self.create_service()
+        self.server.inject("/users/sign_in.json", status=503)
+
+        self.assertEqual(await sut.get_token(), "token_1")
+        self.assertEqual(self.server.calls["/users/sign_in.json"], 2)
@@ -0,0 +1,134 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock
+
+from oekoboilerapi.aylaservice import AylaProperty, AylaService
+from oekoboilerapi.fleet import Fleet
+from oekoboilerapi.oekoboiler import Oekoboiler
+from oekoboilerapi.scheduler import (
+    AdaptiveInterval,
+    AdaptiveScheduler,
+    last_change,
+)
+from tests import utils
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+class AdaptiveIntervalTestcase(unittest.TestCase):
+    """Tests for the learned poll interval"""
+
+    def test_idle_device_backs_off(self):
+        """polls without changes double the interval up to the max"""
+
+        sut = AdaptiveInterval(min_interval=5, max_interval=60)
+        intervals = [sut.observe(START, now) for now in range(6)]
+
+        self.assertEqual(intervals, [5, 10, 20, 40, 60, 60])
+        self.assertEqual(sut.next_poll, 5 + 60)
+
+    def test_active_device_tightens(self):
+        """the device is polled twice per average change period"""
+
+        sut = AdaptiveInterval(min_interval=5, max_interval=600, alpha=0.5)
+        sut.observe(START, 0)
+        for _ in range(4):
+            sut.observe(None, 0)
+        self.assertEqual(sut.interval, 80)
+
+        self.assertEqual(sut.observe(START + timedelta(seconds=60), 0), 30)
+        self.assertEqual(sut.observe(START + timedelta(seconds=80), 0), 20)
+        self.assertEqual(sut.observe(START + timedelta(seconds=81), 0), 10.25)
+        self.assertEqual(sut.observe(START + timedelta(seconds=82), 0), 5.375)
+        self.assertEqual(sut.observe(START + timedelta(seconds=83), 0), 5)
+
+    def test_idle_device_becoming_active(self):
+        """the idle gap is not averaged in, the period is learned again"""
+
+        sut = AdaptiveInterval(min_interval=5, max_interval=600)
+        for minute in range(10):
+            sut.observe(START + timedelta(minutes=minute), minute * 60)
+        self.assertEqual(sut.interval, 30)
+
+        for now in range(600, 7200, 600):
+            sut.observe(START + timedelta(minutes=9), now)
+        self.assertEqual(sut.interval, 600)
+
+        # changes every minute from 7200s on
+        polls = [7200, 7205, 7215, 7235, 7275]
+        intervals = [
+            sut.observe(START + timedelta(seconds=now - now % 60), now)
+            for now in polls
+        ]
+        self.assertEqual(intervals, [5, 10, 20, 40, 30])
+        self.assertEqual(sut.period, 60)
+
+    def test_due(self):
+        """a device is due once its interval has passed"""
+
+        sut = AdaptiveInterval(min_interval=5)
+        self.assertTrue(sut.is_due(0))
+        sut.observe(START, 100)
+        self.assertFalse(sut.is_due(104))
+        self.assertTrue(sut.is_due(105))
+
+        sut.postpone(200)
+        self.assertFalse(sut.is_due(204))
+
+    def test_last_change(self):
+        """newest data_updated_at of the properties"""
+
+        props = [
+            AylaProperty("F1", 1, 1, START),
+            AylaProperty("F2", 2, 2, None),
+            AylaProperty("F3", 3, 3, START + timedelta(seconds=1)),
+        ]
+        self.assertEqual(last_change(props), START + timedelta(seconds=1))
+        self.assertIsNone(last_change([]))
+
+
+class AdaptivePollingTestcase(unittest.IsolatedAsyncioTestCase):
+    """Tests for boilers polled by the adaptive scheduler"""
+
+    def setUp(self):
+        self.service = AylaService(MagicMock())
+        self.service.get_token = AsyncMock(return_value="token")
+        self.service.get_properties = AsyncMock(
+            return_value=self.service.process_properties(
+                utils.mocked_water_heater_properties(22, 60, 4, 1)
+            )
+        )
+        self.scheduler = AdaptiveScheduler(min_interval=60)
+
+    async def test_boiler_polls_when_due(self):
+        """async_update fetches only when the scheduler says so"""
+
+        sut = Oekoboiler(self.service, "dsn", scheduler=self.scheduler)
+        sut.update_delay_min = timedelta()
+
+        await sut.async_update()
+        await sut.async_update()
+        self.assertEqual(self.service.get_properties.await_count, 1)
+
+        self.scheduler.interval("dsn").next_poll = 0
+        await sut.async_update()
+        self.assertEqual(self.service.get_properties.await_count, 2)
+
+    async def test_fleet_polls_due_devices(self):
+        """a fleet with a scheduler skips devices that are not due"""
+
+        sut = Fleet(self.service, ["a", "b", "c"], scheduler=self.scheduler)
+
+        self.assertEqual(await sut.async_update(), {})
+        self.assertEqual(self.service.get_properties.await_count, 3)
+        self.assertGreater(sut.next_update(), 50)
+
+        await sut.async_update()
+        self.assertEqual(self.service.get_properties.await_count, 3)
+
+        self.scheduler.interval("b").next_poll = 0
+        await sut.async_update()
+        self.assertEqual(self.service.get_properties.await_count, 4)
+        self.assertEqual(
+            self.service.get_properties.await_args.args, ("b",)
+        )
@@ -0,0 +1,116 @@
+import unittest
+from dataclasses import replace
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock
+
+from oekoboilerapi.aylaservice import AylaProperty, AylaService
+from oekoboilerapi.oekoboiler import Oekoboiler
+from oekoboilerapi.status import StatusDecoder, decode_status
+from tests import utils
+
+
+def _status_property(data_updated_at: datetime) -> AylaProperty:
+    """F100 of the mocked water heater"""
+    raw = next(
+        prop["property"]
+        for prop in utils.mocked_water_heater_properties(22, 60, 4, 1)
+        if prop["property"]["name"] == "F100"
+    )
+    return AylaProperty(
+        name="F100",
+        key=raw["key"],
+        value=raw["value"],
+        data_updated_at=data_updated_at,
+        base_type="string",
+    )
+
+
+class StatusDecoderTestcase(unittest.TestCase):
+    """Test decoding the F100 status blob"""
+
+    def setUp(self):
+        self.updated_at = datetime(2023, 6, 1, 18, 45, 53, tzinfo=timezone.utc)
+        self.prop = _status_property(self.updated_at)
+
+    def test_decode(self):
+        """known fields are typed, all others are kept raw"""
+
+        sut = decode_status(self.prop.value, self.updated_at)
+
+        self.assertEqual(sut.temp_c_set, 55)
+        self.assertEqual(sut.temp_c_delta, 3)
+        self.assertIs(sut.on_state, True)
+        self.assertEqual(
+            sut.schedule, ("13:00-18:50", "00:00-00:00", "00:00-00:00")
+        )
+        self.assertEqual(sut.clock, "22:05")
+        self.assertEqual(sut.get("F61"), "Yes")
+        self.assertEqual(sut.get("13"), -7)
+        self.assertIsNone(sut.get("F999"))
+        self.assertEqual(sut.updated_at, self.updated_at)
+
+    def test_duplicate_keys_last_wins(self):
+        """the blob reports 103 twice, the later value is the newer one"""
+
+        self.assertEqual(decode_status(self.prop.value).temp_c_current, 54)
+
+    def test_invalid_blob(self):
+        """blobs that are no JSON object are not decoded"""
+
+        self.assertIsNone(decode_status("{broken"))
+        self.assertIsNone(decode_status("[1, 2]"))
+        self.assertIsNone(decode_status(None))
+
+    def test_decoder_caches_by_timestamp(self):
+        """the blob is parsed again only if its timestamp changed"""
+
+        sut = StatusDecoder()
+        first = sut.decode(self.prop)
+
+        self.assertIs(sut.decode(_status_property(self.updated_at)), first)
+        self.assertIsNot(
+            sut.decode(_status_property(datetime.now(timezone.utc))), first
+        )
+        self.assertIsNone(sut.decode(None))
+
+    def test_decoder_decodes_new_value_with_same_timestamp(self):
+        """a patched value keeping its timestamp is parsed again"""
+
+        sut = StatusDecoder()
+        sut.decode(self.prop)
+        patched = replace(self.prop, value='{"103": 70}', pending=True)
+
+        self.assertEqual(sut.decode(patched).temp_c_current, 70)
+
+
+class OekoboilerStatusTestcase(unittest.IsolatedAsyncioTestCase):
+    """Test reading values from F100 only"""
+
+    async def test_status_only(self):
+        """boiler fetches F100 only and serves values from it"""
+
+        ayla_service = AylaService(MagicMock())
+        ayla_service.request = AsyncMock(
+            return_value=[
+                prop
+                for prop in utils.mocked_water_heater_properties(22, 60, 4, 1)
+                if prop["property"]["name"] == "F100"
+            ]
+        )
+        sut = Oekoboiler(ayla_service, "device_id", status_only=True)
+
+        await sut.async_update()
+
+        ayla_service.request.assert_awaited_once_with(
+            "https://ads-eu.aylanetworks.com/apiv1/dsns/device_id/properties",
+            params=[("names[]", "F100")],
+            dsn="device_id",
+        )
+        self.assertEqual(sut.temp_c_current, 54)
+        self.assertEqual(sut.temp_c_set, 55)
+        self.assertIs(sut.status.on_state, True)
+        with self.assertRaises(KeyError):
+            sut.get_value("F999")
+
+        sut.apply_datapoint("F100", '{"103": 70}')
+        self.assertEqual(sut.status.temp_c_current, 70)
@@ -0,0 +1,167 @@
+import multiprocessing
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+from aioresponses import aioresponses
+
+from oekoboilerapi.aylaservice import AccessToken, AylaService
+from oekoboilerapi.tokenstore import (
+    FileTokenStore,
+    MemoryTokenStore,
+    SqliteTokenStore,
+    TokenStore,
+)
+from tests import utils
+
+
+def _token(access_token: str, expires_in: int = 86400) -> AccessToken:
+    token = AccessToken(access_token, "refresh", expires_in, "EndUser", [], None)
+    token.activate()
+    return token
+
+
+def _increment(path: str, store_type: type, rounds: int):
+    """adds rounds to the counter kept in the token of key "counter" """
+    store = store_type(path)
+    for _ in range(rounds):
+        with store.lock("counter"):
+            token = store.load("counter")
+            value = int(token.access_token) if token else 0
+            store.save("counter", _token(str(value + 1)))
+
+
+class TokenStoreTestcase(unittest.TestCase):
+    """Tests for the token store implementations"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def stores(self):
+        """one instance of every store type"""
+        return [
+            MemoryTokenStore(),
+            FileTokenStore(os.path.join(self.tmp_dir.name, "tokens.json")),
+            SqliteTokenStore(os.path.join(self.tmp_dir.name, "tokens.db")),
+        ]
+
+    def test_save_and_load(self):
+        """tokens are restored with refresh token and expire date"""
+
+        for store in self.stores():
+            with self.subTest(store=type(store).__name__):
+                self.assertIsNone(store.load("key"))
+
+                token = _token("token")
+                with store.lock("key"):
+                    store.save("key", token)
+                restored = store.load("key")
+
+                self.assertEqual(restored, token)
+                self.assertFalse(restored.is_expired())
+                self.assertAlmostEqual(
+                    restored.expire_monotonic,
+                    token.expire_monotonic,
+                    delta=1,
+                )
+
+    def test_expired_token_is_restored_as_expired(self):
+        """the remaining lifetime is derived from the expire date"""
+
+        for store in self.stores():
+            with self.subTest(store=type(store).__name__):
+                token = _token("token", expires_in=3600)
+                token.expire_date = datetime.now() - timedelta(minutes=1)
+                store.save("key", token)
+                self.assertTrue(store.load("key").is_expired())
+
+    def test_incomplete_store_is_refused(self):
+        """a store without load/save can not be created"""
+
+        class LoadOnlyStore(TokenStore):
+            def load(self, key: str):
+                return None
+
+        with self.assertRaises(TypeError):
+            LoadOnlyStore()
+
+    def test_file_stores_lock_across_processes(self):
+        """concurrent processes do not overwrite each others tokens"""
+
+        context = multiprocessing.get_context("spawn")
+        for store_type, name in (
+            (FileTokenStore, "tokens.json"),
+            (SqliteTokenStore, "tokens.db"),
+        ):
+            with self.subTest(store=store_type.__name__):
+                path = os.path.join(self.tmp_dir.name, name)
+                store_type(path)
+                processes = [
+                    context.Process(
+                        target=_increment, args=(path, store_type, 20)
+                    )
+                    for _ in range(4)
+                ]
+                for process in processes:
+                    process.start()
+                for process in processes:
+                    process.join()
+
+                self.assertEqual(
+                    store_type(path).load("counter").access_token, "80"
+                )
+
+
+class AylaServiceTokenStoreTestcase(unittest.IsolatedAsyncioTestCase):
+    """Tests for restoring tokens in AylaService"""
+
+    @aioresponses()
+    async def test_valid_token_skips_sign_in(self, mocked: aioresponses):
+        """second service restores the token of the first one"""
+
+        mocked.post(
+            url="https://user-field-eu.aylanetworks.com/users/sign_in.json",
+            status=200,
+            payload=utils.mocked_login_answer("token", "refresh"),
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = FileTokenStore(os.path.join(tmp_dir, "tokens.json"))
+
+            async with AylaService(
+                utils.mocked_credentials(), token_store=store
+            ) as first:
+                self.assertEqual(await first.get_token(), "token")
+
+            async with AylaService(
+                utils.mocked_credentials(), token_store=store
+            ) as second:
+                self.assertEqual(await second.get_token(), "token")
+                self.assertEqual(second.access_token.refresh_token, "refresh")
+                self.assertEqual(second.token_renewals[-1].method, "store")
+
+        self.assertEqual(len(mocked.requests), 1)
+
+    @aioresponses()
+    async def test_expired_token_is_refreshed_and_saved(
+        self, mocked: aioresponses
+    ):
+        """an expired stored token is refreshed and written back"""
+
+        mocked.post(
+            url="https://user-field-eu.aylanetworks.com/users/refresh_token.json",
+            status=200,
+            payload=utils.mocked_login_answer("new_token", "new_refresh"),
+        )
+        store = MemoryTokenStore()
+        sut = AylaService(MagicMock(), token_store=store)
+        self.addAsyncCleanup(sut.close)
+        sut.access_token = _token("old_token", expires_in=0)
+        store.save(sut.token_store_key, sut.access_token)
+
+        self.assertEqual(await sut.get_token(), "new_token")
+        self.assertEqual(
+            store.load(sut.token_store_key).access_token, "new_token"
+        )
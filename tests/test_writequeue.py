@@ -0,0 +1,139 @@
+import asyncio
+import unittest
+from datetime import timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+from oekoboilerapi.aylaservice import AylaService, WriteResult
+from oekoboilerapi.oekoboiler import Oekoboiler
+from oekoboilerapi.writequeue import WriteQueue
+from tests import utils
+
+
+def _accept_all(dsn, values):
+    return {
+        name: WriteResult(dsn, name, value, 201)
+        for name, value in values.items()
+    }
+
+
+class WriteQueueTestcase(unittest.IsolatedAsyncioTestCase):
+    """Test debouncing of writes"""
+
+    def setUp(self):
+        self.service = AylaService(MagicMock())
+        self.service.update_properties = AsyncMock(side_effect=_accept_all)
+        self.current = {"F11": 60}
+        self.sut = WriteQueue(
+            self.service,
+            "dsn",
+            delay=0.01,
+            current_value=self.current.__getitem__,
+        )
+
+    async def test_burst_is_collapsed_to_last_value(self):
+        """only the last value per property is sent, in one request"""
+
+        futures = [self.sut.submit("F11", temp) for temp in (50, 51, 52)]
+        futures.append(self.sut.submit("F12", 4))
+        results = await asyncio.gather(*futures)
+
+        self.service.update_properties.assert_awaited_once_with(
+            "dsn", {"F11": 52, "F12": 4}
+        )
+        self.assertEqual([result.value for result in results], [52, 52, 52, 4])
+        self.assertTrue(all(result.ok for result in results))
+
+    async def test_write_of_current_value_is_dropped(self):
+        """writing the known value sends nothing"""
+
+        self.assertIsNone(await self.sut.submit("F11", 60))
+        self.service.update_properties.assert_not_awaited()
+
+    async def test_write_back_to_current_value_cancels_queued_write(self):
+        """a burst ending at the known value sends nothing"""
+
+        futures = [self.sut.submit("F11", temp) for temp in (50, 60)]
+        self.assertEqual(await asyncio.gather(*futures), [None, None])
+        await asyncio.sleep(0.02)
+        self.service.update_properties.assert_not_awaited()
+
+    async def test_flush_sends_right_away(self):
+        """flush does not wait for the delay"""
+
+        self.sut.delay = 10
+        future = self.sut.submit("F11", 50)
+        await self.sut.flush()
+
+        self.assertTrue(future.done())
+        self.assertEqual(len(self.sut), 0)
+
+    async def test_errors_are_passed_to_writers(self):
+        """a failed request fails all futures of the batch"""
+
+        self.service.update_properties.side_effect = ValueError("down")
+        future = self.sut.submit("F11", 50)
+
+        with self.assertRaises(ValueError):
+            await future
+
+
+class OekoboilerDebouncedWritesTestcase(unittest.IsolatedAsyncioTestCase):
+    """Test debounced set_target_temp"""
+
+    async def test_slider_burst(self):
+        """a burst of set_target_temp calls results in one write"""
+
+        ayla_service = AylaService(MagicMock())
+        ayla_service.request = AsyncMock(
+            return_value=utils.mocked_water_heater_properties(22, 60, 4, 1)
+        )
+        ayla_service.update_properties = AsyncMock(side_effect=_accept_all)
+        sut = Oekoboiler(
+            ayla_service, "device_id", write_delay=timedelta(milliseconds=10)
+        )
+        await sut.async_update()
+
+        results = await asyncio.gather(
+            *(sut.set_target_temp(temp) for temp in (55, 56.4, 57))
+        )
+
+        self.assertEqual(results, [True, True, True])
+        ayla_service.update_properties.assert_awaited_once_with(
+            "device_id", {"F11": 57}
+        )
+        self.assertEqual(sut.temp_c_set, 57)
+
+        self.assertTrue(await sut.set_target_temp(57))
+        ayla_service.update_properties.assert_awaited_once()
+        ayla_service.request.assert_awaited_once()
+
+    async def test_write_back_while_sending(self):
+        """a write back to the old value during a send is not dropped"""
+
+        ayla_service = AylaService(MagicMock())
+        ayla_service.request = AsyncMock(
+            return_value=utils.mocked_water_heater_properties(22, 50, 4, 1)
+        )
+        sending = asyncio.Event()
+
+        async def slow_accept(dsn, values):
+            sending.set()
+            await asyncio.sleep(0.05)
+            return _accept_all(dsn, values)
+
+        ayla_service.update_properties = AsyncMock(side_effect=slow_accept)
+        sut = Oekoboiler(
+            ayla_service, "device_id", write_delay=timedelta(milliseconds=10)
+        )
+        await sut.async_update()
+
+        first = asyncio.create_task(sut.set_target_temp(60))
+        await sending.wait()
+        results = await asyncio.gather(first, sut.set_target_temp(50))
+
+        self.assertEqual(results, [True, True])
+        sent = ayla_service.update_properties.await_args_list
+        self.assertEqual(
+            [call.args[1] for call in sent], [{"F11": 60}, {"F11": 50}]
+        )
+        self.assertEqual(sut.temp_c_set, 50)
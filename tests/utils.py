@@ -1,4 +1,13 @@
 """Utils for mocking and testing"""
+from oekoboilerapi.aylaservice import Credentials
+
+
+def mocked_credentials() -> Credentials:
+    """generates credentials for a test account"""
+
+    return Credentials(
+        email="test@example.com", password="secret", app_secret="app_secret"
+    )
 
 
 def mocked_login_answer(access_token: str, refresh_token: str) -> dict: